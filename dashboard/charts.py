@@ -0,0 +1,137 @@
+"""
+Shared cache of the rendered dashboard charts.
+
+The Plotly JSON built by ``generate_dashboard_charts`` is stored in the
+default cache together with the data version it was built from. Ingest,
+newly stored alerts and tank edits bump that version.
+
+An entry is served as is while it matches the current version and is
+younger than DASHBOARD_CHARTS_MAX_AGE seconds, or while it is younger than
+DASHBOARD_CHARTS_MIN_AGE whatever the version, so steady ingest costs at
+most one rebuild per MIN_AGE. A stale entry is rebuilt by the one worker
+that takes the rebuild lock (``cache.add``); the others keep serving the
+stale entry meanwhile. Only a cold cache makes requests wait for the
+rebuild, for at most DASHBOARD_CHARTS_LOCK_TIMEOUT seconds.
+
+Counters are kept per worker process.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tanks.models import WaterTank
+from tanks.signals import alerts_stored, readings_ingested
+
+logger = logging.getLogger(__name__)
+
+ENTRY_KEY = 'dashboard:charts'
+VERSION_KEY = 'dashboard:charts:version'
+LOCK_KEY = 'dashboard:charts:lock'
+# Stale entries are kept this long to be served while rebuilding
+ENTRY_TIMEOUT = 86400
+WAIT_STEP = 0.05
+
+_counters = Counter()
+_timings = {'rebuild_seconds_total': 0.0, 'rebuild_seconds_last': None}
+
+
+@receiver(readings_ingested, dispatch_uid='dashboard_charts_readings')
+@receiver(alerts_stored, dispatch_uid='dashboard_charts_alerts')
+@receiver(post_save, sender=WaterTank, dispatch_uid='dashboard_charts_tank_saved')
+@receiver(post_delete, sender=WaterTank, dispatch_uid='dashboard_charts_tank_deleted')
+def bump(**kwargs):
+    """Mark the cached charts out of date"""
+    try:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 1, None)
+    except Exception:
+        # Writers must not fail over the dashboard; the entry still expires by age
+        logger.warning('Could not bump the dashboard chart version', exc_info=True)
+
+
+def _rebuild(build, version):
+    started = time.perf_counter()
+    try:
+        charts = build()
+        cache.set(ENTRY_KEY, (version, time.time(), charts), ENTRY_TIMEOUT)
+    finally:
+        cache.delete(LOCK_KEY)
+    elapsed = time.perf_counter() - started
+    _counters['rebuilds'] += 1
+    _timings['rebuild_seconds_total'] += elapsed
+    _timings['rebuild_seconds_last'] = elapsed
+    logger.info('Dashboard charts rebuilt in %.3fs', elapsed)
+    return charts
+
+
+def get(build):
+    """The dashboard charts, from the cache or freshly made by ``build()``"""
+    try:
+        found = cache.get_many([ENTRY_KEY, VERSION_KEY])
+    except Exception:
+        logger.warning('Dashboard chart cache unavailable', exc_info=True)
+        _counters['errors'] += 1
+        return build()
+    entry, version = found.get(ENTRY_KEY), found.get(VERSION_KEY)
+
+    if entry is not None:
+        built_version, built_at, charts = entry
+        age = time.time() - built_at
+        if age < settings.DASHBOARD_CHARTS_MIN_AGE or (
+            built_version == version and age < settings.DASHBOARD_CHARTS_MAX_AGE
+        ):
+            _counters['hits'] += 1
+            return charts
+        if not cache.add(LOCK_KEY, 1, settings.DASHBOARD_CHARTS_LOCK_TIMEOUT):
+            _counters['stale_hits'] += 1
+            return charts
+        _counters['stale_rebuilds'] += 1
+        return _rebuild(build, version)
+
+    _counters['misses'] += 1
+    if cache.add(LOCK_KEY, 1, settings.DASHBOARD_CHARTS_LOCK_TIMEOUT):
+        return _rebuild(build, version)
+    # Another worker is building the first entry
+    deadline = time.monotonic() + settings.DASHBOARD_CHARTS_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(ENTRY_KEY)
+        if entry is not None:
+            _counters['waits'] += 1
+            return entry[2]
+    return _rebuild(build, version)
+
+
+def stats():
+    """Counters of this worker process and the state of the shared entry"""
+    lookups = _counters['hits'] + _counters['stale_hits'] + _counters['stale_rebuilds'] + _counters['misses']
+    entry, version = None, None
+    try:
+        found = cache.get_many([ENTRY_KEY, VERSION_KEY])
+        entry, version = found.get(ENTRY_KEY), found.get(VERSION_KEY)
+    except Exception:
+        pass
+    return {
+        'hits': _counters['hits'],
+        'stale_hits': _counters['stale_hits'],
+        'stale_rebuilds': _counters['stale_rebuilds'],
+        'misses': _counters['misses'],
+        'waits': _counters['waits'],
+        'errors': _counters['errors'],
+        'hit_rate': round((_counters['hits'] + _counters['stale_hits']) / lookups, 4) if lookups else None,
+        'rebuilds': _counters['rebuilds'],
+        'rebuild_seconds_total': round(_timings['rebuild_seconds_total'], 3),
+        'rebuild_seconds_last': (
+            round(_timings['rebuild_seconds_last'], 3) if _timings['rebuild_seconds_last'] is not None else None
+        ),
+        'version': version,
+        'entry_version': entry[0] if entry is not None else None,
+        'entry_age_seconds': round(time.time() - entry[1], 1) if entry is not None else None,
+    }
@@ -0,0 +1,67 @@
+"""
+Fleet counters shared by ``dashboard_home`` and ``dashboard_data_api``.
+
+``fleet_stats`` computes every counter the dashboard shows in two
+queries with conditional aggregation: one over WaterTank grouped by
+borough and status, with connected tanks counted through the
+latest-state join, and one over the active alerts. Totals and both
+breakdowns are summed from the grouped rows.
+
+The result is memoized per process for DASHBOARD_STATS_TTL seconds, so
+the polling endpoint hit by every open tab usually runs no counting
+query at all.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from tanks.models import Alert, TankLatestState, WaterTank
+
+_lock = threading.Lock()
+_memo = {'at': None, 'stats': None}
+
+
+def compute():
+    """Fresh fleet counters"""
+    connected_since = timezone.now() - TankLatestState.CONNECTED_WINDOW
+    groups = WaterTank.objects.order_by().values('borough', 'status').annotate(
+        count=Count('id'),
+        connected=Count('id', filter=Q(latest_state__timestamp__gt=connected_since)),
+    )
+    boroughs, statuses = Counter(), Counter()
+    total = active = connected = 0
+    for group in groups:
+        boroughs[group['borough']] += group['count']
+        statuses[group['status']] += group['count']
+        total += group['count']
+        connected += group['connected']
+        if group['status'] == 'active':
+            active += group['count']
+
+    alerts = Alert.objects.filter(status='active').aggregate(
+        active=Count('id'),
+        critical=Count('id', filter=Q(severity='critical')),
+    )
+    return {
+        'total_tanks': total,
+        'active_tanks': active,
+        'connected_tanks': connected,
+        'active_alerts': alerts['active'],
+        'critical_alerts': alerts['critical'],
+        'borough_data': [{'borough': borough, 'count': boroughs[borough]} for borough in sorted(boroughs)],
+        'status_data': [{'status': status, 'count': statuses[status]} for status in sorted(statuses)],
+    }
+
+
+def fleet_stats():
+    """Fleet counters, at most DASHBOARD_STATS_TTL seconds old"""
+    with _lock:
+        now = time.monotonic()
+        if _memo['at'] is None or now - _memo['at'] >= settings.DASHBOARD_STATS_TTL:
+            _memo['stats'] = compute()
+            _memo['at'] = now
+        return _memo['stats']
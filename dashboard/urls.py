@@ -11,5 +11,8 @@ urlpatterns = [
     path('tanks/<uuid:tank_id>/export/', views.export_tank_data, name='export_tank_data'),
     path('tanks/<uuid:tank_id>/chart-data/', views.tank_chart_data_api, name='tank_chart_data_api'),
     path('alerts/', views.alerts_view, name='alerts'),
+    path('alerts/acknowledge/', views.alerts_bulk_api, {'action': 'acknowledge'}, name='alerts_acknowledge'),
+    path('alerts/resolve/', views.alerts_bulk_api, {'action': 'resolve'}, name='alerts_resolve'),
     path('api/dashboard-data/', views.dashboard_data_api, name='dashboard_data_api'),
+    path('api/chart-cache-status/', views.chart_cache_status_api, name='chart_cache_status_api'),
 ] 
\ No newline at end of file
@@ -1,73 +1,89 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView
 from django.http import JsonResponse, HttpResponse
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.views.decorators.http import require_POST
 from django.db.models import Q, Count, Avg
 from django.utils import timezone
 from datetime import timedelta
+from urllib.parse import urlencode
 import json
 import csv
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.utils import PlotlyJSONEncoder
 import pandas as pd
+import numpy as np
+import base64
 
+from tanks import alerting, archive
 from tanks.models import WaterTank, SensorData, Alert
+from tanks.series import as_lists, downsample, fleet_rollups, present, reading_count, tank_columns, tank_series
+
+from . import charts as chart_cache
+from .stats import fleet_stats
+
+# Fields plotted on the tank detail page
+TANK_CHART_FIELDS = [
+    'water_level_percentage', 'water_temperature_f', 'ph_level', 'turbidity_ntu', 'signal_strength',
+]
+# Points per trace a chart API returns unless asked for max_points
+CHART_POINTS = 200
+# Bounds of a requested max_points (about one point per pixel of plot width)
+CHART_MIN_POINTS = 50
+CHART_MAX_POINTS = 4000
+# Points per trace on the tank detail page until the browser reports its plot width
+TANK_CHART_POINTS = 800
+# Longest range a chart API serves
+CHART_MAX_HOURS = 366 * 24
+# tank_chart_data_api response key -> SensorData field, in binary column order
+CHART_DATA_COLUMNS = {
+    'water_levels': 'water_level_percentage',
+    'temperatures': 'water_temperature_f',
+    'ph_levels': 'ph_level',
+    'signal_strength': 'signal_strength',
+}
+# Typed-array layouts of the compact chart data formats (little-endian)
+CHART_TIMESTAMP_DTYPE = np.dtype('<i8')
+CHART_VALUE_DTYPE = np.dtype('<f4')
+# Query parameters of the alerts page and their lookups
+ALERT_FILTERS = {
+    'status': 'status',
+    'severity': 'severity',
+    'tank': 'tank_id',
+    'alert_type': 'alert_type',
+}
+ALERTS_PER_PAGE = 50
+# Ids accepted by one bulk alert update
+ALERT_BULK_MAX_IDS = 10000
+# Columns of the CSV export, after the timestamp
+EXPORT_FIELDS = [
+    'water_level_percentage', 'water_level_inches', 'water_temperature_f', 'ph_level', 'turbidity_ntu',
+    'dissolved_oxygen_ppm', 'conductivity_us_cm', 'flow_rate_gpm', 'signal_strength',
+]
 
 
 @login_required
 def dashboard_home(request):
     """Main dashboard view with overview statistics"""
     
-    # Get basic statistics
-    total_tanks = WaterTank.objects.count()
-    active_tanks = WaterTank.objects.filter(status='active').count()
-    
-    # Get tanks with recent data (connected)
-    recent_threshold = timezone.now() - timedelta(minutes=30)
-    connected_tanks = WaterTank.objects.filter(
-        sensor_data__timestamp__gte=recent_threshold
-    ).distinct().count()
-    
-    # Get active alerts
-    active_alerts = Alert.objects.filter(status='active').count()
-    critical_alerts = Alert.objects.filter(
-        status='active', 
-        severity='critical'
-    ).count()
-    
-    # Get recent sensor data for charts
-    recent_data = SensorData.objects.filter(
-        timestamp__gte=timezone.now() - timedelta(hours=24)
-    ).select_related('tank')
-    
-    # Borough distribution
-    borough_data = WaterTank.objects.values('borough').annotate(
-        count=Count('id')
-    ).order_by('borough')
-    
-    # Tank status distribution
-    status_data = WaterTank.objects.values('status').annotate(
-        count=Count('id')
-    ).order_by('status')
+    # Counters shared with dashboard_data_api
+    stats = fleet_stats()
     
     # Recent alerts
     recent_alerts = Alert.objects.filter(
         created_at__gte=timezone.now() - timedelta(days=7)
     ).select_related('tank').order_by('-created_at')[:10]
     
-    # Generate charts
-    charts = generate_dashboard_charts()
+    # Generate charts, or reuse them from the shared cache
+    charts = chart_cache.get(generate_dashboard_charts)
     
     context = {
-        'total_tanks': total_tanks,
-        'active_tanks': active_tanks,
-        'connected_tanks': connected_tanks,
-        'active_alerts': active_alerts,
-        'critical_alerts': critical_alerts,
-        'borough_data': list(borough_data),
-        'status_data': list(status_data),
+        **stats,
         'recent_alerts': recent_alerts,
         'charts': charts,
     }
@@ -79,28 +95,16 @@ def generate_dashboard_charts():
     """Generate charts for dashboard"""
     charts = {}
     
-    # 1. Water Level Trends (Last 24 hours)
+    # 1. Water Level Trends (Last 24 hours), from hourly rollups
     last_24h = timezone.now() - timedelta(hours=24)
-    water_level_data = SensorData.objects.filter(
-        timestamp__gte=last_24h,
-        water_level_percentage__isnull=False
-    ).select_related('tank').order_by('timestamp')
-    
-    if water_level_data.exists():
-        # Group by tank
-        tank_data = {}
-        for reading in water_level_data:
-            tank_name = reading.tank.name
-            if tank_name not in tank_data:
-                tank_data[tank_name] = {'timestamps': [], 'levels': []}
-            tank_data[tank_name]['timestamps'].append(reading.timestamp)
-            tank_data[tank_name]['levels'].append(reading.water_level_percentage)
-        
+    tank_data = fleet_rollups('water_level_percentage', last_24h)
+    
+    if tank_data:
         fig = go.Figure()
-        for tank_name, data in tank_data.items():
+        for tank_name, (timestamps, levels, _) in tank_data.items():
             fig.add_trace(go.Scatter(
-                x=data['timestamps'],
-                y=data['levels'],
+                x=timestamps,
+                y=levels,
                 mode='lines+markers',
                 name=tank_name,
                 line=dict(width=2),
@@ -117,15 +121,18 @@ def generate_dashboard_charts():
         )
         charts['water_levels'] = json.dumps(fig, cls=PlotlyJSONEncoder)
     
-    # 2. Temperature Distribution
-    temp_data = SensorData.objects.filter(
-        timestamp__gte=last_24h,
-        water_temperature_f__isnull=False
-    ).values_list('water_temperature_f', flat=True)
+    # 2. Temperature Distribution: hourly means weighted by their reading counts
+    temp_data = fleet_rollups('water_temperature_f', last_24h)
     
     if temp_data:
+        temperatures, weights = [], []
+        for _, averages, counts in temp_data.values():
+            temperatures.extend(averages)
+            weights.extend(counts)
         fig = go.Figure(data=[go.Histogram(
-            x=list(temp_data),
+            x=temperatures,
+            y=weights,
+            histfunc='sum',
             nbinsx=20,
             marker_color='lightblue',
             opacity=0.7
@@ -187,6 +194,12 @@ def generate_dashboard_charts():
     return charts
 
 
+@staff_member_required
+def chart_cache_status_api(request):
+    """Hit, miss and rebuild counters of the dashboard chart cache for staff"""
+    return JsonResponse(chart_cache.stats())
+
+
 class TankListView(LoginRequiredMixin, ListView):
     """List view for all water tanks"""
     model = WaterTank
@@ -216,12 +229,13 @@ class TankListView(LoginRequiredMixin, ListView):
         if status:
             queryset = queryset.filter(status=status)
         
-        return queryset.order_by('name')
+        return queryset.select_related('latest_state').order_by('name')
 
 
 class TankDetailView(LoginRequiredMixin, DetailView):
     """Detail view for individual water tank"""
     model = WaterTank
+    queryset = WaterTank.objects.select_related('latest_state')
     template_name = 'dashboard/tank_detail.html'
     context_object_name = 'tank'
     
@@ -229,14 +243,10 @@ class TankDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         tank = self.object
         
-        # Get recent sensor data (last 7 days)
-        recent_data = SensorData.objects.filter(
-            tank=tank,
-            timestamp__gte=timezone.now() - timedelta(days=7)
-        ).order_by('-timestamp')
-        
-        # Get latest reading
-        latest_reading = recent_data.first()
+        # Get latest reading (last 7 days)
+        latest_reading = tank.latest_sensor_data
+        if latest_reading and latest_reading.timestamp < timezone.now() - timedelta(days=7):
+            latest_reading = None
         
         # Get active alerts
         active_alerts = Alert.objects.filter(
@@ -247,40 +257,49 @@ class TankDetailView(LoginRequiredMixin, DetailView):
         # Get sensors
         sensors = tank.sensors.all()
         
-        # Generate tank-specific charts
-        charts = generate_tank_charts(tank)
+        # Generate tank-specific charts, one point per pixel of the plot width the page last reported
+        max_points = chart_points(
+            self.request.GET.get('max_points') or self.request.COOKIES.get('chart_points'), TANK_CHART_POINTS
+        )
+        charts = generate_tank_charts(tank, max_points)
         
         context.update({
             'latest_reading': latest_reading,
             'active_alerts': active_alerts,
             'sensors': sensors,
-            'recent_data_count': recent_data.count(),
+            'recent_data_count': reading_count(tank.id, timezone.now() - timedelta(days=7)),
             'charts': charts,
         })
         
         return context
 
 
-def generate_tank_charts(tank):
-    """Generate charts for individual tank detail view"""
+def chart_points(value, default):
+    """A requested max_points clamped to the chart bounds, ``default`` when missing or invalid"""
+    try:
+        points = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(max(points, CHART_MIN_POINTS), CHART_MAX_POINTS)
+
+
+def generate_tank_charts(tank, max_points=TANK_CHART_POINTS):
+    """Generate charts for individual tank detail view, at most ``max_points`` per trace"""
     charts = {}
     
-    # Get data for last 7 days
-    last_7_days = timezone.now() - timedelta(days=7)
-    sensor_data = SensorData.objects.filter(
-        tank=tank,
-        timestamp__gte=last_7_days
-    ).order_by('timestamp')
+    # Last 7 days, from rollups once they hold enough points, thinned with LTTB
+    range_seconds = 7 * 86400
+    last_7_days = timezone.now() - timedelta(seconds=range_seconds)
+    series = tank_series(tank.id, TANK_CHART_FIELDS, last_7_days, step=range_seconds / max_points)
     
-    if not sensor_data.exists():
+    if not series['timestamps']:
         return charts
     
-    # Convert to lists for plotting
-    timestamps = [reading.timestamp for reading in sensor_data]
+    # Threshold lines follow the tank's alert rules
+    rules = alerting.rules_for(tank)
     
     # 1. Water Level Trend
-    water_levels = [reading.water_level_percentage for reading in sensor_data if reading.water_level_percentage is not None]
-    water_timestamps = [reading.timestamp for reading in sensor_data if reading.water_level_percentage is not None]
+    water_timestamps, water_levels = present(series, 'water_level_percentage', max_points)
     
     if water_levels:
         fig = go.Figure()
@@ -296,10 +315,14 @@ def generate_tank_charts(tank):
         ))
         
         # Add threshold lines
-        fig.add_hline(y=20, line_dash="dash", line_color="red", 
-                     annotation_text="Low Level Alert (20%)")
-        fig.add_hline(y=80, line_dash="dash", line_color="orange", 
-                     annotation_text="High Level Warning (80%)")
+        if 'low_level' in rules and rules['low_level'].low_threshold is not None:
+            low = rules['low_level'].low_threshold
+            fig.add_hline(y=low, line_dash="dash", line_color="red", 
+                         annotation_text=f"Low Level Alert ({low:g}%)")
+        if 'high_level' in rules and rules['high_level'].high_threshold is not None:
+            high = rules['high_level'].high_threshold
+            fig.add_hline(y=high, line_dash="dash", line_color="orange", 
+                         annotation_text=f"High Level Warning ({high:g}%)")
         
         fig.update_layout(
             title=f'Water Level Trend - {tank.name}',
@@ -311,8 +334,7 @@ def generate_tank_charts(tank):
         charts['water_level'] = json.dumps(fig, cls=PlotlyJSONEncoder)
     
     # 2. Temperature Trend
-    temperatures = [reading.water_temperature_f for reading in sensor_data if reading.water_temperature_f is not None]
-    temp_timestamps = [reading.timestamp for reading in sensor_data if reading.water_temperature_f is not None]
+    temp_timestamps, temperatures = present(series, 'water_temperature_f', max_points)
     
     if temperatures:
         fig = go.Figure()
@@ -334,8 +356,7 @@ def generate_tank_charts(tank):
         charts['temperature'] = json.dumps(fig, cls=PlotlyJSONEncoder)
     
     # 3. pH Level Trend
-    ph_levels = [reading.ph_level for reading in sensor_data if reading.ph_level is not None]
-    ph_timestamps = [reading.timestamp for reading in sensor_data if reading.ph_level is not None]
+    ph_timestamps, ph_levels = present(series, 'ph_level', max_points)
     
     if ph_levels:
         fig = go.Figure()
@@ -349,10 +370,13 @@ def generate_tank_charts(tank):
         ))
         
         # Add pH range indicators
-        fig.add_hline(y=6.5, line_dash="dash", line_color="orange", 
-                     annotation_text="Min Safe pH (6.5)")
-        fig.add_hline(y=8.5, line_dash="dash", line_color="orange", 
-                     annotation_text="Max Safe pH (8.5)")
+        ph_rule = rules.get('ph')
+        if ph_rule is not None and ph_rule.low_threshold is not None:
+            fig.add_hline(y=ph_rule.low_threshold, line_dash="dash", line_color="orange", 
+                         annotation_text=f"Min Safe pH ({ph_rule.low_threshold:g})")
+        if ph_rule is not None and ph_rule.high_threshold is not None:
+            fig.add_hline(y=ph_rule.high_threshold, line_dash="dash", line_color="orange", 
+                         annotation_text=f"Max Safe pH ({ph_rule.high_threshold:g})")
         
         fig.update_layout(
             title=f'pH Level Trend - {tank.name}',
@@ -377,8 +401,7 @@ def generate_tank_charts(tank):
             line=dict(color='#10B981')
         ))
     
-    turbidity_levels = [reading.turbidity_ntu for reading in sensor_data if reading.turbidity_ntu is not None]
-    turbidity_timestamps = [reading.timestamp for reading in sensor_data if reading.turbidity_ntu is not None]
+    turbidity_timestamps, turbidity_levels = present(series, 'turbidity_ntu', max_points)
     
     if turbidity_levels:
         fig.add_trace(go.Scatter(
@@ -411,8 +434,7 @@ def generate_tank_charts(tank):
     charts['multi_param'] = json.dumps(fig, cls=PlotlyJSONEncoder)
     
     # 5. Signal Strength and Battery Status
-    signal_data = [reading.signal_strength for reading in sensor_data if reading.signal_strength is not None]
-    signal_timestamps = [reading.timestamp for reading in sensor_data if reading.signal_strength is not None]
+    signal_timestamps, signal_data = present(series, 'signal_strength', max_points)
     
     if signal_data:
         fig = go.Figure()
@@ -445,7 +467,7 @@ def generate_tank_charts(tank):
 @login_required
 def tank_data_api(request, tank_id):
     """API endpoint for tank data (for AJAX updates)"""
-    tank = get_object_or_404(WaterTank, id=tank_id)
+    tank = get_object_or_404(WaterTank.objects.select_related('latest_state'), id=tank_id)
     latest_data = tank.latest_sensor_data
     
     if latest_data:
@@ -481,7 +503,7 @@ def export_tank_data(request, tank_id):
     sensor_data = SensorData.objects.filter(
         tank=tank,
         timestamp__gte=start_date
-    ).order_by('-timestamp')
+    ).order_by('-timestamp').values_list('timestamp', *EXPORT_FIELDS)
     
     # Create CSV response
     response = HttpResponse(content_type='text/csv')
@@ -495,81 +517,101 @@ def export_tank_data(request, tank_id):
         'Flow Rate (GPM)', 'Signal Strength (%)'
     ])
     
-    for data in sensor_data:
+    for timestamp, *values in sensor_data.iterator():
+        writer.writerow([timestamp.strftime('%Y-%m-%d %H:%M:%S'), *values])
+    
+    # Older months may have been moved to archive files
+    timestamps, archived = archive.load_rows(tank.id, start_date, timezone.now(), EXPORT_FIELDS)
+    for index in range(len(timestamps) - 1, -1, -1):
         writer.writerow([
-            data.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            data.water_level_percentage,
-            data.water_level_inches,
-            data.water_temperature_f,
-            data.ph_level,
-            data.turbidity_ntu,
-            data.dissolved_oxygen_ppm,
-            data.conductivity_us_cm,
-            data.flow_rate_gpm,
-            data.signal_strength,
+            timestamps[index].strftime('%Y-%m-%d %H:%M:%S'),
+            *(archived[field][index] for field in EXPORT_FIELDS),
         ])
     
     return response
 
 
+def _filter_alerts(alerts, params):
+    """Apply the alert page filters in ``params`` to ``alerts``"""
+    for name, lookup in ALERT_FILTERS.items():
+        value = params.get(name)
+        if value:
+            alerts = alerts.filter(**{lookup: value})
+    return alerts
+
+
 @login_required
 def alerts_view(request):
     """View for managing alerts"""
-    alerts = Alert.objects.all().select_related('tank', 'sensor')
-    
-    # Filter by status
-    status = request.GET.get('status')
-    if status:
-        alerts = alerts.filter(status=status)
-    
-    # Filter by severity
-    severity = request.GET.get('severity')
-    if severity:
-        alerts = alerts.filter(severity=severity)
-    
-    # Filter by tank
-    tank_id = request.GET.get('tank')
-    if tank_id:
-        alerts = alerts.filter(tank_id=tank_id)
-    
-    alerts = alerts.order_by('-created_at')
-    
+    alerts = _filter_alerts(Alert.objects.all(), request.GET)
+    alerts = alerts.select_related('tank', 'sensor', 'acknowledged_by', 'resolved_by').order_by('-created_at')
+    page_obj = Paginator(alerts, ALERTS_PER_PAGE).get_page(request.GET.get('page'))
+
+    start_of_day = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    counts = Alert.objects.aggregate(
+        critical=Count('id', filter=Q(status='active', severity='critical')),
+        high=Count('id', filter=Q(status='active', severity='high')),
+        medium=Count('id', filter=Q(status='active', severity='medium')),
+        resolved_today=Count('id', filter=Q(status='resolved', resolved_at__gte=start_of_day)),
+    )
+    current_filters = {name: request.GET.get(name, '') for name in ALERT_FILTERS}
+
     context = {
-        'alerts': alerts,
+        'alerts': page_obj,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+        'counts': counts,
         'tanks': WaterTank.objects.all().order_by('name'),
-        'current_filters': {
-            'status': status or '',
-            'severity': severity or '',
-            'tank': tank_id or '',
-        }
+        'current_filters': current_filters,
+        # Keeps the filters on the pagination links
+        'filter_query': urlencode({name: value for name, value in current_filters.items() if value}),
     }
     
     return render(request, 'dashboard/alerts.html', context)
 
 
+@login_required
+@require_POST
+def alerts_bulk_api(request, action):
+    """Acknowledge or resolve alerts by ``ids``, or all alerts matching the page filters, in one update"""
+    if not request.user.has_perm('tanks.change_alert'):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Body must be a JSON object'}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({'error': 'Body must be a JSON object'}, status=400)
+
+    ids = body.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list):
+            return JsonResponse({'error': 'ids must be a list'}, status=400)
+        if len(ids) > ALERT_BULK_MAX_IDS:
+            return JsonResponse({'error': f'At most {ALERT_BULK_MAX_IDS} ids per request'}, status=413)
+    elif not any(body.get(name) for name in ALERT_FILTERS):
+        return JsonResponse({'error': 'Pass ids or at least one filter'}, status=400)
+
+    update = alerting.acknowledge if action == 'acknowledge' else alerting.resolve
+    try:
+        if ids is not None:
+            alerts = Alert.objects.filter(id__in=ids)
+        else:
+            alerts = _filter_alerts(Alert.objects.all(), body)
+        updated = update(alerts, request.user)
+    except ValidationError as exc:
+        return JsonResponse({'error': exc.messages[0]}, status=400)
+    return JsonResponse({'updated': updated})
+
+
 @login_required
 def dashboard_data_api(request):
     """API endpoint for real-time dashboard updates"""
-    # Get basic statistics
-    total_tanks = WaterTank.objects.count()
-    active_tanks = WaterTank.objects.filter(status='active').count()
-    
-    # Get tanks with recent data (connected)
-    recent_threshold = timezone.now() - timedelta(minutes=30)
-    connected_tanks = WaterTank.objects.filter(
-        sensor_data__timestamp__gte=recent_threshold
-    ).distinct().count()
-    
-    # Get active alerts
-    active_alerts = Alert.objects.filter(status='active').count()
-    critical_alerts = Alert.objects.filter(
-        status='active', 
-        severity='critical'
-    ).count()
+    stats = fleet_stats()
     
     # Get recent sensor readings for live updates
     recent_readings = []
-    for tank in WaterTank.objects.filter(status='active')[:5]:
+    for tank in WaterTank.objects.filter(status='active').select_related('latest_state')[:5]:
         latest_data = tank.latest_sensor_data
         if latest_data:
             recent_readings.append({
@@ -584,7 +626,7 @@ def dashboard_data_api(request):
     
     # Get latest alerts
     latest_alerts = []
-    for alert in Alert.objects.filter(status='active').order_by('-created_at')[:5]:
+    for alert in Alert.objects.filter(status='active').select_related('tank').order_by('-created_at')[:5]:
         latest_alerts.append({
             'id': str(alert.id),
             'tank_name': alert.tank.name,
@@ -595,11 +637,8 @@ def dashboard_data_api(request):
     
     data = {
         'statistics': {
-            'total_tanks': total_tanks,
-            'active_tanks': active_tanks,
-            'connected_tanks': connected_tanks,
-            'active_alerts': active_alerts,
-            'critical_alerts': critical_alerts,
+            name: stats[name]
+            for name in ('total_tanks', 'active_tanks', 'connected_tanks', 'active_alerts', 'critical_alerts')
         },
         'recent_readings': recent_readings,
         'latest_alerts': latest_alerts,
@@ -609,28 +648,72 @@ def dashboard_data_api(request):
     return JsonResponse(data)
 
 
+def typed_columns(series):
+    """Epoch-millisecond timestamps and float32 chart columns, as raw little-endian bytes"""
+    stamps = (series['timestamps'] // 1000).astype(CHART_TIMESTAMP_DTYPE)
+    columns = {key: series[field].astype(CHART_VALUE_DTYPE) for key, field in CHART_DATA_COLUMNS.items()}
+    return stamps.tobytes(), {key: column.tobytes() for key, column in columns.items()}
+
+
 @login_required
 def tank_chart_data_api(request, tank_id):
-    """API endpoint for tank chart data updates"""
+    """API endpoint for tank chart data updates.
+
+    ``format=json`` (the default) returns aligned lists with null for
+    missing values. ``format=base64`` and ``format=binary`` return the same
+    series as typed arrays the front end can wrap without parsing: int64
+    epoch milliseconds, then one float32 column (NaN for missing) per key of
+    CHART_DATA_COLUMNS. Base64 puts each array in a JSON string; binary
+    sends them back to back as ``application/octet-stream``, with the
+    point count and column order in the X-Series-Count and
+    X-Series-Columns headers.
+    """
     tank = get_object_or_404(WaterTank, id=tank_id)
     
     # Get hours parameter (default 24)
-    hours = int(request.GET.get('hours', 24))
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        return JsonResponse({'error': 'hours must be a whole number'}, status=400)
+    hours = min(max(hours, 1), CHART_MAX_HOURS)
+    max_points = chart_points(request.GET.get('max_points'), CHART_POINTS)
+    response_format = request.GET.get('format', 'json')
+    if response_format not in ('json', 'base64', 'binary'):
+        return JsonResponse({'error': 'format must be json, base64 or binary'}, status=400)
     start_time = timezone.now() - timedelta(hours=hours)
     
-    # Get sensor data
-    sensor_data = SensorData.objects.filter(
-        tank=tank,
-        timestamp__gte=start_time
-    ).order_by('timestamp')
-    
-    # Prepare data for charts
+    # Rollups once they hold enough points for the budget, then LTTB down to it
+    fields = list(CHART_DATA_COLUMNS.values())
+    series = tank_columns(tank.id, fields, start_time, step=hours * 3600 / max_points)
+    series = downsample(series, fields, max_points)
+    count = len(series['timestamps'])
+
+    if response_format == 'binary':
+        stamps, columns = typed_columns(series)
+        response = HttpResponse(b''.join([stamps, *columns.values()]), content_type='application/octet-stream')
+        response['X-Series-Count'] = count
+        response['X-Series-Columns'] = ','.join(columns)
+        response['X-Series-Resolution'] = series['resolution']
+        return response
+
+    if response_format == 'base64':
+        stamps, columns = typed_columns(series)
+        chart_data = {
+            'resolution': series['resolution'],
+            'count': count,
+            'timestamp_dtype': 'int64',
+            'value_dtype': 'float32',
+            'timestamps': base64.b64encode(stamps).decode(),
+        }
+        chart_data.update({key: base64.b64encode(column).decode() for key, column in columns.items()})
+        return JsonResponse(chart_data)
+
+    # Prepare data for charts, every list aligned with the timestamps
+    lists = as_lists(series, fields)
     chart_data = {
-        'timestamps': [reading.timestamp.isoformat() for reading in sensor_data],
-        'water_levels': [reading.water_level_percentage for reading in sensor_data if reading.water_level_percentage is not None],
-        'temperatures': [reading.water_temperature_f for reading in sensor_data if reading.water_temperature_f is not None],
-        'ph_levels': [reading.ph_level for reading in sensor_data if reading.ph_level is not None],
-        'signal_strength': [reading.signal_strength for reading in sensor_data if reading.signal_strength is not None],
+        'resolution': series['resolution'],
+        'timestamps': [timestamp.isoformat() for timestamp in lists['timestamps']],
     }
+    chart_data.update({key: lists[field] for key, field in CHART_DATA_COLUMNS.items()})
     
     return JsonResponse(chart_data)
@@ -11,9 +11,10 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import dj_database_url
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -177,8 +178,91 @@ LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'dashboard:home'
 LOGOUT_REDIRECT_URL = 'accounts:login'
 
+# Sensor ingestion
+INGEST_API_TOKENS = config('INGEST_API_TOKENS', default='', cast=Csv())
+SENSOR_INGEST_CHUNK_SIZE = config('SENSOR_INGEST_CHUNK_SIZE', default=500, cast=int)
+SENSOR_INGEST_MAX_ROWS = config('SENSOR_INGEST_MAX_ROWS', default=5000, cast=int)
+SENSOR_INGEST_MAX_CLOCK_SKEW = config('SENSOR_INGEST_MAX_CLOCK_SKEW', default=300, cast=int)  # seconds
+SENSOR_DEDUP_CACHE_SIZE = config('SENSOR_DEDUP_CACHE_SIZE', default=200000, cast=int)  # recent reading keys per process
+
+# Write accepted readings to a local spool first; `replay_spool` drains it into the database
+SENSOR_SPOOL_ENABLED = config('SENSOR_SPOOL_ENABLED', default=False, cast=bool)
+SENSOR_SPOOL_DIR = config('SENSOR_SPOOL_DIR', default=str(BASE_DIR / 'spool'))
+SENSOR_SPOOL_SEGMENT_BYTES = config('SENSOR_SPOOL_SEGMENT_BYTES', default=64 * 1024 * 1024, cast=int)
+SENSOR_SPOOL_FSYNC_INTERVAL = config('SENSOR_SPOOL_FSYNC_INTERVAL', default=0.0, cast=float)  # seconds, 0 = every batch
+
+# Monthly SensorData partitions on PostgreSQL, maintained by `manage_partitions`
+SENSOR_PARTITION_MONTHS_AHEAD = config('SENSOR_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+SENSOR_DATA_RETENTION_MONTHS = config('SENSOR_DATA_RETENTION_MONTHS', default=0, cast=int)  # 0 = keep everything
+
+# Readings older than this move to per-tank monthly files via `archive_sensor_data`
+SENSOR_ARCHIVE_DIR = config('SENSOR_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+SENSOR_ARCHIVE_AFTER_DAYS = config('SENSOR_ARCHIVE_AFTER_DAYS', default=365, cast=int)
+SENSOR_ARCHIVE_COMPRESS = config('SENSOR_ARCHIVE_COMPRESS', default=False, cast=bool)
+
+# Recent raw readings shared by all processes on a host through a memory-mapped file
+SENSOR_RECENT_CACHE_ENABLED = config('SENSOR_RECENT_CACHE_ENABLED', default=True, cast=bool)
+SENSOR_RECENT_CACHE_PATH = config(
+    'SENSOR_RECENT_CACHE_PATH', default=os.path.join(tempfile.gettempdir(), 'smart-water-tanks-recent.bin')
+)
+SENSOR_RECENT_CACHE_TANKS = config('SENSOR_RECENT_CACHE_TANKS', default=512, cast=int)
+SENSOR_RECENT_CACHE_POINTS = config('SENSOR_RECENT_CACHE_POINTS', default=2048, cast=int)  # readings per tank; wider windows bypass the cache
+SENSOR_RECENT_CACHE_MAX_AGE = config('SENSOR_RECENT_CACHE_MAX_AGE', default=8 * 86400, cast=int)  # seconds, 7-day charts if POINTS holds a week
+SENSOR_RECENT_CACHE_TAIL_CHECK = config('SENSOR_RECENT_CACHE_TAIL_CHECK', default=15.0, cast=float)  # seconds
+SENSOR_RECENT_CACHE_RELOAD = config('SENSOR_RECENT_CACHE_RELOAD', default=3600.0, cast=float)  # seconds
+
+# Threshold alerts (AlertRule) evaluated on every ingested chunk
+SENSOR_ALERTS_ENABLED = config('SENSOR_ALERTS_ENABLED', default=True, cast=bool)
+SENSOR_ALERT_RULES_TTL = config('SENSOR_ALERT_RULES_TTL', default=60.0, cast=float)  # seconds between reloads
+SENSOR_ALERT_COALESCE_WINDOW = config('SENSOR_ALERT_COALESCE_WINDOW', default=3600, cast=int)  # seconds, 0 = never coalesce
+
+# Anomaly detection (data_anomaly alerts)
+SENSOR_ANOMALY_ENABLED = config('SENSOR_ANOMALY_ENABLED', default=True, cast=bool)
+SENSOR_ANOMALY_THRESHOLD = config('SENSOR_ANOMALY_THRESHOLD', default=4.0, cast=float)  # standard deviations
+SENSOR_ANOMALY_ALPHA = config('SENSOR_ANOMALY_ALPHA', default=0.02, cast=float)  # EW weight of a new reading
+SENSOR_ANOMALY_HOURLY_ALPHA = config('SENSOR_ANOMALY_HOURLY_ALPHA', default=0.1, cast=float)  # within its hour of day
+SENSOR_ANOMALY_MIN_SAMPLES = config('SENSOR_ANOMALY_MIN_SAMPLES', default=48, cast=int)  # readings before flagging
+SENSOR_ANOMALY_LEAK_STREAK = config('SENSOR_ANOMALY_LEAK_STREAK', default=3, cast=int)  # falling readings in a row
+
+# Offline detection (manage.py detect_offline)
+SENSOR_OFFLINE_AFTER = config('SENSOR_OFFLINE_AFTER', default=1800, cast=int)  # seconds without a reading
+SENSOR_OFFLINE_POLL = config('SENSOR_OFFLINE_POLL', default=1.0, cast=float)  # seconds between change polls
+SENSOR_OFFLINE_POLL_OVERLAP = config('SENSOR_OFFLINE_POLL_OVERLAP', default=2.0, cast=float)  # seconds, longest ingest transaction
+SENSOR_OFFLINE_RELOAD = config('SENSOR_OFFLINE_RELOAD', default=600.0, cast=float)  # seconds between full reloads
+
+# Alert notifications (manage.py dispatch_notifications)
+SENSOR_NOTIFY_INTERVAL = config('SENSOR_NOTIFY_INTERVAL', default=30.0, cast=float)  # seconds between passes
+SENSOR_NOTIFY_BATCH_SIZE = config('SENSOR_NOTIFY_BATCH_SIZE', default=5000, cast=int)  # alerts / messages per pass
+SENSOR_NOTIFY_DIGEST_AFTER = config('SENSOR_NOTIFY_DIGEST_AFTER', default=3, cast=int)  # above this, one digest per user and pass
+SENSOR_NOTIFY_MAX_ATTEMPTS = config('SENSOR_NOTIFY_MAX_ATTEMPTS', default=5, cast=int)
+SENSOR_NOTIFY_SMS_BACKEND = config('SENSOR_NOTIFY_SMS_BACKEND', default='tanks.notifications.LogSmsBackend')
+
+# Battery and maintenance forecasts (manage.py forecast_maintenance)
+SENSOR_BATTERY_CUTOFF = config('SENSOR_BATTERY_CUTOFF', default=3.3, cast=float)  # volts
+SENSOR_BATTERY_LEAD_DAYS = config('SENSOR_BATTERY_LEAD_DAYS', default=14, cast=int)  # alert this long before the cutoff
+SENSOR_BATTERY_WINDOW_DAYS = config('SENSOR_BATTERY_WINDOW_DAYS', default=14, cast=int)  # daily rollups fitted
+SENSOR_BATTERY_MIN_DAYS = config('SENSOR_BATTERY_MIN_DAYS', default=5, cast=int)  # days needed for a forecast
+SENSOR_BATTERY_REPLACED_JUMP = config('SENSOR_BATTERY_REPLACED_JUMP', default=0.2, cast=float)  # volts, daily rise
+SENSOR_BATTERY_LOW_LEVEL = config('SENSOR_BATTERY_LOW_LEVEL', default=20, cast=int)  # Sensor.battery_level percent
+SENSOR_MAINTENANCE_LEAD_DAYS = config('SENSOR_MAINTENANCE_LEAD_DAYS', default=7, cast=int)
+
+# Cache shared by the workers on a host; use Redis or Memcached to share it across hosts
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(tempfile.gettempdir(), 'smart-water-tanks-cache')),
+    }
+}
+
+# Dashboard chart cache, invalidated by ingest, new alerts and tank edits
+DASHBOARD_CHARTS_MIN_AGE = config('DASHBOARD_CHARTS_MIN_AGE', default=15.0, cast=float)  # seconds served regardless
+DASHBOARD_CHARTS_MAX_AGE = config('DASHBOARD_CHARTS_MAX_AGE', default=300.0, cast=float)  # seconds, even if unchanged
+DASHBOARD_CHARTS_LOCK_TIMEOUT = config('DASHBOARD_CHARTS_LOCK_TIMEOUT', default=30, cast=int)  # seconds
+DASHBOARD_STATS_TTL = config('DASHBOARD_STATS_TTL', default=5.0, cast=float)  # seconds fleet counters are reused per process
+
 # Email settings (for production)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='alerts@smart-water-tanks.local')
 
 # Security settings for production
 if not DEBUG:
@@ -24,6 +24,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('dashboard/', include('dashboard.urls')),
+    path('tanks/', include('tanks.urls')),
     path('', lambda request: redirect('dashboard:home')),
 ]
 
@@ -1,8 +1,13 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import WaterTank, Sensor, SensorData, Alert
+from . import alerting, calibration, validation
+from .models import (
+    WaterTank, Sensor, SensorData, SensorDataRollup, SensorDataArchive, TankLatestState,
+    CalibrationRun, SensorDataCorrection, Alert, AlertRule, AnomalyBaseline, Notification,
+)
 
 
 @admin.register(WaterTank)
@@ -61,6 +66,9 @@ class WaterTankAdmin(admin.ModelAdmin):
             )
         return format_html('<span style="color: gray;">No Data</span>')
     current_level_display.short_description = 'Current Level'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('latest_state')
 
 
 @admin.register(Sensor)
@@ -95,6 +103,17 @@ class SensorAdmin(admin.ModelAdmin):
             )
         return format_html('<span style="color: gray;">N/A</span>')
     battery_level_display.short_description = 'Battery Level'
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recalibrated = {'calibration_offset', 'last_calibration'} & set(form.changed_data)
+        if change and recalibrated and obj.sensor_type in calibration.CALIBRATED_FIELDS:
+            run = calibration.queue(obj)
+            self.message_user(
+                request,
+                f'Queued reprocessing of stored readings ({run.pk}); '
+                f'it is applied by manage.py reprocess_calibration.',
+            )
 
 
 @admin.register(SensorData)
@@ -105,7 +124,7 @@ class SensorDataAdmin(admin.ModelAdmin):
     ]
     list_filter = ['tank', 'is_valid', 'timestamp']
     search_fields = ['tank__name']
-    readonly_fields = ['id', 'created_at', 'water_temperature_c']
+    readonly_fields = ['id', 'created_at', 'water_temperature_c', 'quality_checks_display']
     date_hierarchy = 'timestamp'
     
     fieldsets = (
@@ -128,23 +147,137 @@ class SensorDataAdmin(admin.ModelAdmin):
             'fields': ('signal_strength', 'battery_voltage')
         }),
         ('Quality Control', {
-            'fields': ('quality_flags',)
+            'fields': ('quality_flags', 'quality_checks_display')
         })
     )
     
+    def quality_checks_display(self, obj):
+        failed = validation.describe(validation.stored_mask(obj.quality_flags))
+        return ', '.join(failed) if failed else 'passed'
+    quality_checks_display.short_description = 'Failed Checks'
+    
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('tank', 'sensor')
 
 
+@admin.register(SensorDataRollup)
+class SensorDataRollupAdmin(admin.ModelAdmin):
+    list_display = [
+        'tank', 'resolution', 'bucket_start', 'reading_count',
+        'level_min', 'level_max', 'level_last', 'updated_at'
+    ]
+    list_filter = ['resolution', 'tank']
+    search_fields = ['tank__name']
+    date_hierarchy = 'bucket_start'
+    
+    # Maintained from SensorData; edit readings and run rebuild_rollups instead
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tank')
+
+
+@admin.register(SensorDataArchive)
+class SensorDataArchiveAdmin(admin.ModelAdmin):
+    list_display = [
+        'tank', 'month', 'row_count', 'size_bytes', 'compressed',
+        'first_timestamp', 'last_timestamp', 'updated_at'
+    ]
+    list_filter = ['compressed', 'tank']
+    search_fields = ['tank__name', 'path']
+    date_hierarchy = 'month'
+    
+    # Catalog of files written by archive_sensor_data
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tank')
+
+
+@admin.register(TankLatestState)
+class TankLatestStateAdmin(admin.ModelAdmin):
+    list_display = ['tank', 'timestamp', 'water_level_percentage', 'signal_strength', 'battery_voltage', 'updated_at']
+    search_fields = ['tank__name']
+    date_hierarchy = 'timestamp'
+    
+    # Maintained by ingest from the newest reading of each tank
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tank')
+
+
+@admin.register(CalibrationRun)
+class CalibrationRunAdmin(admin.ModelAdmin):
+    list_display = [
+        'sensor', 'offset', 'since', 'status', 'progress_display',
+        'rows_changed', 'created_at', 'finished_at'
+    ]
+    list_filter = ['status']
+    search_fields = ['sensor__tank__name', 'sensor__serial_number']
+    date_hierarchy = 'created_at'
+    
+    # Queued by recalibrating a sensor, applied by reprocess_calibration
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def progress_display(self, obj):
+        return f'{obj.progress_percentage:.1f}% ({obj.rows_done:,}/{obj.rows_total:,})'
+    progress_display.short_description = 'Progress'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('sensor__tank')
+
+
+@admin.register(SensorDataCorrection)
+class SensorDataCorrectionAdmin(admin.ModelAdmin):
+    list_display = ['sensor', 'field', 'timestamp', 'original_value', 'applied_offset', 'run', 'updated_at']
+    list_filter = ['field']
+    search_fields = ['sensor__tank__name', 'reading_id']
+    date_hierarchy = 'timestamp'
+    
+    # Audit trail of calibration changes to readings
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('sensor__tank', 'run')
+
+
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
     list_display = [
-        'tank', 'alert_type', 'severity', 'status', 'title',
-        'created_at', 'acknowledged_by', 'resolved_by'
+        'tank', 'alert_type', 'severity', 'status', 'title', 'occurrences',
+        'created_at', 'last_seen_at', 'acknowledged_by', 'resolved_by'
     ]
     list_filter = ['alert_type', 'severity', 'status', 'created_at']
     search_fields = ['tank__name', 'title', 'message']
-    readonly_fields = ['id', 'created_at']
+    readonly_fields = ['id', 'occurrences', 'created_at', 'last_seen_at', 'notified_at']
+    actions = ['acknowledge_alerts', 'resolve_alerts']
     date_hierarchy = 'created_at'
     
     fieldsets = (
@@ -155,7 +288,7 @@ class AlertAdmin(admin.ModelAdmin):
             'fields': ('title', 'message', 'threshold_value', 'actual_value')
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'acknowledged_at', 'resolved_at')
+            'fields': ('created_at', 'occurrences', 'last_seen_at', 'notified_at', 'acknowledged_at', 'resolved_at')
         }),
         ('Actions', {
             'fields': ('acknowledged_by', 'resolved_by')
@@ -164,6 +297,90 @@ class AlertAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('tank', 'sensor', 'acknowledged_by', 'resolved_by')
+    
+    def acknowledge_alerts(self, request, queryset):
+        updated = alerting.acknowledge(queryset, request.user)
+        self.message_user(request, f'{updated} alerts acknowledged.')
+    acknowledge_alerts.short_description = 'Acknowledge selected alerts'
+    
+    def resolve_alerts(self, request, queryset):
+        updated = alerting.resolve(queryset, request.user)
+        self.message_user(request, f'{updated} alerts resolved.')
+    resolve_alerts.short_description = 'Resolve selected alerts'
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = [
+        'alert_type', 'scope', 'low_threshold', 'high_threshold', 'hysteresis',
+        'min_duration', 'cooldown', 'severity', 'enabled'
+    ]
+    list_filter = ['alert_type', 'tank_type', 'severity', 'enabled']
+    search_fields = ['tank__name']
+    readonly_fields = ['id', 'created_at', 'updated_at']
+    
+    fieldsets = (
+        ('Scope', {
+            'fields': ('id', 'alert_type', 'tank', 'tank_type', 'enabled')
+        }),
+        ('Thresholds', {
+            'fields': ('low_threshold', 'high_threshold', 'hysteresis', 'severity')
+        }),
+        ('Timing', {
+            'fields': ('min_duration', 'cooldown')
+        }),
+        ('Timestamps', {
+            'fields': ('created_at', 'updated_at')
+        })
+    )
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tank')
+
+
+@admin.register(AnomalyBaseline)
+class AnomalyBaselineAdmin(admin.ModelAdmin):
+    list_display = ['tank', 'metric', 'samples', 'mean', 'std_display', 'streak', 'last_timestamp', 'updated_at']
+    list_filter = ['metric']
+    search_fields = ['tank__name']
+    
+    # Learned by ingest; delete a baseline to make it start over
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def std_display(self, obj):
+        return f"{obj.variance ** 0.5:.3f}"
+    std_display.short_description = 'Std'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tank')
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'user', 'channel', 'recipient', 'is_digest', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['channel', 'status', 'is_digest', 'created_at']
+    search_fields = ['subject', 'recipient', 'user__username']
+    actions = ['retry_notifications']
+    date_hierarchy = 'created_at'
+    
+    # Written by dispatch_notifications; failed ones can be retried
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+    
+    def retry_notifications(self, request, queryset):
+        updated = queryset.filter(status='failed').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} notifications queued again.')
+    retry_notifications.short_description = "Retry failed notifications"
 
 
 # Customize admin site header
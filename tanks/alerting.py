@@ -0,0 +1,344 @@
+"""
+Threshold alerts evaluated as readings are ingested.
+
+Every committed ingest chunk is run through the AlertRule thresholds of
+its tanks in one pass. Per tank and alert type the engine remembers in
+memory when the current breach started, whether an alert is open and
+when the last one cleared, so each reading costs a few dict lookups:
+
+    hysteresis    an open alert only resolves once the value is back
+                  inside the thresholds by this margin
+    min_duration  the breach must last this long (in reading time)
+                  before an Alert is created
+    cooldown      no new alert of the same type for this long after
+                  the previous one resolved
+
+Open alerts are auto-resolved when the condition clears. Readings flagged
+invalid by the quality checks and readings older than one already
+evaluated are skipped.
+
+New alerts go through ``store``: an alert of the same tank, sensor and
+type seen within SENSOR_ALERT_COALESCE_WINDOW gets its occurrence count
+and last-seen time bumped, and is reopened, instead of a new row, so a
+flapping sensor leaves one row. ``acknowledge`` and ``resolve`` update
+any number of alerts in one statement.
+
+State is per process. Rules, tank types, open alerts and recent
+resolutions are reloaded every SENSOR_ALERT_RULES_TTL seconds, which also
+picks up alerts opened or closed by other workers. Alert creation checks
+for an open alert of the same type first, so two workers cannot raise
+the same alert twice.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Alert, AlertRule, WaterTank
+from .signals import alerts_stored, readings_ingested
+
+logger = logging.getLogger(__name__)
+
+OPEN = ('active', 'acknowledged')
+# Label and unit of the watched value, for alert messages
+LABELS = {
+    'low_level': ('Water level', '%'),
+    'high_level': ('Water level', '%'),
+    'temperature': ('Water temperature', '°F'),
+    'ph': ('pH', ''),
+    'turbidity': ('Turbidity', ' NTU'),
+}
+
+
+def effective_rules(rules, tank_id, tank_type):
+    """``{alert_type: rule}`` for one tank from a list of AlertRules, most specific first"""
+    chosen = {}
+    specificity = {}
+    for rule in rules:
+        if rule.tank_id is not None:
+            level = 2 if rule.tank_id == tank_id else None
+        elif rule.tank_type:
+            level = 1 if rule.tank_type == tank_type else None
+        else:
+            level = 0
+        if level is not None and level >= specificity.get(rule.alert_type, -1):
+            chosen[rule.alert_type] = rule
+            specificity[rule.alert_type] = level
+    return {alert_type: rule for alert_type, rule in chosen.items() if rule.enabled}
+
+
+def rules_for(tank):
+    """Effective enabled rules of ``tank`` straight from the database"""
+    rules = AlertRule.objects.filter(tank__isnull=True) | AlertRule.objects.filter(tank=tank)
+    return effective_rules(list(rules), tank.id, tank.tank_type)
+
+
+def _message(rule, value):
+    label, unit = LABELS[rule.alert_type]
+    below = rule.low_threshold is not None and value < rule.low_threshold
+    threshold = rule.low_threshold if below else rule.high_threshold
+    return threshold, (
+        f'{label} is {value:.1f}{unit}, {"below" if below else "above"} '
+        f'the {threshold:g}{unit} threshold.'
+    )
+
+
+def store(alerts, now=None):
+    """Insert ``alerts`` (unsaved Alerts), folding repeats into recent rows.
+
+    Returns ``{alert.id: row id}`` for the alerts that were counted on an
+    existing row instead of inserted.
+    """
+    if not alerts:
+        return {}
+    now = now or timezone.now()
+    window = timedelta(seconds=settings.SENSOR_ALERT_COALESCE_WINDOW)
+    rows = {}
+    if window:
+        recent_rows = Alert.objects.filter(
+            tank_id__in={alert.tank_id for alert in alerts},
+            alert_type__in={alert.alert_type for alert in alerts},
+            last_seen_at__gte=now - window,
+        ).exclude(status='dismissed').order_by('last_seen_at').values_list('tank_id', 'sensor_id', 'alert_type', 'id')
+        # Latest row per key wins
+        rows = {(tank_id, sensor_id, alert_type): row_id for tank_id, sensor_id, alert_type, row_id in recent_rows}
+
+    new = {}
+    folded = {}
+    for alert in alerts:
+        key = (alert.tank_id, alert.sensor_id, alert.alert_type)
+        row_id = rows.get(key)
+        if row_id is None:
+            alert.last_seen_at = now
+            rows[key] = alert.id
+            new[alert.id] = alert
+        elif row_id in new:
+            new[row_id].occurrences += 1
+            folded[alert.id] = row_id
+        else:
+            folded[alert.id] = row_id
+
+    Alert.objects.bulk_create(new.values())
+    if new:
+        inserted = list(new.values())
+        transaction.on_commit(lambda: alerts_stored.send(sender=Alert, alerts=inserted))
+    repeated = Counter(row_id for row_id in folded.values() if row_id not in new)
+    if repeated:
+        Alert.objects.filter(id__in=repeated, status='resolved').update(
+            status='active', resolved_at=None, resolved_by=None, notified_at=None,
+        )
+        by_count = defaultdict(list)
+        for row_id, count in repeated.items():
+            by_count[count].append(row_id)
+        for count, row_ids in by_count.items():
+            Alert.objects.filter(id__in=row_ids).update(occurrences=F('occurrences') + count, last_seen_at=now)
+    return folded
+
+
+def acknowledge(alerts, user):
+    """Acknowledge the active alerts of queryset ``alerts`` in one UPDATE, returning how many"""
+    return alerts.filter(status='active').update(
+        status='acknowledged', acknowledged_at=timezone.now(), acknowledged_by=user,
+    )
+
+
+def resolve(alerts, user):
+    """Resolve the open alerts of queryset ``alerts`` in one UPDATE, returning how many"""
+    resolved = alerts.filter(status__in=OPEN).update(status='resolved', resolved_at=timezone.now(), resolved_by=user)
+    if resolved and _engine is not None:
+        _engine.expire()
+    return resolved
+
+
+class AlertEngine:
+    """In-memory alert state for the tanks seen by this process"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._rules = []
+        self._tank_types = {}
+        self._tank_rules = {}
+        # Keyed by (tank_id, alert_type)
+        self._open = {}
+        self._cleared = {}
+        self._breach_since = {}
+        self._evaluated_to = {}
+        self.readings = 0
+        self.created = 0
+        self.coalesced = 0
+        self.resolved = 0
+
+    def expire(self):
+        """Reload rules and alert state before the next batch"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _load(self):
+        self._rules = list(AlertRule.objects.all())
+        self._tank_types = dict(WaterTank.objects.values_list('id', 'tank_type'))
+        self._tank_rules = {}
+        self._open = {
+            (tank_id, alert_type): alert_id
+            for alert_id, tank_id, alert_type in Alert.objects.filter(
+                status__in=OPEN, alert_type__in=AlertRule.FIELDS,
+            ).order_by('created_at').values_list('id', 'tank_id', 'alert_type')
+        }
+        longest = max((rule.cooldown for rule in self._rules), default=timedelta(0))
+        self._cleared = {
+            (row['tank_id'], row['alert_type']): row['last']
+            for row in Alert.objects.filter(
+                alert_type__in=AlertRule.FIELDS, resolved_at__gte=timezone.now() - longest,
+            ).values('tank_id', 'alert_type').annotate(last=Max('resolved_at'))
+        }
+        self._loaded_at = time.monotonic()
+
+    def _rules_of(self, tank_id):
+        rules = self._tank_rules.get(tank_id)
+        if rules is None:
+            rules = tuple(
+                (alert_type, rule.field, rule)
+                for alert_type, rule in effective_rules(self._rules, tank_id, self._tank_types.get(tank_id)).items()
+            )
+            self._tank_rules[tank_id] = rules
+        return rules
+
+    def evaluate(self, readings):
+        """Run ``readings`` (SensorData instances) through the rules.
+
+        Returns the alerts inserted and the ids of the alerts resolved;
+        repeats counted on an existing row are not returned.
+        """
+        created, resolved = [], []
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._load()
+            unknown = {reading.tank_id for reading in readings} - self._tank_types.keys()
+            if unknown:
+                self._tank_types.update(WaterTank.objects.filter(id__in=unknown).values_list('id', 'tank_type'))
+
+            for reading in sorted(readings, key=attrgetter('timestamp')):
+                if not reading.is_valid:
+                    continue
+                timestamp = reading.timestamp
+                for alert_type, field, rule in self._rules_of(reading.tank_id):
+                    value = getattr(reading, field)
+                    if value is None:
+                        continue
+                    key = (reading.tank_id, alert_type)
+                    evaluated_to = self._evaluated_to.get(key)
+                    if evaluated_to is not None and timestamp <= evaluated_to:
+                        continue
+                    self._evaluated_to[key] = timestamp
+
+                    open_id = self._open.get(key)
+                    if not rule.breached(value, active=open_id is not None):
+                        self._breach_since.pop(key, None)
+                        if open_id is not None:
+                            resolved.append(open_id)
+                            del self._open[key]
+                            self._cleared[key] = timestamp
+                        continue
+
+                    since = self._breach_since.setdefault(key, timestamp)
+                    if open_id is not None or timestamp - since < rule.min_duration:
+                        continue
+                    cleared = self._cleared.get(key)
+                    if cleared is not None and timestamp - cleared < rule.cooldown:
+                        continue
+                    threshold, message = _message(rule, value)
+                    alert = Alert(
+                        tank_id=reading.tank_id,
+                        sensor_id=reading.sensor_id,
+                        alert_type=alert_type,
+                        severity=rule.severity,
+                        title=rule.get_alert_type_display(),
+                        message=message,
+                        threshold_value=threshold,
+                        actual_value=value,
+                    )
+                    self._open[key] = alert.id
+                    created.append(alert)
+
+            self.readings += len(readings)
+            created = self._unique(created)
+            self.resolved += len(resolved)
+
+        folded = store(created)
+        with self._lock:
+            for alert in created:
+                key = (alert.tank_id, alert.alert_type)
+                if alert.id in folded and self._open.get(key) == alert.id:
+                    self._open[key] = folded[alert.id]
+            self.created += len(created) - len(folded)
+            self.coalesced += len(folded)
+        created = [alert for alert in created if alert.id not in folded]
+        if resolved:
+            Alert.objects.filter(id__in=resolved, status__in=OPEN).update(
+                status='resolved', resolved_at=timezone.now(),
+            )
+        return created, resolved
+
+    def _unique(self, created):
+        """Drop new alerts another worker already opened, adopting theirs"""
+        if not created:
+            return created
+        existing = Alert.objects.filter(
+            tank_id__in={alert.tank_id for alert in created},
+            alert_type__in={alert.alert_type for alert in created},
+            status__in=OPEN,
+        ).values_list('tank_id', 'alert_type', 'id')
+        for tank_id, alert_type, alert_id in existing:
+            self._open[(tank_id, alert_type)] = alert_id
+        return [alert for alert in created if self._open[(alert.tank_id, alert.alert_type)] == alert.id]
+
+    def stats(self):
+        return {
+            'rules': len(self._rules),
+            'open_alerts': len(self._open),
+            'readings': self.readings,
+            'created': self.created,
+            'coalesced': self.coalesced,
+            'resolved': self.resolved,
+        }
+
+
+_engine = None
+
+
+def get_engine():
+    """Process-wide alert engine configured from settings"""
+    global _engine
+    if _engine is None:
+        _engine = AlertEngine(settings.SENSOR_ALERT_RULES_TTL)
+    return _engine
+
+
+@receiver(readings_ingested)
+def evaluate_alerts(sender, readings, **kwargs):
+    """Raise and resolve threshold alerts for a committed ingest chunk"""
+    if not settings.SENSOR_ALERTS_ENABLED:
+        return
+    try:
+        with transaction.atomic():
+            get_engine().evaluate(readings)
+    except Exception:
+        logger.exception('Failed to evaluate alerts for %d readings', len(readings))
+
+
+@receiver([post_save, post_delete], sender=AlertRule)
+@receiver([post_save, post_delete], sender=Alert)
+def expire_rules(sender, **kwargs):
+    """Rule edits, and alerts changed by hand, take effect on the next batch in this process"""
+    if _engine is not None:
+        _engine.expire()
@@ -0,0 +1,382 @@
+"""
+Online anomaly detection raising ``data_anomaly`` alerts.
+
+Per tank and metric an AnomalyBaseline keeps exponentially weighted (EW)
+means and variances of the metric, overall and per local hour of day:
+
+    level_slope   change per hour of water_level_percentage, smoothed
+                  with an EWMA of weight LEVEL_SMOOTHING so sensor noise
+                  cancels while a sustained drop passes through; only
+                  drops count, and only a run of them (a leak) raises an
+                  alert
+    temperature   water_temperature_f
+    conductivity  conductivity_us_cm
+
+A tank has at most one sensor of each type, so these are per-sensor
+statistics. Each reading is scored against the baseline of its hour (the
+overall one until the hour has MIN_HOURLY_SAMPLES) in standard
+deviations, then folded in at O(1) cost. An anomalous value is folded in
+as if it were one standard deviation out, so an incident barely moves its
+baseline while a lasting change is still learned over time.
+Readings flagged invalid by the quality checks are skipped.
+
+Every committed ingest chunk loads the baselines of its tanks, scores its
+readings and upserts the baselines back in one statement. ``warm_up``
+computes baselines from stored readings with vectorized EWMAs, and
+``backtest`` replays stored readings through the detector with other
+settings to see how often it would have fired.
+"""
+import logging
+import math
+from collections import namedtuple
+from datetime import timedelta
+from operator import attrgetter
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import alerting
+from .db import upsert
+from .models import Alert, AnomalyBaseline, Sensor, SensorData, WaterTank
+from .signals import readings_ingested
+
+logger = logging.getLogger(__name__)
+
+Metric = namedtuple('Metric', 'field sensor_type drops_only min_std label unit title severity')
+METRICS = {
+    'level_slope': Metric(
+        'water_level_percentage', 'level', True, 1.0, 'Water level', '%/h', 'Possible Leak', 'high',
+    ),
+    'temperature': Metric(
+        'water_temperature_f', 'temperature', False, 0.5, 'Water temperature', '°F', 'Temperature Anomaly', 'medium',
+    ),
+    'conductivity': Metric(
+        'conductivity_us_cm', 'conductivity', False, 10.0, 'Conductivity', ' µS/cm', 'Conductivity Anomaly', 'medium',
+    ),
+}
+HOURS = 24
+# Samples an hour of day needs before its own baseline is used
+MIN_HOURLY_SAMPLES = 10
+# Readings further apart than this do not give a level slope
+MAX_SLOPE_GAP = timedelta(hours=3)
+LEVEL_SMOOTHING = 0.3
+UPDATES = {
+    column: f'excluded.{column}'
+    for column in [
+        'samples', 'mean', 'variance', 'hourly_samples', 'hourly_mean', 'hourly_variance',
+        'streak', 'last_value', 'last_timestamp', 'updated_at',
+    ]
+}
+
+# threshold: standard deviations from the baseline that count as anomalous
+# alpha, hourly_alpha: EW weights of a new value overall and within its hour
+# min_samples: readings before anything is flagged
+# leak_streak: falling readings in a row before a leak alert
+Sensitivity = namedtuple('Sensitivity', 'threshold alpha hourly_alpha min_samples leak_streak')
+
+
+def default_sensitivity(**overrides):
+    """Sensitivity from the SENSOR_ANOMALY_* settings, with ``overrides`` applied"""
+    return Sensitivity(
+        threshold=settings.SENSOR_ANOMALY_THRESHOLD,
+        alpha=settings.SENSOR_ANOMALY_ALPHA,
+        hourly_alpha=settings.SENSOR_ANOMALY_HOURLY_ALPHA,
+        min_samples=settings.SENSOR_ANOMALY_MIN_SAMPLES,
+        leak_streak=settings.SENSOR_ANOMALY_LEAK_STREAK,
+    )._replace(**{name: value for name, value in overrides.items() if value is not None})
+
+
+def new_baseline(tank_id, metric):
+    return AnomalyBaseline(
+        tank_id=tank_id, metric=metric,
+        hourly_samples=[0] * HOURS, hourly_mean=[0.0] * HOURS, hourly_variance=[0.0] * HOURS,
+    )
+
+
+def _ew_update(mean, variance, value, alpha):
+    delta = value - mean
+    return mean + alpha * delta, (1 - alpha) * (variance + alpha * delta * delta)
+
+
+def expected(baseline, hour):
+    """``(mean, std)`` a value of ``baseline``'s metric is compared with at local ``hour``"""
+    if baseline.hourly_samples[hour] >= MIN_HOURLY_SAMPLES:
+        mean, variance = baseline.hourly_mean[hour], baseline.hourly_variance[hour]
+    else:
+        mean, variance = baseline.mean, baseline.variance
+    return mean, max(math.sqrt(variance), METRICS[baseline.metric].min_std)
+
+
+def _value(baseline, timestamp, raw):
+    """The metric value of a raw reading; for slopes ``last_value`` holds the smoothed level"""
+    previous, previous_at = baseline.last_value, baseline.last_timestamp
+    baseline.last_value, baseline.last_timestamp = raw, timestamp
+    if baseline.metric != 'level_slope':
+        return raw
+    if previous is None or timestamp - previous_at > MAX_SLOPE_GAP:
+        # Start smoothing afresh
+        return None
+    baseline.last_value = previous + LEVEL_SMOOTHING * (raw - previous)
+    return (baseline.last_value - previous) / ((timestamp - previous_at).total_seconds() / 3600)
+
+
+def observe(baseline, timestamp, hour, raw, sensitivity):
+    """Score a reading and fold it into ``baseline``.
+
+    Returns ``(value, mean, std)`` when the reading completes an anomaly
+    that should be alerted on, otherwise None. Readings not newer than
+    the last one observed are ignored.
+    """
+    if baseline.last_timestamp is not None and timestamp <= baseline.last_timestamp:
+        return None
+    value = _value(baseline, timestamp, raw)
+    if value is None:
+        return None
+
+    metric = METRICS[baseline.metric]
+    event = None
+    if baseline.samples == 0:
+        baseline.mean = value
+    else:
+        mean, std = expected(baseline, hour)
+        score = (value - mean) / std
+        anomalous = baseline.samples >= sensitivity.min_samples and (
+            score <= -sensitivity.threshold if metric.drops_only else abs(score) >= sensitivity.threshold
+        )
+        baseline.streak = baseline.streak + 1 if anomalous else 0
+        needed = sensitivity.leak_streak if metric.drops_only else 1
+        if baseline.streak == needed:
+            event = (value, mean, std)
+        if anomalous:
+            value = mean + math.copysign(std, score)
+
+    baseline.samples += 1
+    baseline.mean, baseline.variance = _ew_update(baseline.mean, baseline.variance, value, sensitivity.alpha)
+    if baseline.hourly_samples[hour] == 0:
+        baseline.hourly_mean[hour] = value
+    else:
+        baseline.hourly_mean[hour], baseline.hourly_variance[hour] = _ew_update(
+            baseline.hourly_mean[hour], baseline.hourly_variance[hour], value, sensitivity.hourly_alpha,
+        )
+    baseline.hourly_samples[hour] += 1
+    return event
+
+
+def _message(baseline, event, sensitivity):
+    metric = METRICS[baseline.metric]
+    value, mean, std = event
+    if metric.drops_only:
+        return (
+            f'{metric.label} falling {-value:.1f}{metric.unit} for {sensitivity.leak_streak} readings, '
+            f'expected {mean:+.1f} ± {std:.1f}{metric.unit} at this hour.'
+        )
+    return f'{metric.label} is {value:.1f}{metric.unit}, expected {mean:.1f} ± {std:.1f}{metric.unit} at this hour.'
+
+
+def _row(baseline, now):
+    return {
+        'id': baseline.id,
+        'tank_id': baseline.tank_id,
+        'metric': baseline.metric,
+        'samples': baseline.samples,
+        'mean': baseline.mean,
+        'variance': baseline.variance,
+        'hourly_samples': baseline.hourly_samples,
+        'hourly_mean': baseline.hourly_mean,
+        'hourly_variance': baseline.hourly_variance,
+        'streak': baseline.streak,
+        'last_value': baseline.last_value,
+        'last_timestamp': baseline.last_timestamp,
+        'updated_at': now,
+    }
+
+
+def detect(readings, sensitivity=None):
+    """Score ``readings`` (SensorData instances), update the baselines and raise alerts, returning them"""
+    sensitivity = sensitivity or default_sensitivity()
+    tank_ids = {reading.tank_id for reading in readings}
+    baselines = {
+        (baseline.tank_id, baseline.metric): baseline
+        for baseline in AnomalyBaseline.objects.select_for_update().filter(tank_id__in=tank_ids)
+    }
+
+    touched = set()
+    events = []
+    for reading in sorted(readings, key=attrgetter('timestamp')):
+        if not reading.is_valid:
+            continue
+        hour = timezone.localtime(reading.timestamp).hour
+        for name, metric in METRICS.items():
+            raw = getattr(reading, metric.field)
+            if raw is None:
+                continue
+            key = (reading.tank_id, name)
+            baseline = baselines.get(key)
+            if baseline is None:
+                baseline = baselines[key] = new_baseline(reading.tank_id, name)
+            touched.add(key)
+            event = observe(baseline, reading.timestamp, hour, raw, sensitivity)
+            if event is not None:
+                events.append((baseline, event))
+
+    now = timezone.now()
+    upsert(AnomalyBaseline, [_row(baselines[key], now) for key in touched], ['tank', 'metric'], UPDATES)
+    if not events:
+        return []
+
+    sensors = dict(
+        ((tank_id, sensor_type), sensor_id) for sensor_id, tank_id, sensor_type in Sensor.objects.filter(
+            tank_id__in={baseline.tank_id for baseline, event in events},
+            sensor_type__in={metric.sensor_type for metric in METRICS.values()},
+        ).values_list('id', 'tank_id', 'sensor_type')
+    )
+    alerts = []
+    for baseline, event in events:
+        metric = METRICS[baseline.metric]
+        alerts.append(Alert(
+            tank_id=baseline.tank_id,
+            sensor_id=sensors.get((baseline.tank_id, metric.sensor_type)),
+            alert_type='data_anomaly',
+            severity=metric.severity,
+            title=metric.title,
+            message=_message(baseline, event, sensitivity),
+            threshold_value=round(event[1], 3),
+            actual_value=round(event[0], 3),
+        ))
+    alerting.store(alerts)
+    return alerts
+
+
+@receiver(readings_ingested)
+def detect_anomalies(sender, readings, **kwargs):
+    """Update anomaly baselines and raise data_anomaly alerts for a committed ingest chunk"""
+    if not settings.SENSOR_ANOMALY_ENABLED:
+        return
+    try:
+        with transaction.atomic():
+            detect(readings)
+    except Exception:
+        logger.exception('Failed to score %d readings for anomalies', len(readings))
+
+
+def history(tank_id, start=None, end=None):
+    """Valid stored readings of one tank with the watched fields, oldest first.
+
+    Rows are fetched with a plain cursor; per-row model field converters
+    would dominate over long histories.
+    """
+    fields = [metric.field for metric in METRICS.values()]
+    readings = SensorData.objects.filter(tank_id=tank_id, is_valid=True)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lt=end)
+    queryset = readings.order_by('timestamp').values_list('timestamp', *fields)
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        frame = pd.DataFrame(cursor.fetchall(), columns=['timestamp', *fields])
+    frame = frame.astype({field: 'float64' for field in fields})
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], utc=True, format='ISO8601')
+    frame['hour'] = frame['timestamp'].dt.tz_convert(settings.TIME_ZONE).dt.hour
+    return frame
+
+
+def _series(frame, name):
+    """Metric values of a history frame, NaN where there is none, and its last raw reading"""
+    metric = METRICS[name]
+    present = frame[metric.field].notna().to_numpy()
+    if not present.any():
+        return None, None, None
+    raw = frame[metric.field]
+    last = np.flatnonzero(present)[-1]
+    last_value, last_timestamp = float(raw.iat[last]), frame['timestamp'].iat[last].to_pydatetime()
+    if name != 'level_slope':
+        return raw, last_value, last_timestamp
+
+    # Smoothing is not restarted after gaps here; the slope across a gap is dropped
+    known = frame.loc[present, ['timestamp', metric.field]]
+    smoothed = known[metric.field].ewm(alpha=LEVEL_SMOOTHING, adjust=False).mean()
+    gap = known['timestamp'].diff()
+    slope = smoothed.diff() / (gap.dt.total_seconds() / 3600)
+    slope[(gap <= pd.Timedelta(0)) | (gap > MAX_SLOPE_GAP)] = np.nan
+    return slope.reindex(frame.index), float(smoothed.iat[-1]), last_timestamp
+
+
+def _ew_last(values, alpha):
+    """Final EW mean and variance of ``values``, matching the streaming update"""
+    ewm = values.ewm(alpha=alpha, adjust=False, ignore_na=True)
+    return float(ewm.mean().iat[-1]), float(np.nan_to_num(ewm.var(bias=True).iat[-1]))
+
+
+def warm_up(tank_ids=None, start=None, end=None, sensitivity=None):
+    """Recompute baselines from stored readings with vectorized EWMAs, returning how many were written.
+
+    Unlike the streaming update the history is not clipped, so warm up
+    over a period without known incidents.
+    """
+    sensitivity = sensitivity or default_sensitivity()
+    tanks = WaterTank.objects.all()
+    if tank_ids is not None:
+        tanks = tanks.filter(id__in=tank_ids)
+
+    written = 0
+    for tank_id in tanks.values_list('id', flat=True):
+        frame = history(tank_id, start, end)
+        rows = []
+        for name in METRICS:
+            values, last_value, last_timestamp = _series(frame, name)
+            if values is None:
+                continue
+            baseline = new_baseline(tank_id, name)
+            baseline.last_value, baseline.last_timestamp = last_value, last_timestamp
+            known = values.notna()
+            baseline.samples = int(known.sum())
+            if baseline.samples:
+                baseline.mean, baseline.variance = _ew_last(values[known], sensitivity.alpha)
+            for hour, hourly in values[known].groupby(frame['hour'][known]):
+                baseline.hourly_samples[hour] = len(hourly)
+                baseline.hourly_mean[hour], baseline.hourly_variance[hour] = _ew_last(hourly, sensitivity.hourly_alpha)
+            rows.append(_row(baseline, timezone.now()))
+        with transaction.atomic():
+            upsert(AnomalyBaseline, rows, ['tank', 'metric'], UPDATES)
+        written += len(rows)
+    return written
+
+
+def backtest(tank_ids=None, start=None, end=None, sensitivity=None):
+    """Replay stored readings through the detector from empty baselines, writing nothing.
+
+    Returns ``(counts, events)``: per metric the readings scored,
+    anomalous readings and alerts that would have been raised, and the
+    ``(tank_id, metric, timestamp, value, mean, std)`` of each alert.
+    """
+    sensitivity = sensitivity or default_sensitivity()
+    tanks = WaterTank.objects.all()
+    if tank_ids is not None:
+        tanks = tanks.filter(id__in=tank_ids)
+
+    counts = {name: {'readings': 0, 'anomalous': 0, 'alerts': 0} for name in METRICS}
+    events = []
+    for tank_id in tanks.values_list('id', flat=True):
+        frame = history(tank_id, start, end)
+        timestamps = pd.DatetimeIndex(frame['timestamp']).to_pydatetime()
+        hours = frame['hour'].tolist()
+        for name, metric in METRICS.items():
+            baseline = new_baseline(tank_id, name)
+            for timestamp, hour, raw in zip(timestamps, hours, frame[metric.field].tolist()):
+                if raw != raw:
+                    continue
+                samples = baseline.samples
+                event = observe(baseline, timestamp, hour, raw, sensitivity)
+                if baseline.samples > samples:
+                    counts[name]['readings'] += 1
+                    counts[name]['anomalous'] += baseline.streak > 0
+                if event is not None:
+                    counts[name]['alerts'] += 1
+                    events.append((tank_id, name, timestamp, *event))
+    return counts, events
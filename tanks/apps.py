@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TanksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tanks'
+
+    def ready(self):
+        # Connect readings_ingested receivers
+        from . import alerting, anomaly, recent, rollups  # noqa: F401
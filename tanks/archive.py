@@ -0,0 +1,269 @@
+"""
+Cold storage of old sensor readings as per-tank, per-month columnar files.
+
+``manage.py archive_sensor_data`` moves complete UTC months older than
+SENSOR_ARCHIVE_AFTER_DAYS out of ``tanks_sensordata`` into
+SENSOR_ARCHIVE_DIR and records each file in SensorDataArchive. Readers
+(raw chart series, CSV export, rollup rebuilds) combine archived and live
+rows transparently through ``load_range``.
+
+Each archive holds one array per column, sorted by timestamp:
+
+    id            S16      reading UUID bytes
+    timestamp     int64    epoch microseconds (UTC)
+    created_at    int64    epoch microseconds (UTC)
+    sensor        int16    index into ``sensors``, -1 for none
+    sensors       S16      sensor UUID bytes
+    is_valid      bool
+    <field>       float32  NaN for missing (float64 for total_flow_gallons)
+    quality_flags uint8    UTF-8 JSON object {row index: flags} for non-empty flags
+
+By default the arrays are stored as a directory of ``.npy`` files, which
+are memory-mapped so a query only pages in the slice it needs; float32
+columns are already a fraction of the size of a table row plus its
+indexes. With SENSOR_ARCHIVE_COMPRESS the arrays go into one compressed
+``.npz`` instead, which is smaller on disk but must be decompressed
+whole on every read.
+
+Every rewrite goes to a new path and the catalog row is switched in the
+same transaction that deletes the archived rows, so readers never see a
+half-written archive.
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .ingest import READING_FIELDS
+from .models import SensorData, SensorDataArchive
+from .partitions import add_months
+
+# Stored in full precision: cumulative totals outgrow float32
+FLOAT64_FIELDS = {'total_flow_gallons'}
+INTEGER_FIELDS = {'signal_strength'}
+# Decimal digits a float32 column holds faithfully
+FLOAT32_DIGITS = 7
+DB_COLUMNS = ['id', 'timestamp', 'created_at', 'sensor_id', 'is_valid', 'quality_flags', *READING_FIELDS]
+DELETE_BATCH = 1000
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def epoch_us(value):
+    """Microseconds since the Unix epoch of an aware datetime"""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def to_datetimes(stamps):
+    """Convert an array of epoch microseconds into aware datetimes"""
+    return [EPOCH + timedelta(microseconds=value) for value in stamps.tolist()]
+
+
+def columns_from_rows(rows):
+    """Build archive arrays from SensorData ``values_list(*DB_COLUMNS)`` rows"""
+    sensors = sorted({row[3] for row in rows if row[3]})
+    sensor_index = {sensor: index for index, sensor in enumerate(sensors)}
+    flags = {index: row[5] for index, row in enumerate(rows) if row[5]}
+
+    columns = {
+        'id': np.array([row[0].bytes for row in rows], dtype='S16'),
+        'timestamp': np.array([epoch_us(row[1]) for row in rows], dtype=np.int64),
+        'created_at': np.array([epoch_us(row[2]) for row in rows], dtype=np.int64),
+        'sensor': np.array([sensor_index.get(row[3], -1) for row in rows], dtype=np.int16),
+        'sensors': np.array([sensor.bytes for sensor in sensors], dtype='S16'),
+        'is_valid': np.array([row[4] for row in rows], dtype=bool),
+        'quality_flags': np.frombuffer(json.dumps(flags).encode(), dtype=np.uint8),
+    }
+    for offset, field in enumerate(READING_FIELDS, start=6):
+        dtype = np.float64 if field in FLOAT64_FIELDS else np.float32
+        columns[field] = np.array(
+            [np.nan if row[offset] is None else row[offset] for row in rows], dtype=dtype
+        )
+    return columns
+
+
+def merge_columns(old, new):
+    """Combine two archives of the same month, dropping re-archived duplicates"""
+    sensors = list(dict.fromkeys([*old['sensors'].tolist(), *new['sensors'].tolist()]))
+    sensor_index = {sensor: index for index, sensor in enumerate(sensors)}
+
+    def remap(columns):
+        lookup = np.array([sensor_index[sensor] for sensor in columns['sensors'].tolist()] + [-1], dtype=np.int16)
+        return lookup[columns['sensor']]
+
+    flags = json.loads(bytes(old['quality_flags']))
+    offset = len(old['timestamp'])
+    flags.update({str(int(index) + offset): value for index, value in json.loads(bytes(new['quality_flags'])).items()})
+
+    merged = {
+        name: np.concatenate([old[name], new[name]])
+        for name in ['id', 'timestamp', 'created_at', 'is_valid', *READING_FIELDS]
+    }
+    merged['sensor'] = np.concatenate([remap(old), remap(new)])
+
+    # One row per (sensor, timestamp), keeping the earliest stored copy, in time order
+    order = np.lexsort((merged['created_at'], merged['sensor'], merged['timestamp']))
+    keys = np.stack([merged['timestamp'][order], merged['sensor'][order].astype(np.int64)])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = np.any(keys[:, 1:] != keys[:, :-1], axis=0)
+    order = order[keep]
+
+    for name in merged:
+        merged[name] = merged[name][order]
+    merged['sensors'] = np.array(sensors, dtype='S16')
+    positions = {int(old_index): new_index for new_index, old_index in enumerate(order.tolist())}
+    merged['quality_flags'] = np.frombuffer(json.dumps({
+        positions[int(index)]: value for index, value in flags.items() if int(index) in positions
+    }).encode(), dtype=np.uint8)
+    return merged
+
+
+def _fsync_file(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_columns(relative_path, columns, compressed):
+    """Durably write archive arrays to ``relative_path`` under SENSOR_ARCHIVE_DIR"""
+    path = os.path.join(settings.SENSOR_ARCHIVE_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if compressed:
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **columns)
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        os.makedirs(path)
+        for name, array in columns.items():
+            _fsync_file(os.path.join(path, f'{name}.npy'), array)
+    return _size(path)
+
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+    return os.path.getsize(path)
+
+
+def remove_files(relative_path):
+    path = os.path.join(settings.SENSOR_ARCHIVE_DIR, relative_path)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def read_columns(entry, names=None):
+    """Arrays of a catalog entry; ``.npy`` columns are memory-mapped"""
+    path = os.path.join(settings.SENSOR_ARCHIVE_DIR, entry.path)
+    if entry.compressed:
+        with np.load(path) as data:
+            return {name: data[name] for name in (names or data.files)}
+    names = names or [name[:-4] for name in os.listdir(path) if name.endswith('.npy')]
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in names}
+
+
+def _widen(array):
+    """float64 copy of an archived column, float32 values rounded to FLOAT32_DIGITS significant digits"""
+    if array.dtype == np.float32:
+        # So 62.37 reads back as 62.37 rather than 62.369998931884766
+        values = array.astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            magnitude = np.floor(np.log10(np.abs(values)))
+        scale = 10.0 ** (FLOAT32_DIGITS - 1 - np.where(np.isfinite(magnitude), magnitude, 0))
+        return np.round(values * scale) / scale
+    return np.asarray(array, dtype=np.float64)
+
+
+def load_range(tank_id, start, end, fields):
+    """Archived readings of a tank in ``[start, end)``.
+
+    Returns ``(epoch_us, {field: array})`` sorted by time, empty when
+    nothing in the range is archived.
+    """
+    entries = SensorDataArchive.objects.filter(
+        tank_id=tank_id, first_timestamp__lt=end, last_timestamp__gte=start,
+    ).order_by('month')
+
+    timestamps, values = [], {field: [] for field in fields}
+    low, high = epoch_us(start), epoch_us(end)
+    for entry in entries:
+        columns = read_columns(entry, ['timestamp', *fields])
+        stamps = columns['timestamp']
+        lo, hi = np.searchsorted(stamps, low), np.searchsorted(stamps, high)
+        timestamps.append(np.asarray(stamps[lo:hi]))
+        for field in fields:
+            values[field].append(_widen(columns[field][lo:hi]))
+
+    if not timestamps:
+        return np.empty(0, dtype=np.int64), {field: np.empty(0) for field in fields}
+    return np.concatenate(timestamps), {field: np.concatenate(arrays) for field, arrays in values.items()}
+
+
+def load_rows(tank_id, start, end, fields):
+    """Archived readings as ``(timestamps, {field: values})`` Python lists, None for missing"""
+    stamps, values = load_range(tank_id, start, end, fields)
+    rows = {}
+    for field, array in values.items():
+        cast = int if field in INTEGER_FIELDS else float
+        rows[field] = [None if value != value else cast(value) for value in array.tolist()]
+    return to_datetimes(stamps), rows
+
+
+def archive_month(tank_id, month, compressed):
+    """Move one tank's readings for a UTC month into its archive.
+
+    Returns the number of readings moved. Late readings for an already
+    archived month are merged into a new version of its file.
+    """
+    month_end = add_months(month, 1)
+    rows = list(
+        SensorData.objects.filter(tank_id=tank_id, timestamp__gte=month, timestamp__lt=month_end)
+        .order_by('timestamp')
+        .values_list(*DB_COLUMNS)
+    )
+    if not rows:
+        return 0
+
+    columns = columns_from_rows(rows)
+    existing = SensorDataArchive.objects.filter(tank_id=tank_id, month=month.date()).first()
+    if existing:
+        columns = merge_columns(read_columns(existing), columns)
+
+    # A fresh path per version keeps the current file intact for readers
+    relative_path = f'{tank_id}/{month:%Y-%m}-{uuid.uuid4().hex[:8]}' + ('.npz' if compressed else '')
+    size = write_columns(relative_path, columns, compressed)
+
+    stamps = columns['timestamp']
+    try:
+        with transaction.atomic():
+            SensorDataArchive.objects.update_or_create(
+                tank_id=tank_id,
+                month=month.date(),
+                defaults={
+                    'path': relative_path,
+                    'compressed': compressed,
+                    'row_count': len(stamps),
+                    'first_timestamp': to_datetimes(stamps[:1])[0],
+                    'last_timestamp': to_datetimes(stamps[-1:])[0],
+                    'size_bytes': size,
+                },
+            )
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), DELETE_BATCH):
+                SensorData.objects.filter(id__in=ids[start:start + DELETE_BATCH]).delete()
+    except Exception:
+        remove_files(relative_path)
+        raise
+
+    if existing:
+        remove_files(existing.path)
+    return len(rows)
@@ -0,0 +1,315 @@
+"""
+Sensor calibration offsets applied to readings.
+
+A sensor's ``calibration_offset`` is added to the field it measures
+(CALIBRATED_FIELDS) for readings from its ``last_calibration`` on, or for
+all readings when it was never dated. Ingest applies the current offset
+to new readings. When a technician recalibrates, ``queue`` starts a
+CalibrationRun that re-applies the new offset to the stored readings
+since the calibration date.
+
+Runs walk the readings in (timestamp, id) order in chunks, each written
+in its own short transaction with vectorized updates, so the hot table is
+never locked for long. The cursor is saved with every chunk, so an
+interrupted run resumes where it stopped. The first time a value changes,
+its original is kept in SensorDataCorrection. Corrections are always
+computed from that original, so a run can be repeated, or undone with an
+offset of 0, without compounding.
+
+A reading belongs to a sensor when it carries the sensor's id, or carries
+none (a gateway reporting for the whole tank). Archived months are not
+rewritten.
+"""
+import logging
+import math
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Min, Q
+from django.utils import timezone
+
+from . import recent, rollups, state, validation
+from .db import upsert
+from .models import CalibrationRun, Sensor, SensorData, SensorDataCorrection
+
+logger = logging.getLogger(__name__)
+
+# Reading field each sensor type measures
+CALIBRATED_FIELDS = {
+    'level': 'water_level_inches',
+    'temperature': 'water_temperature_f',
+    'ph': 'ph_level',
+    'turbidity': 'turbidity_ntu',
+    'dissolved_oxygen': 'dissolved_oxygen_ppm',
+    'conductivity': 'conductivity_us_cm',
+    'flow': 'flow_rate_gpm',
+}
+# Fields computed from a calibrated one, scaled along with it
+DERIVED_FIELDS = {'water_level_inches': 'water_level_percentage'}
+ACTIVE = ('pending', 'running')
+CHUNK_SIZE = 5000
+CORRECTION_UPDATES = {
+    'applied_offset': 'excluded.applied_offset',
+    'run_id': 'excluded.run_id',
+    'updated_at': 'excluded.updated_at',
+}
+
+
+class Superseded(Exception):
+    """Raised when a run is replaced by a newer one while it is applied"""
+
+
+def fields_for(field):
+    """``field`` and the fields derived from it"""
+    return [field, DERIVED_FIELDS[field]] if field in DERIVED_FIELDS else [field]
+
+
+def corrected(field, originals, offset):
+    """Calibrated arrays of ``field`` and its derived fields from their original arrays"""
+    values = {field: originals[field] + offset}
+    derived = DERIVED_FIELDS.get(field)
+    if derived:
+        # A percentage is proportional to the level; it cannot be rescaled from an empty reading
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scaled = np.clip(originals[derived] * values[field] / originals[field], 0, 100)
+        values[derived] = np.where(originals[field] > 0, scaled, originals[derived])
+    return values
+
+
+def _correction_rows(sensor_id, run_id, reading_ids, stamps, originals, changed, offset):
+    now = timezone.now()
+    return [
+        {
+            'sensor_id': sensor_id,
+            'reading_id': reading_ids[row],
+            'timestamp': stamps[row],
+            'field': name,
+            'original_value': float(originals[name][row]),
+            'applied_offset': offset,
+            'run_id': run_id,
+            'updated_at': now,
+        }
+        for name, rows in changed.items() for row in np.flatnonzero(rows)
+    ]
+
+
+def calibrate(readings):
+    """Add current calibration offsets to new SensorData value dicts (with ids) in place.
+
+    Records the originals of the changed values; call inside the
+    transaction that inserts the readings.
+    """
+    tank_ids = {values['tank_id'] for values in readings}
+    sensors = Sensor.objects.filter(
+        tank_id__in=tank_ids, sensor_type__in=CALIBRATED_FIELDS,
+    ).exclude(calibration_offset=0).values_list(
+        'id', 'tank_id', 'sensor_type', 'calibration_offset', 'last_calibration',
+    )
+
+    corrections = []
+    for sensor_id, tank_id, sensor_type, offset, since in sensors:
+        field = CALIBRATED_FIELDS[sensor_type]
+        matching = [
+            values for values in readings
+            if values['tank_id'] == tank_id and values['sensor_id'] in (None, sensor_id)
+            and values.get(field) is not None and (since is None or values['timestamp'] >= since)
+        ]
+        if not matching:
+            continue
+        names = fields_for(field)
+        originals = {
+            name: np.array([values.get(name) for values in matching], dtype=np.float64) for name in names
+        }
+        updated = corrected(field, originals, offset)
+        changed = {name: ~np.isnan(originals[name]) & (updated[name] != originals[name]) for name in names}
+        for name in names:
+            for row in np.flatnonzero(changed[name]):
+                matching[row][name] = float(updated[name][row])
+        corrections.extend(_correction_rows(
+            sensor_id, None, [values['id'] for values in matching],
+            [values['timestamp'] for values in matching], originals, changed, offset,
+        ))
+    upsert(SensorDataCorrection, corrections, ['reading_id', 'field'], CORRECTION_UPDATES)
+
+
+def queue(sensor):
+    """Start a run re-applying ``sensor``'s current calibration, superseding unfinished ones"""
+    with transaction.atomic():
+        CalibrationRun.objects.filter(sensor=sensor, status__in=ACTIVE).update(
+            status='superseded', finished_at=timezone.now(),
+        )
+        return CalibrationRun.objects.create(
+            sensor=sensor, offset=sensor.calibration_offset, since=sensor.last_calibration,
+        )
+
+
+def _readings(run):
+    """The stored readings ``run`` applies to"""
+    sensor = run.sensor
+    field = CALIBRATED_FIELDS[sensor.sensor_type]
+    readings = SensorData.objects.filter(
+        Q(sensor=sensor) | Q(sensor__isnull=True), tank_id=sensor.tank_id, **{f'{field}__isnull': False},
+    )
+    if run.since is not None:
+        readings = readings.filter(timestamp__gte=run.since)
+    return readings
+
+
+def estimate(run, chunk_size=CHUNK_SIZE):
+    """What applying ``run`` would change, without writing anything.
+
+    ``shifts`` maps each change of the stored value of the calibrated
+    field to the number of readings it applies to.
+    """
+    field = CALIBRATED_FIELDS[run.sensor.sensor_type]
+    summary = _readings(run).aggregate(rows=Count('id'), first=Min('timestamp'), last=Max('timestamp'))
+    corrections = SensorDataCorrection.objects.filter(sensor=run.sensor, field=field)
+    if run.since is not None:
+        corrections = corrections.filter(timestamp__gte=run.since)
+
+    shifts = {}
+    uncorrected = summary['rows']
+    for row in corrections.values('applied_offset').annotate(rows=Count('id')):
+        shift = round(run.offset - row['applied_offset'], 9)
+        shifts[shift] = shifts.get(shift, 0) + row['rows']
+        uncorrected -= row['rows']
+    if uncorrected > 0:
+        shifts[run.offset] = shifts.get(run.offset, 0) + uncorrected
+    shifts.pop(0.0, None)
+
+    summary.update(
+        field=field,
+        fields=fields_for(field),
+        chunks=math.ceil(summary['rows'] / chunk_size),
+        shifts=shifts,
+    )
+    return summary
+
+
+def _fetch_chunk(run, names, chunk_size):
+    """Raw ``(id, timestamp, *names)`` rows of the next chunk after the run's cursor"""
+    readings = _readings(run)
+    if run.cursor_timestamp is not None:
+        readings = readings.filter(
+            Q(timestamp__gt=run.cursor_timestamp) | Q(timestamp=run.cursor_timestamp, id__gt=run.cursor_id)
+        )
+    queryset = readings.order_by('timestamp', 'id').values_list('id', 'timestamp', *names)[:chunk_size]
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return rows
+
+
+def _apply_chunk(run, chunk_size):
+    """Apply ``run`` to the next chunk, returning the rows read (0 when finished)"""
+    sensor = run.sensor
+    field = CALIBRATED_FIELDS[sensor.sensor_type]
+    names = fields_for(field)
+    rows = _fetch_chunk(run, names, chunk_size)
+    if not rows:
+        return 0
+
+    # Raw ids and timestamps go straight back into the WHERE clause
+    raw_ids, raw_stamps, *columns = zip(*rows)
+    reading_ids = [value if isinstance(value, uuid.UUID) else uuid.UUID(value) for value in raw_ids]
+    stamps = pd.DatetimeIndex(pd.to_datetime(list(raw_stamps), utc=True, format='ISO8601')).to_pydatetime()
+
+    current = {name: np.array(values, dtype=np.float64) for name, values in zip(names, columns)}
+    originals = {name: values.copy() for name, values in current.items()}
+    position = {reading_id: row for row, reading_id in enumerate(reading_ids)}
+    known = SensorDataCorrection.objects.filter(
+        sensor=sensor, field__in=names, timestamp__gte=stamps[0], timestamp__lte=stamps[-1],
+    ).values_list('reading_id', 'field', 'original_value')
+    for reading_id, name, original in known:
+        if reading_id in position:
+            originals[name][position[reading_id]] = original
+
+    updated = corrected(field, originals, run.offset)
+    changed = {
+        name: ~np.isnan(current[name]) & ~np.isclose(updated[name], current[name], rtol=0, atol=1e-9)
+        for name in names
+    }
+    stale = np.flatnonzero(np.logical_or.reduce(list(changed.values())))
+
+    connection = connections[SensorData.objects.db]
+    qn = connection.ops.quote_name
+    assignments = ', '.join(f'{qn(name)} = %s' for name in names)
+    params = [
+        (*[None if np.isnan(updated[name][row]) else float(updated[name][row]) for name in names],
+         raw_ids[row], raw_stamps[row])
+        for row in stale
+    ]
+    if params:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {qn(SensorData._meta.db_table)} SET {assignments} '
+                f'WHERE {qn("id")} = %s AND {qn("timestamp")} = %s',
+                params,
+            )
+    upsert(
+        SensorDataCorrection,
+        _correction_rows(sensor.id, run.id, reading_ids, stamps, originals, changed, run.offset),
+        ['reading_id', 'field'],
+        CORRECTION_UPDATES,
+    )
+
+    run.cursor_timestamp, run.cursor_id = stamps[-1], reading_ids[-1]
+    saved = CalibrationRun.objects.filter(pk=run.pk, status='running').update(
+        cursor_timestamp=run.cursor_timestamp,
+        cursor_id=run.cursor_id,
+        rows_done=F('rows_done') + len(rows),
+        rows_changed=F('rows_changed') + len(stale),
+    )
+    if not saved:
+        raise Superseded(str(run.pk))
+    run.rows_done += len(rows)
+    run.rows_changed += len(stale)
+    return len(rows)
+
+
+def process(run, chunk_size=CHUNK_SIZE, pause=0.0, progress=None):
+    """Apply ``run`` from its cursor to the end, then refresh derived data.
+
+    ``pause`` seconds are slept between chunks to leave room for ingest;
+    ``progress`` is called with the run after every chunk.
+    """
+    if run.status == 'pending':
+        run.rows_total = _readings(run).count()
+        run.status, run.started_at = 'running', timezone.now()
+        run.save(update_fields=['rows_total', 'status', 'started_at'])
+
+    try:
+        while True:
+            with transaction.atomic():
+                read = _apply_chunk(run, chunk_size)
+            if not read:
+                break
+            if progress:
+                progress(run)
+            if pause:
+                time.sleep(pause)
+    except Superseded:
+        run.refresh_from_db()
+        return run
+    except Exception as exc:
+        logger.exception('Calibration run %s failed', run.pk)
+        CalibrationRun.objects.filter(pk=run.pk).update(status='failed', error=str(exc), finished_at=timezone.now())
+        raise
+
+    # Derived data is rebuilt once at the end rather than per chunk
+    tank_ids = [run.sensor.tank_id]
+    rollups.rebuild(tank_ids, start=run.since)
+    validation.revalidate(tank_ids, start=run.since)
+    state.refresh(tank_ids)
+    recent.invalidate(tank_ids)
+
+    run.status, run.finished_at = 'done', timezone.now()
+    run.rows_total = max(run.rows_total, run.rows_done)
+    CalibrationRun.objects.filter(pk=run.pk, status='running').update(
+        status=run.status, finished_at=run.finished_at, rows_total=run.rows_total,
+    )
+    return run
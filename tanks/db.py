@@ -0,0 +1,67 @@
+"""
+Database helpers the ORM does not cover.
+
+``upsert`` issues ``INSERT ... ON CONFLICT (...) DO UPDATE`` with arbitrary
+update expressions, so counters and aggregates can be merged in the
+database instead of read-modify-write round trips. Both PostgreSQL and
+SQLite (3.24+) support this syntax; ``greatest``/``least`` paper over
+their differing function names and NULL handling.
+"""
+from django.db import connections, router
+
+
+def greatest(a, b, connection):
+    """SQL for the larger of two expressions, ignoring a NULL side"""
+    name = 'GREATEST' if connection.vendor == 'postgresql' else 'MAX'
+    return f'{name}(COALESCE({a}, {b}), COALESCE({b}, {a}))'
+
+
+def least(a, b, connection):
+    """SQL for the smaller of two expressions, ignoring a NULL side"""
+    name = 'LEAST' if connection.vendor == 'postgresql' else 'MIN'
+    return f'{name}(COALESCE({a}, {b}), COALESCE({b}, {a}))'
+
+
+def upsert(model, rows, unique_fields, updates, where=None, using=None):
+    """Insert ``rows`` (dicts keyed by field attname), merging conflicts.
+
+    ``updates`` maps column names to SQL expressions for the ``DO UPDATE
+    SET`` clause; in them ``{table}`` is the existing row's table and
+    ``excluded`` the row being inserted. ``where`` optionally restricts which
+    conflicting rows are updated. Rows are written in key order so
+    concurrent upserts take row locks in the same order.
+    """
+    if not rows:
+        return
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    key_names = [model._meta.get_field(name).attname for name in unique_fields]
+    rows = sorted(rows, key=lambda row: tuple(str(row[name]) for name in key_names))
+
+    columns = ', '.join(qn(field.column) for field in fields)
+    conflict = ', '.join(qn(model._meta.get_field(name).column) for name in unique_fields)
+    assignments = ', '.join(
+        f'{qn(column)} = {expression.format(table=table)}' for column, expression in updates.items()
+    )
+    suffix = f' WHERE {where.format(table=table)}' if where else ''
+
+    max_params = connection.features.max_query_params or 2000
+    batch_size = max(1, max_params // len(fields))
+    row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(row[field.attname], connection)
+                for row in batch for field in fields
+            ]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([row_sql] * len(batch))} '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {assignments}{suffix}',
+                params,
+            )
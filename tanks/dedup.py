@@ -0,0 +1,129 @@
+"""
+Duplicate-reading suppression at ingest.
+
+A reading is identified by ``(tank, sensor, timestamp)``, which the
+database enforces with unique constraints on SensorData. Gateways
+retransmit recent readings, so a bounded LRU of keys stored by this
+process answers most duplicate checks without a database round-trip;
+cache misses are checked with one query per chunk, and ``bulk_create``
+ignores whatever still slips through a race.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import SensorData
+
+
+def reading_key(values):
+    """Dedup key for validated reading values (SensorData kwargs)"""
+    return values['tank_id'], values['sensor_id'], values['timestamp']
+
+
+class RecentKeyCache:
+    """Bounded LRU of recently stored reading keys with hit/miss counters"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_duplicates = 0
+        self.batch_duplicates = 0
+
+    def check(self, key):
+        """Return True (and refresh the key) if it was stored recently"""
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, keys):
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._keys),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'db_duplicates': self.db_duplicates,
+            'batch_duplicates': self.batch_duplicates,
+        }
+
+
+_cache = None
+
+
+def get_cache():
+    """Process-wide recent-key cache sized from settings"""
+    global _cache
+    if _cache is None:
+        _cache = RecentKeyCache(settings.SENSOR_DEDUP_CACHE_SIZE)
+    return _cache
+
+
+def _existing_keys(candidates):
+    """Fetch the keys among ``candidates`` that are already stored, in one query"""
+    tank_ids = {values['tank_id'] for _, values in candidates}
+    timestamps = [values['timestamp'] for _, values in candidates]
+    rows = SensorData.objects.filter(
+        tank_id__in=tank_ids,
+        timestamp__range=(min(timestamps), max(timestamps)),
+        timestamp__in=timestamps,
+    ).values_list('tank_id', 'sensor_id', 'timestamp')
+    return set(rows)
+
+
+def split_duplicates(candidates, check_database=True):
+    """Split ``(index, values)`` pairs into ``(fresh, duplicate_indexes)``"""
+    cache = get_cache()
+    seen = set()
+    unknown = []
+    duplicates = []
+
+    for index, values in candidates:
+        key = reading_key(values)
+        if key in seen:
+            cache.batch_duplicates += 1
+            duplicates.append(index)
+            continue
+        seen.add(key)
+        if cache.check(key):
+            duplicates.append(index)
+        else:
+            unknown.append((index, values))
+
+    if not unknown or not check_database:
+        return unknown, duplicates
+
+    existing = _existing_keys(unknown)
+    if not existing:
+        return unknown, duplicates
+
+    fresh = []
+    for index, values in unknown:
+        if reading_key(values) in existing:
+            cache.db_duplicates += 1
+            duplicates.append(index)
+        else:
+            fresh.append((index, values))
+    cache.add(existing)
+    return fresh, duplicates
+
+
+def remember(readings):
+    """Record the keys of stored readings (validated values dicts)"""
+    get_cache().add(reading_key(values) for values in readings)
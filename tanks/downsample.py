@@ -0,0 +1,69 @@
+"""
+Downsampling of chart series to a point budget.
+
+``lttb`` makes the Largest-Triangle-Three-Buckets selection: the first and
+last points, plus from each of ``n - 2`` equal-count buckets the point
+forming the largest triangle with the point kept from the previous bucket
+and the mean of the next one. Peaks, dips and the overall shape survive,
+unlike with bucket averages.
+
+LTTB visits its buckets in turn, one NumPy step each. Inputs longer than
+MINMAX_RATIO times the budget are first cut down to the minimum and
+maximum of each bucket by ``minmax``, which is fully vectorized, so the
+cost stays linear in the input and the LTTB pass is bounded by the budget.
+"""
+import numpy as np
+
+# Points per output point kept by the min/max pass ahead of LTTB
+MINMAX_RATIO = 4
+
+
+def minmax(y, n):
+    """Indices of the minimum and maximum of ``y`` in each of about ``n / 2`` buckets, in order"""
+    length = len(y)
+    if length <= n:
+        return np.arange(length)
+    size = -(-length // max(n // 2, 1))
+    buckets = -(-length // size)
+    padded = np.full(buckets * size, np.inf)
+    padded[:length] = y
+    lows = padded.reshape(buckets, size).argmin(axis=1)
+    padded[length:] = -np.inf
+    highs = padded.reshape(buckets, size).argmax(axis=1)
+    offsets = np.arange(buckets) * size
+    return np.unique(np.concatenate([[0, length - 1], lows + offsets, highs + offsets]))
+
+
+def _lttb(x, y, n):
+    # Interior points split into n - 2 buckets; each holds at least one point
+    length = len(x)
+    edges = np.linspace(1, length - 1, n - 1).astype(np.intp)
+    selected = np.empty(n, dtype=np.intp)
+    selected[0], selected[-1] = 0, length - 1
+    a = 0
+    for bucket in range(n - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[stop:edges[bucket + 2]].mean()
+            next_y = y[stop:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs(
+            (x[a] - next_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (next_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        selected[bucket + 1] = a
+    return selected
+
+
+def lttb(x, y, n):
+    """Indices of the at most ``n`` points LTTB keeps from ``x``, ``y`` (float arrays, ``x`` increasing)"""
+    n = max(n, 3)
+    if len(x) <= n:
+        return np.arange(len(x))
+    if len(x) <= MINMAX_RATIO * n:
+        return _lttb(x, y, n)
+    candidates = minmax(y, MINMAX_RATIO * n)
+    if len(candidates) <= n:
+        return candidates
+    return candidates[_lttb(x[candidates], y[candidates], n)]
@@ -0,0 +1,64 @@
+"""
+Time-ordered UUIDs (UUIDv7, RFC 9562) for SensorData primary keys.
+
+A random UUID4 key sends every insert to a random leaf of the primary key
+index, so once the index outgrows memory each insert reads a cold page
+and half-empty pages split everywhere. A UUIDv7 starts with a millisecond
+Unix timestamp, so new keys are appended at the right edge of the index
+like a sequence, while staying a UUID: existing UUID4 rows, and the ids
+already handed out to gateways, remain valid.
+
+Layout: 48-bit Unix time in ms, version 7, a 12-bit counter that keeps
+ids generated in the same millisecond ordered (method 1 of the RFC),
+the variant bits and 62 random bits.
+"""
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+COUNTER_MAX = 0xFFF
+
+
+def _reserve(count):
+    """Claim ``count`` consecutive (ms, counter) slots, never going backwards"""
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms, _counter = now_ms, 0
+        else:
+            # Same millisecond, or the clock stepped back: keep counting
+            _counter += 1
+        first = (_last_ms, _counter)
+        _counter += count - 1
+        # A full counter borrows the next millisecond
+        _last_ms += _counter // (COUNTER_MAX + 1)
+        _counter %= COUNTER_MAX + 1
+        return first
+
+
+def uuid7s(count):
+    """``count`` new UUIDv7s in ascending order"""
+    if count <= 0:
+        return []
+    ms, counter = _reserve(count)
+    random = os.urandom(8 * count)
+    ids = []
+    for index in range(count):
+        tail = int.from_bytes(random[8 * index:8 * index + 8], 'big') & 0x3FFFFFFFFFFFFFFF
+        ids.append(uuid.UUID(int=(ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | tail))
+        counter += 1
+        if counter > COUNTER_MAX:
+            ms, counter = ms + 1, 0
+    return ids
+
+
+def uuid7():
+    """A new UUIDv7, greater than every id generated before it in this process"""
+    return uuid7s(1)[0]
+
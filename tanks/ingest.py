@@ -0,0 +1,364 @@
+"""
+Batch ingestion of sensor readings.
+
+Readings arrive as plain dicts (decoded from JSON, NDJSON or other wire
+formats), are validated without touching the database, then written in
+chunks with ``bulk_create`` - one transaction per chunk. Every input row
+gets an ``accepted``, ``duplicate`` or ``rejected`` result so gateways know
+exactly which readings to resend.
+"""
+import json
+import logging
+import math
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Sensor, SensorData, TankLatestState, WaterTank
+from .signals import readings_ingested
+from . import calibration, dedup, ids, spool, state, validation, wire
+
+logger = logging.getLogger(__name__)
+
+# Measurement columns a gateway may send, in SensorData field order
+READING_FIELDS = [
+    'water_level_inches',
+    'water_level_percentage',
+    'water_temperature_f',
+    'ambient_temperature_f',
+    'ph_level',
+    'turbidity_ntu',
+    'dissolved_oxygen_ppm',
+    'conductivity_us_cm',
+    'flow_rate_gpm',
+    'total_flow_gallons',
+    'signal_strength',
+    'battery_voltage',
+]
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonlines')
+BINARY_CONTENT_TYPES = (wire.CONTENT_TYPE, 'application/octet-stream')
+
+
+class PayloadError(ValueError):
+    """Raised when a request body cannot be decoded into readings at all"""
+
+
+class InvalidReading(Exception):
+    """Raised when a single reading fails validation"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def parse_payload(body, content_type=''):
+    """Decode a JSON array, NDJSON or binary (see ``tanks.wire``) body into rows.
+
+    NDJSON lines that are not valid JSON are kept as ``InvalidReading``
+    instances so they are reported per row instead of failing the batch.
+    """
+    if content_type in BINARY_CONTENT_TYPES:
+        try:
+            return wire.decode_readings(body)
+        except wire.WireFormatError as exc:
+            raise PayloadError(str(exc))
+
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            raise PayloadError('Request body must be UTF-8 encoded')
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        return parse_lines(body.splitlines())
+
+    try:
+        data = json.loads(body)
+    except ValueError as exc:
+        # NDJSON sent without its content type still starts with "{"
+        if body.lstrip().startswith('{'):
+            return parse_lines(body.splitlines())
+        raise PayloadError(f'Invalid JSON: {exc}')
+
+    if isinstance(data, dict):
+        data = data['readings'] if 'readings' in data else [data]
+    if not isinstance(data, list):
+        raise PayloadError('Expected a JSON array of readings')
+    return data
+
+
+def parse_lines(lines):
+    """Decode an iterable of NDJSON lines, skipping blank ones"""
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError as exc:
+            rows.append(InvalidReading({'__all__': [f'Invalid JSON: {exc}']}))
+    return rows
+
+
+def _parse_uuid(value):
+    if isinstance(value, uuid.UUID):
+        return value
+    return uuid.UUID(str(value))
+
+
+def parse_timestamp(value):
+    """Parse an ISO-8601 string or epoch seconds into an aware datetime"""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        parsed = datetime.fromtimestamp(value, tz=dt_timezone.utc)
+    elif isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError('Enter a valid ISO-8601 date/time or epoch seconds.')
+    else:
+        raise ValueError('Enter a valid ISO-8601 date/time or epoch seconds.')
+
+    # Gateways are expected to report UTC
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _clean_field(name, value):
+    field = SensorData._meta.get_field(name)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValidationError('Expected a number.')
+    value = field.to_python(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValidationError('Expected a finite number.')
+    field.run_validators(value)
+    return value
+
+
+def normalize_reading(row):
+    """Validate one raw reading and return SensorData keyword arguments.
+
+    Only checks that can be done without the database happen here; tank
+    and sensor existence is resolved per chunk in ``ingest_readings``.
+    """
+    if isinstance(row, InvalidReading):
+        raise row
+    if not isinstance(row, dict):
+        raise InvalidReading({'__all__': ['Reading must be a JSON object']})
+
+    errors = {}
+    values = {}
+
+    try:
+        values['tank_id'] = _parse_uuid(row['tank'])
+    except KeyError:
+        errors['tank'] = ['This field is required.']
+    except (TypeError, ValueError, AttributeError):
+        errors['tank'] = ['Enter a valid UUID.']
+
+    sensor = row.get('sensor')
+    if sensor in (None, ''):
+        values['sensor_id'] = None
+    else:
+        try:
+            values['sensor_id'] = _parse_uuid(sensor)
+        except (TypeError, ValueError, AttributeError):
+            errors['sensor'] = ['Enter a valid UUID.']
+
+    if row.get('timestamp') is None:
+        errors['timestamp'] = ['This field is required.']
+    else:
+        try:
+            timestamp = parse_timestamp(row['timestamp'])
+        except (TypeError, ValueError, OverflowError, OSError) as exc:
+            errors['timestamp'] = [str(exc)]
+        else:
+            max_skew = timedelta(seconds=settings.SENSOR_INGEST_MAX_CLOCK_SKEW)
+            if timestamp > timezone.now() + max_skew:
+                errors['timestamp'] = ['Timestamp is in the future.']
+            values['timestamp'] = timestamp
+
+    for name in READING_FIELDS:
+        try:
+            values[name] = _clean_field(name, row.get(name))
+        except ValidationError as exc:
+            errors[name] = list(exc.messages)
+
+    if 'is_valid' in row:
+        if not isinstance(row['is_valid'], bool):
+            errors['is_valid'] = ['Expected true or false.']
+        else:
+            values['is_valid'] = row['is_valid']
+
+    if row.get('quality_flags') is not None:
+        if not isinstance(row['quality_flags'], dict):
+            errors['quality_flags'] = ['Expected a JSON object.']
+        else:
+            values['quality_flags'] = row['quality_flags']
+
+    if errors:
+        raise InvalidReading(errors)
+    return values
+
+
+def _accepted(index, reading_id, **extra):
+    return {'index': index, 'status': 'accepted', 'id': str(reading_id), **extra}
+
+
+def _rejected(index, errors, **extra):
+    return {'index': index, 'status': 'rejected', 'errors': errors, **extra}
+
+
+def _resolve_references(pending):
+    """Look up the tanks (with their capacity) and sensors referenced by a chunk in two queries"""
+    tank_ids = {values['tank_id'] for _, values in pending}
+    sensor_ids = {values['sensor_id'] for _, values in pending if values['sensor_id']}
+
+    known_tanks = dict(WaterTank.objects.filter(id__in=tank_ids).values_list('id', 'capacity_gallons'))
+    sensor_tanks = dict(Sensor.objects.filter(id__in=sensor_ids).values_list('id', 'tank_id')) if sensor_ids else {}
+    return known_tanks, sensor_tanks
+
+
+def _duplicate(index):
+    return {'index': index, 'status': 'duplicate'}
+
+
+def _write_chunk(pending, results):
+    """Store one chunk; any database failure marks the whole chunk retryable"""
+    try:
+        return _store_chunk(pending, results)
+    except DatabaseError:
+        logger.exception('Failed to write a chunk of %d sensor readings', len(pending))
+        for index, _ in pending:
+            results[index] = _rejected(
+                index, {'__all__': ['Database write failed, please retry.']}, retryable=True
+            )
+        return []
+
+
+def _store_chunk(pending, results):
+    known_tanks, sensor_tanks = _resolve_references(pending)
+
+    candidates = []
+    for index, values in pending:
+        if values['tank_id'] not in known_tanks:
+            results[index] = _rejected(index, {'tank': ['Unknown tank.']})
+            continue
+        sensor_id = values['sensor_id']
+        if sensor_id and sensor_tanks.get(sensor_id) != values['tank_id']:
+            results[index] = _rejected(index, {'sensor': ['Unknown sensor for this tank.']})
+            continue
+        candidates.append((index, values))
+
+    fresh, duplicates = dedup.split_duplicates(candidates)
+    for index in duplicates:
+        results[index] = _duplicate(index)
+    if not fresh:
+        return []
+
+    batch = [values for _, values in fresh]
+    # Spooled readings already carry the id returned to the gateway
+    for values, reading_id in zip(batch, ids.uuid7s(len(batch))):
+        values.setdefault('id', reading_id)
+
+    with transaction.atomic():
+        calibration.calibrate(batch)
+        # Quality checks see each tank's latest stored reading as context
+        previous = TankLatestState.objects.filter(tank_id__in={values['tank_id'] for values in batch})
+        validation.annotate(batch, known_tanks, previous)
+
+        readings = [SensorData(**values) for values in batch]
+        # Conflicts are duplicates that raced past the check above
+        SensorData.objects.bulk_create(readings, ignore_conflicts=True)
+        # bulk_create does not say which rows it skipped; a row holding
+        # our id and creation time is one this insert wrote
+        stored = dict(
+            SensorData.objects.filter(pk__in=[reading.pk for reading in readings])
+            .values_list('pk', 'created_at')
+        )
+        written = [stored.get(reading.pk) == reading.created_at for reading in readings]
+        inserted = [reading for reading, new in zip(readings, written) if new]
+        state.record(inserted)
+        if inserted:
+            transaction.on_commit(
+                lambda: readings_ingested.send(sender=SensorData, readings=inserted)
+            )
+
+    dedup.remember(values for _, values in fresh)
+    for (index, _), reading, new in zip(fresh, readings, written):
+        results[index] = _accepted(index, reading.pk) if new else _duplicate(index)
+    return inserted
+
+
+def validate_readings(rows):
+    """Normalize raw rows, returning ``(results, pending)``.
+
+    ``results`` has one slot per row, already filled in for rejected rows;
+    ``pending`` holds ``(index, values)`` pairs that still need storing.
+    """
+    results = [None] * len(rows)
+    pending = []
+    for index, row in enumerate(rows):
+        try:
+            pending.append((index, normalize_reading(row)))
+        except InvalidReading as exc:
+            results[index] = _rejected(index, exc.errors)
+    return results, pending
+
+
+def store_readings(pending, results, chunk_size=None):
+    """Write validated readings in chunks, filling in their ``results`` slots.
+
+    Readings already stored (same tank, sensor and timestamp) are reported
+    as ``duplicate``, which also makes replaying them harmless.
+    """
+    chunk_size = chunk_size or settings.SENSOR_INGEST_CHUNK_SIZE
+    for start in range(0, len(pending), chunk_size):
+        _write_chunk(pending[start:start + chunk_size], results)
+    return results
+
+
+def ingest_readings(rows, chunk_size=None):
+    """Validate and store raw readings, returning one result dict per row.
+
+    With SENSOR_SPOOL_ENABLED the readings are appended to the local spool
+    instead and written to the database later by ``replay_spool``.
+    """
+    results, pending = validate_readings(rows)
+
+    if settings.SENSOR_SPOOL_ENABLED:
+        # Only the in-process cache is consulted; the replay checks the database
+        pending, duplicates = dedup.split_duplicates(pending, check_database=False)
+        for index in duplicates:
+            results[index] = _duplicate(index)
+        for (index, values), reading_id in zip(pending, ids.uuid7s(len(pending))):
+            values['id'] = reading_id
+        spool.get_writer().append([values for _, values in pending])
+        dedup.remember(values for _, values in pending)
+        for index, values in pending:
+            results[index] = _accepted(index, values['id'], spooled=True)
+        return results
+
+    return store_readings(pending, results, chunk_size)
+
+
+def summarize(results):
+    """Build the response body returned to gateways"""
+    accepted = sum(1 for result in results if result['status'] == 'accepted')
+    duplicates = sum(1 for result in results if result['status'] == 'duplicate')
+    return {
+        'accepted': accepted,
+        'duplicates': duplicates,
+        'rejected': len(results) - accepted - duplicates,
+        'results': results,
+    }
@@ -0,0 +1,228 @@
+"""
+Asyncio socket listener for continuous gateway streams.
+
+Gateways hold a TCP connection open (or fire UDP datagrams) and send one
+JSON reading per line. UDP datagrams may instead carry binary frames (see
+``tanks.wire``). Lines are parsed on the event loop, queued in a
+bounded in-memory buffer and flushed to SensorData by ``ingest_readings``
+in size- or time-bounded batches on a single database thread.
+
+Backpressure: when the buffer is full TCP handlers stop reading from their
+sockets, so the kernel's flow control pushes back on the gateways. UDP has
+no flow control, so datagrams that arrive while the buffer is full are
+dropped and counted.
+
+A batch the database could not take (an outage, a failed chunk) is kept
+and retried with exponential backoff, capped at MAX_RETRY_BACKOFF, before
+anything new is read from the buffer; meanwhile the buffer fills and
+pushes back as above. Batches still failing at shutdown are dropped and
+counted so the process can exit; run with SENSOR_SPOOL_ENABLED to ride
+out longer outages on disk.
+"""
+import asyncio
+import json
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from .ingest import InvalidReading, ingest_readings
+from . import wire
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE_BYTES = 64 * 1024
+# Longest wait between attempts to write a batch while the database is down
+MAX_RETRY_BACKOFF = 30.0
+
+
+class ListenerStats:
+    """Counters reported periodically and on shutdown"""
+
+    def __init__(self):
+        self.connections = 0
+        self.received = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class IngestListener:
+    """Accept line-delimited readings over TCP/UDP and batch them into the database"""
+
+    def __init__(self, host='0.0.0.0', tcp_port=9000, udp_port=9001,
+                 batch_size=500, flush_interval=1.0, max_pending=20000, stats_interval=60):
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.stats_interval = stats_interval
+        self.stats = ListenerStats()
+
+        self._queue = None
+        self._stopping = None
+        self._writers = set()
+        # Django connections are per thread, so all writes go through one worker
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-db')
+
+    def decode_line(self, line):
+        """Turn one raw line into a reading dict (or an InvalidReading)"""
+        try:
+            return json.loads(line)
+        except ValueError as exc:
+            return InvalidReading({'__all__': [f'Invalid JSON: {exc}']})
+
+    async def run(self):
+        """Serve until SIGTERM/SIGINT, then drain the buffer and return"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._stopping = asyncio.Event()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._stopping.set)
+
+        servers = []
+        if self.tcp_port:
+            servers.append(await asyncio.start_server(
+                self._handle_tcp, self.host, self.tcp_port, limit=MAX_LINE_BYTES
+            ))
+            logger.info('Listening for TCP readings on %s:%s', self.host, self.tcp_port)
+        transport = None
+        if self.udp_port:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.host, self.udp_port)
+            )
+            logger.info('Listening for UDP readings on %s:%s', self.host, self.udp_port)
+
+        flusher = asyncio.ensure_future(self._flush_loop())
+        await self._stopping.wait()
+        logger.info('Shutting down, draining %d buffered readings', self._queue.qsize())
+
+        # Stop accepting new data, then let open handlers hand over what they hold
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+        if transport is not None:
+            transport.close()
+        for writer in list(self._writers):
+            writer.close()
+        while self._writers:
+            await asyncio.sleep(0.01)
+
+        await flusher
+        self._executor.shutdown(wait=True)
+        logger.info('Listener stopped: %s', self.stats.as_dict())
+
+    async def _handle_tcp(self, reader, writer):
+        self.stats.connections += 1
+        self._writers.add(writer)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    logger.warning('Closing %s: line exceeds %d bytes',
+                                   writer.get_extra_info('peername'), MAX_LINE_BYTES)
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                self.stats.received += 1
+                # Blocks while the buffer is full, which stops reading the socket
+                await self._queue.put(self.decode_line(line))
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _decode_datagram(self, data):
+        if wire.is_binary_payload(data):
+            try:
+                return wire.decode_readings(data)
+            except wire.WireFormatError as exc:
+                return [InvalidReading({'__all__': [str(exc)]})]
+        return [self.decode_line(line) for line in data.splitlines() if line.strip()]
+
+    def _handle_datagram(self, data):
+        for reading in self._decode_datagram(data):
+            self.stats.received += 1
+            try:
+                self._queue.put_nowait(reading)
+            except asyncio.QueueFull:
+                self.stats.dropped += 1
+
+    async def _next_batch(self):
+        """Wait for up to ``batch_size`` readings or ``flush_interval`` seconds"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        next_report = time.monotonic() + self.stats_interval
+        retry, backoff = [], self.flush_interval
+        while not (self._stopping.is_set() and not self._writers and self._queue.empty() and not retry):
+            batch = retry or await self._next_batch()
+            if batch:
+                # While this runs the buffer keeps filling and eventually pushes back
+                try:
+                    retry = await loop.run_in_executor(self._executor, self._write, batch)
+                except Exception:
+                    logger.exception('Failed to write %d readings', len(batch))
+                    retry = batch
+                if retry and self._stopping.is_set():
+                    logger.error('Dropping %d readings the database would not take at shutdown', len(retry))
+                    self.stats.dropped += len(retry)
+                    retry = []
+                elif retry:
+                    logger.warning('Retrying %d readings in %.1fs', len(retry), backoff)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+                else:
+                    backoff = self.flush_interval
+            if time.monotonic() >= next_report:
+                logger.info('Listener stats: %s, buffered=%d', self.stats.as_dict(), self._queue.qsize())
+                next_report = time.monotonic() + self.stats_interval
+
+    def _write(self, batch):
+        """Store a batch, returning the readings to try again (rejected as retryable)"""
+        close_old_connections()
+        results = ingest_readings(batch)
+        retry = [batch[result['index']] for result in results if result.get('retryable')]
+        rejected = sum(1 for result in results if result['status'] == 'rejected') - len(retry)
+        duplicates = sum(1 for result in results if result['status'] == 'duplicate')
+        self.stats.accepted += len(results) - rejected - duplicates - len(retry)
+        self.stats.duplicates += duplicates
+        self.stats.rejected += rejected
+        self.stats.flushes += 1
+        if rejected:
+            logger.warning('Rejected %d of %d readings', rejected, len(results))
+        return retry
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, listener):
+        self.listener = listener
+
+    def datagram_received(self, data, addr):
+        self.listener._handle_datagram(data)
@@ -0,0 +1,251 @@
+"""
+Battery and maintenance forecasts (``low_battery`` and ``maintenance_due`` alerts).
+
+``manage.py forecast_maintenance`` is a batch job meant to run a few
+times a day. Battery voltage arrives with each tank's readings and is
+rolled up per local day, so the forecast reads only the daily rollups of
+the last SENSOR_BATTERY_WINDOW_DAYS days, one row per tank and day. Every
+tank's daily mean voltage is fitted against time by ordinary least
+squares in one pass over NumPy arrays, accumulating the per-tank sums
+the fit needs with ``bincount``. Days before the last rise of more than
+SENSOR_BATTERY_REPLACED_JUMP volts (a battery swap) are left out.
+
+A tank whose fitted voltage reaches SENSOR_BATTERY_CUTOFF within
+SENSOR_BATTERY_LEAD_DAYS days, or already has, gets a ``low_battery``
+alert, as does a sensor whose ``battery_level`` is at most
+SENSOR_BATTERY_LOW_LEVEL percent. Sensors with ``next_maintenance``
+within SENSOR_MAINTENANCE_LEAD_DAYS days get a ``maintenance_due`` alert.
+Open alerts are left as they are, and resolved once their condition has
+cleared.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .alerting import store
+from .rollups import bucket_starts
+from .models import Alert, Sensor, SensorDataRollup, WaterTank
+
+logger = logging.getLogger(__name__)
+
+OPEN = ('active', 'acknowledged')
+# Forecasts this close to the cutoff are raised as high severity
+URGENT_DAYS = 3
+# Alerts handed to alerting.store at a time
+STORE_CHUNK = 1000
+SENSOR_TYPES = dict(Sensor.SENSOR_TYPE_CHOICES)
+
+
+def daily_voltages(start, end):
+    """Frame of ``tank_id``, ``day`` (UTC) and mean ``voltage`` from the daily rollups between ``start`` and ``end``.
+
+    Each day is fetched with a plain cursor and its own query, so neither
+    model instances nor per-row datetime conversion are involved.
+    """
+    days = bucket_starts(pd.date_range(start, end, freq='h'), 'day').unique()
+    frames = []
+    for day in days:
+        queryset = SensorDataRollup.objects.filter(
+            resolution='day', bucket_start=day.to_pydatetime(), battery_count__gt=0,
+        ).values_list('tank_id', 'battery_sum', 'battery_count')
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            frame = pd.DataFrame.from_records(cursor.fetchall(), columns=['tank_id', 'total', 'count'])
+        frame['day'] = day
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True)
+    frame['voltage'] = frame['total'].astype('float64') / frame['count'].astype('float64')
+    return frame[['tank_id', 'day', 'voltage']]
+
+
+def forecast(now=None, days=None):
+    """Fit every tank's voltage trend, returning a frame indexed by tank id.
+
+    Columns are ``points`` (days fitted), ``voltage`` (fitted at ``now``),
+    ``slope`` (volts per day) and ``days_left`` until the cutoff: 0 once
+    below it, infinite when not falling. Tanks with fewer than
+    SENSOR_BATTERY_MIN_DAYS days since their last battery swap, and inactive
+    tanks, are left out.
+    """
+    now = now or timezone.now()
+    days = days or settings.SENSOR_BATTERY_WINDOW_DAYS
+    columns = ['points', 'voltage', 'slope', 'days_left']
+    frame = daily_voltages(now - timedelta(days=days), now)
+    if frame.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='tank_id'))
+
+    tank_codes, tank_ids = pd.factorize(frame['tank_id'])
+    # Days from now to the middle of each bucket
+    x = ((frame['day'] - now).dt.total_seconds().to_numpy() / 86400) + 0.5
+    y = frame['voltage'].to_numpy()
+    order = np.lexsort((x, tank_codes))
+    tank_codes, x, y = tank_codes[order], x[order], y[order]
+
+    # Keep each tank's points from its last battery swap on
+    new_tank = np.r_[True, tank_codes[1:] != tank_codes[:-1]]
+    swapped = np.r_[False, (np.diff(y) > settings.SENSOR_BATTERY_REPLACED_JUMP) & ~new_tank[1:]]
+    segment = np.cumsum(new_tank | swapped)
+    group = np.cumsum(new_tank) - 1
+    group_tanks = tank_codes[new_tank]
+    last_segment = segment[np.r_[np.flatnonzero(new_tank[1:]), len(segment) - 1]]
+    keep = segment == last_segment[group]
+    group, x, y = group[keep], x[keep], y[keep]
+
+    size = int(group[-1]) + 1
+    n = np.bincount(group, minlength=size).astype('float64')
+    sx = np.bincount(group, x, minlength=size)
+    sy = np.bincount(group, y, minlength=size)
+    sxx = np.bincount(group, x * x, minlength=size)
+    sxy = np.bincount(group, x * y, minlength=size)
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+        voltage = (sy - slope * sx) / n
+        days_left = np.where(slope < 0, (settings.SENSOR_BATTERY_CUTOFF - voltage) / slope, np.inf)
+    days_left = np.where(voltage <= settings.SENSOR_BATTERY_CUTOFF, 0.0, days_left)
+
+    index = pd.Index([uuid.UUID(str(tank_id)) for tank_id in tank_ids[group_tanks]], name='tank_id')
+    result = pd.DataFrame({'points': n, 'voltage': voltage, 'slope': slope, 'days_left': days_left}, index=index)
+    # Filtered here rather than joined in the query, which would double its cost
+    inactive = set(WaterTank.objects.exclude(status='active').values_list('id', flat=True))
+    result = result[
+        (result['points'] >= settings.SENSOR_BATTERY_MIN_DAYS) & result['slope'].notna() & ~result.index.isin(inactive)
+    ]
+    result['points'] = result['points'].astype(int)
+    return result[columns]
+
+
+def open_alerts(alert_type):
+    """``{(tank_id, sensor_id): alert id}`` of the open alerts of ``alert_type``"""
+    return {
+        (tank_id, sensor_id): alert_id
+        for alert_id, tank_id, sensor_id in Alert.objects.filter(
+            alert_type=alert_type, status__in=OPEN,
+        ).values_list('id', 'tank_id', 'sensor_id')
+    }
+
+
+def battery_alerts(now, forecasts, opened):
+    """Keys of the tanks and sensors whose battery needs replacing, and Alerts for those not in ``opened``"""
+    cutoff = settings.SENSOR_BATTERY_CUTOFF
+    due = set()
+    alerts = []
+    flagged = forecasts[forecasts['days_left'] <= settings.SENSOR_BATTERY_LEAD_DAYS]
+    for tank_id, row in zip(flagged.index, flagged.itertuples(index=False)):
+        due.add((tank_id, None))
+        if (tank_id, None) in opened:
+            continue
+        if row.days_left <= 0:
+            message = f'Battery at {row.voltage:.2f} V, below the {cutoff:.2f} V cutoff.'
+        else:
+            crossing = timezone.localtime(now + timedelta(days=row.days_left))
+            message = (
+                f'Battery at {row.voltage:.2f} V and falling {-row.slope * 1000:.0f} mV/day; '
+                f'expected to reach {cutoff:.2f} V around {crossing:%Y-%m-%d}.'
+            )
+        alerts.append(Alert(
+            tank_id=tank_id,
+            alert_type='low_battery',
+            severity='high' if row.days_left <= URGENT_DAYS else 'medium',
+            title='Battery Running Low',
+            message=message,
+            threshold_value=cutoff,
+            actual_value=round(row.voltage, 3),
+        ))
+
+    sensors = Sensor.objects.filter(
+        battery_level__lte=settings.SENSOR_BATTERY_LOW_LEVEL, tank__status='active',
+    ).exclude(status='inactive').values_list('id', 'tank_id', 'sensor_type', 'battery_level')
+    for sensor_id, tank_id, sensor_type, battery_level in sensors.iterator(chunk_size=10000):
+        due.add((tank_id, sensor_id))
+        if (tank_id, sensor_id) in opened:
+            continue
+        alerts.append(Alert(
+            tank_id=tank_id,
+            sensor_id=sensor_id,
+            alert_type='low_battery',
+            severity='medium',
+            title='Sensor Battery Low',
+            message=f'{SENSOR_TYPES.get(sensor_type, sensor_type)} battery at {battery_level}%.',
+            threshold_value=settings.SENSOR_BATTERY_LOW_LEVEL,
+            actual_value=battery_level,
+        ))
+    return due, alerts
+
+
+def maintenance_alerts(now, opened):
+    """Keys of the sensors due for maintenance, and Alerts for those not in ``opened``"""
+    today = timezone.localdate(now)
+    horizon = today + timedelta(days=settings.SENSOR_MAINTENANCE_LEAD_DAYS)
+    sensors = Sensor.objects.filter(
+        next_maintenance__lte=horizon, tank__status='active',
+    ).exclude(status='inactive').values_list('id', 'tank_id', 'sensor_type', 'next_maintenance')
+    due = set()
+    alerts = []
+    for sensor_id, tank_id, sensor_type, next_maintenance in sensors.iterator(chunk_size=10000):
+        due.add((tank_id, sensor_id))
+        if (tank_id, sensor_id) in opened:
+            continue
+        overdue = next_maintenance < today
+        label = SENSOR_TYPES.get(sensor_type, sensor_type)
+        alerts.append(Alert(
+            tank_id=tank_id,
+            sensor_id=sensor_id,
+            alert_type='maintenance_due',
+            severity='high' if overdue else 'low',
+            title='Maintenance Overdue' if overdue else 'Maintenance Due',
+            message=f'{label} maintenance {"was due" if overdue else "is due"} on {next_maintenance:%Y-%m-%d}.',
+            actual_value=(next_maintenance - today).days,
+        ))
+    return due, alerts
+
+
+def sync(opened, due, alerts, now, covered=None):
+    """Store the new ``alerts`` and resolve the ``opened`` ones whose key is no longer ``due``.
+
+    ``covered(key)`` limits resolving to the keys that were evaluated.
+    Returns ``(raised, resolved)`` counts.
+    """
+    for start in range(0, len(alerts), STORE_CHUNK):
+        store(alerts[start:start + STORE_CHUNK], now)
+
+    cleared = [
+        alert_id for key, alert_id in opened.items()
+        if key not in due and (covered is None or covered(key))
+    ]
+    for start in range(0, len(cleared), STORE_CHUNK):
+        Alert.objects.filter(id__in=cleared[start:start + STORE_CHUNK], status__in=OPEN).update(
+            status='resolved', resolved_at=now,
+        )
+    return len(alerts), len(cleared)
+
+
+def run(now=None, days=None):
+    """Forecast, raise and resolve both alert types, returning counts and the battery forecasts"""
+    now = now or timezone.now()
+    forecasts = forecast(now, days)
+    fitted = set(forecasts.index)
+
+    opened = open_alerts('low_battery')
+    # Tank-level battery alerts are only resolved for tanks with a fresh fit
+    battery = sync(
+        opened, *battery_alerts(now, forecasts, opened), now,
+        covered=lambda key: key[1] is not None or key[0] in fitted,
+    )
+    opened = open_alerts('maintenance_due')
+    maintenance = sync(opened, *maintenance_alerts(now, opened), now)
+
+    logger.info('Battery: %d raised, %d resolved; maintenance: %d raised, %d resolved', *battery, *maintenance)
+    return {
+        'tanks': len(forecasts),
+        'low_battery': battery,
+        'maintenance_due': maintenance,
+        'forecasts': forecasts,
+    }
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+
+from tanks import archive
+from tanks.models import SensorData
+from tanks.partitions import add_months, month_start
+
+
+class Command(BaseCommand):
+    help = 'Move complete months of old sensor readings into per-tank columnar archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.SENSOR_ARCHIVE_AFTER_DAYS,
+                            help='Archive whole UTC months that ended at least this many days ago')
+        parser.add_argument('--tank', action='append', dest='tanks', metavar='UUID',
+                            help='Only archive this tank (repeatable)')
+        parser.add_argument('--compress', action='store_true', default=settings.SENSOR_ARCHIVE_COMPRESS,
+                            help='Write compressed .npz files instead of memory-mappable .npy columns')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = month_start(timezone.now() - timedelta(days=options['older_than_days']))
+        readings = SensorData.objects.filter(timestamp__lt=cutoff)
+        if options['tanks']:
+            readings = readings.filter(tank_id__in=options['tanks'])
+        oldest = readings.values('tank_id').annotate(first=Min('timestamp')).order_by('tank_id')
+
+        moved = 0
+        for row in oldest:
+            month = month_start(row['first'])
+            while month < cutoff:
+                if options['dry_run']:
+                    count = readings.filter(
+                        tank_id=row['tank_id'], timestamp__gte=month, timestamp__lt=add_months(month, 1)
+                    ).count()
+                else:
+                    count = archive.archive_month(row['tank_id'], month, options['compress'])
+                if count:
+                    self.stdout.write(f'{row["tank_id"]} {month:%Y-%m}: {count} readings')
+                moved += count
+                month = add_months(month, 1)
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} readings older than {cutoff:%Y-%m-%d}'))
@@ -0,0 +1,66 @@
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from tanks import anomaly
+
+
+class Command(BaseCommand):
+    help = 'Replay stored readings through the anomaly detector to compare sensitivity settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tank', action='append', dest='tanks', metavar='UUID',
+                            help='Only replay this tank (repeatable); default is every tank')
+        parser.add_argument('--days', type=int, default=30, help='Replay the last N days')
+        parser.add_argument('--since', help='First local date to replay (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last local date to replay (YYYY-MM-DD)')
+        parser.add_argument('--threshold', type=float, nargs='+',
+                            help='Standard deviations to try (several to compare)')
+        parser.add_argument('--alpha', type=float, help='EW weight of a new reading')
+        parser.add_argument('--hourly-alpha', type=float, help='EW weight of a new reading within its hour')
+        parser.add_argument('--min-samples', type=int, help='Readings before anything is flagged')
+        parser.add_argument('--leak-streak', type=int, help='Falling readings in a row before a leak alert')
+        parser.add_argument('--show', type=int, default=0, help='List the first N alerts of each run')
+
+    def parse_day(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date {value!r}; expected YYYY-MM-DD')
+        return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+    def handle(self, *args, **options):
+        start = timezone.now() - timedelta(days=options['days'])
+        end = None
+        if options['since']:
+            start = self.parse_day(options['since'])
+        if options['until']:
+            end = self.parse_day(options['until']) + timedelta(days=1)
+
+        for threshold in options['threshold'] or [None]:
+            sensitivity = anomaly.default_sensitivity(
+                threshold=threshold,
+                alpha=options['alpha'],
+                hourly_alpha=options['hourly_alpha'],
+                min_samples=options['min_samples'],
+                leak_streak=options['leak_streak'],
+            )
+            started = time.perf_counter()
+            counts, events = anomaly.backtest(tank_ids=options['tanks'], start=start, end=end, sensitivity=sensitivity)
+            self.stdout.write(
+                f'threshold {sensitivity.threshold:g}, alpha {sensitivity.alpha:g}/{sensitivity.hourly_alpha:g}, '
+                f'leak streak {sensitivity.leak_streak} ({time.perf_counter() - started:.1f}s)'
+            )
+            for name, row in counts.items():
+                rate = row['anomalous'] / row['readings'] if row['readings'] else 0
+                self.stdout.write(
+                    f'  {name:<13} {row["readings"]:>10,} readings {row["anomalous"]:>8,} anomalous '
+                    f'({rate:.2%}) {row["alerts"]:>6,} alerts'
+                )
+            for tank_id, name, timestamp, value, mean, std in events[:options['show']]:
+                self.stdout.write(
+                    f'    {timezone.localtime(timestamp):%Y-%m-%d %H:%M} {tank_id} {name}: '
+                    f'{value:.2f} vs {mean:.2f} ± {std:.2f}'
+                )
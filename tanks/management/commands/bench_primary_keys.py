@@ -0,0 +1,162 @@
+import io
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+from tanks import ids
+
+SCHEMES = ('uuid4', 'uuid7', 'bigint')
+
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput and primary key index size of UUID4, UUIDv7 and bigint keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Rows inserted per scheme (use 10000000 for a production-sized run)')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Rows per insert transaction')
+        parser.add_argument('--scheme', action='append', dest='schemes', choices=SCHEMES,
+                            help='Only benchmark this scheme (repeatable)')
+        parser.add_argument('--keep', action='store_true', help='Keep the scratch tables for inspection')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'Unsupported database backend: {connection.vendor}')
+
+        self.stdout.write(
+            f'{options["rows"]:,} rows per scheme in batches of {options["batch_size"]:,} on {connection.vendor}'
+        )
+        self.stdout.write(
+            f'{"scheme":8} {"rows/s":>12} {"last 10% rows/s":>16} {"pk index MB":>12} '
+            f'{"pk B/row":>9} {"table+indexes MB":>17}'
+        )
+        for scheme in options['schemes'] or SCHEMES:
+            table = f'bench_pk_{scheme}'
+            self.create_table(table, scheme)
+            try:
+                elapsed, tail_elapsed, tail_rows = self.fill(table, scheme, options)
+                index_bytes, total_bytes = self.sizes(table)
+            finally:
+                if not options['keep']:
+                    self.drop_table(table)
+
+            rows = options['rows']
+            self.stdout.write(
+                f'{scheme:8} {rows / elapsed:12,.0f} {tail_rows / tail_elapsed:16,.0f} '
+                f'{self.megabytes(index_bytes):>12} '
+                f'{index_bytes / rows if index_bytes else 0:9.1f} {self.megabytes(total_bytes):>17}'
+            )
+
+    def create_table(self, table, scheme):
+        uuid_type = 'uuid' if connection.vendor == 'postgresql' else 'char(32)'
+        if scheme == 'bigint':
+            key = ('bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY' if connection.vendor == 'postgresql'
+                   else 'integer PRIMARY KEY AUTOINCREMENT')
+        else:
+            key = f'{uuid_type} NOT NULL PRIMARY KEY'
+        self.drop_table(table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE {connection.ops.quote_name(table)} ('
+                f'id {key}, tank_id {uuid_type} NOT NULL, '
+                f'timestamp {"timestamptz" if connection.vendor == "postgresql" else "datetime"} NOT NULL, '
+                f'value double precision)'
+            )
+
+    def drop_table(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {connection.ops.quote_name(table)}')
+
+    def fill(self, table, scheme, options):
+        """Insert the rows, returning total seconds and the seconds and rows of the last 10%"""
+        rng = random.Random(options['seed'])
+        native_uuid = connection.features.has_native_uuid_field
+        db_uuid = str if native_uuid else (lambda value: value.hex)
+        tanks = [db_uuid(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(1000)]
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+        rows, batch_size = options['rows'], options['batch_size']
+        tail_from = rows - max(batch_size, rows // 10)
+        elapsed = tail_elapsed = 0.0
+        tail_rows = 0
+        for offset in range(0, rows, batch_size):
+            count = min(batch_size, rows - offset)
+            # Keys are generated before the clock starts; only the inserts are timed
+            if scheme == 'uuid4':
+                keys = [db_uuid(uuid.uuid4()) for _ in range(count)]
+            elif scheme == 'uuid7':
+                keys = [db_uuid(key) for key in ids.uuid7s(count)]
+            else:
+                keys = None
+            batch = [
+                (tanks[(offset + i) % len(tanks)], start + timedelta(seconds=offset + i), rng.random())
+                for i in range(count)
+            ]
+
+            started = time.perf_counter()
+            self.insert(table, keys, batch)
+            took = time.perf_counter() - started
+            elapsed += took
+            if offset >= tail_from:
+                tail_elapsed += took
+                tail_rows += count
+        return elapsed, tail_elapsed, tail_rows
+
+    def insert(self, table, keys, batch):
+        names = ['tank_id', 'timestamp', 'value']
+        if keys is not None:
+            names.insert(0, 'id')
+            batch = [(key, *row) for key, row in zip(keys, batch)]
+        quoted = connection.ops.quote_name(table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                for row in batch:
+                    buffer.write(','.join(value.isoformat() if isinstance(value, datetime) else str(value)
+                                          for value in row) + '\n')
+                buffer.seek(0)
+                cursor.copy_expert(f'COPY {quoted} ({", ".join(names)}) FROM STDIN WITH (FORMAT csv)', buffer)
+            else:
+                adapt = connection.ops.adapt_datetimefield_value
+                cursor.executemany(
+                    f'INSERT INTO {quoted} ({", ".join(names)}) VALUES ({", ".join(["%s"] * len(names))})',
+                    [tuple(adapt(value) if isinstance(value, datetime) else value for value in row)
+                     for row in batch],
+                )
+
+    def sizes(self, table):
+        """``(primary key index bytes, table plus index bytes)``, None where unknown"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT pg_relation_size(indexrelid) FROM pg_index '
+                    'WHERE indrelid = %s::regclass AND indisprimary',
+                    [table],
+                )
+                index_bytes = cursor.fetchone()[0]
+                cursor.execute('SELECT pg_total_relation_size(%s::regclass)', [table])
+                return index_bytes, cursor.fetchone()[0]
+
+            # dbstat is only there when SQLite was built with SQLITE_ENABLE_DBSTAT_VTAB
+            try:
+                cursor.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')
+            except DatabaseError:
+                return None, None
+            sizes = dict(cursor.fetchall())
+            cursor.execute(
+                "SELECT name, type FROM sqlite_master WHERE tbl_name = %s AND type IN ('table', 'index')",
+                [table],
+            )
+            objects = dict(cursor.fetchall())
+        autoindex = [name for name, kind in objects.items() if kind == 'index' and name.startswith('sqlite_autoindex')]
+        # An INTEGER PRIMARY KEY is the rowid, i.e. the table b-tree itself
+        index_bytes = sizes.get(autoindex[0]) if autoindex else sizes.get(table)
+        return index_bytes, sum(sizes.get(name, 0) for name in objects)
+
+    def megabytes(self, value):
+        return 'n/a' if value is None else f'{value / 2**20:.1f}'
@@ -0,0 +1,83 @@
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+
+from tanks import wire
+
+
+class Command(BaseCommand):
+    help = 'Compare decode throughput of the binary wire format against json.loads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, default=50000, help='Readings per payload')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per format (best is reported)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        readings = self.make_readings(rng, options['readings'])
+
+        json_payload = json.dumps([
+            {**reading, 'tank': str(reading['tank']), 'sensor': str(reading['sensor']),
+             'timestamp': reading['timestamp'].isoformat()}
+            for reading in readings
+        ]).encode()
+        binary_payload = wire.encode_readings(readings)
+
+        # Round trip sanity check before timing anything
+        decoded = wire.decode_readings(binary_payload)
+        assert len(decoded) == len(readings)
+        assert decoded[0]['tank'] == readings[0]['tank']
+        assert decoded[0]['signal_strength'] == readings[0]['signal_strength']
+
+        results = [
+            ('json.loads', json_payload, json.loads),
+            ('wire.decode_readings', binary_payload, wire.decode_readings),
+            ('wire.iter_records (raw tuples)', binary_payload,
+             lambda payload: sum(1 for _ in wire.iter_records(payload))),
+        ]
+
+        count = len(readings)
+        self.stdout.write(f'{count} readings, best of {options["repeat"]} runs')
+        for label, payload, decode in results:
+            best = min(self.time_once(decode, payload) for _ in range(options['repeat']))
+            self.stdout.write(
+                f'{label:32} {len(payload) / count:7.1f} B/reading '
+                f'{count / best:12,.0f} readings/s'
+            )
+
+    def time_once(self, decode, payload):
+        started = time.perf_counter()
+        decode(payload)
+        return time.perf_counter() - started
+
+    def make_readings(self, rng, count):
+        tanks = [(uuid.uuid4(), uuid.uuid4()) for _ in range(100)]
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        readings = []
+        for i in range(count):
+            tank, sensor = tanks[i % len(tanks)]
+            level = rng.uniform(5, 95)
+            readings.append({
+                'tank': tank,
+                'sensor': sensor,
+                'timestamp': start + timedelta(seconds=i),
+                'water_level_inches': level * 1.2,
+                'water_level_percentage': level,
+                'water_temperature_f': rng.uniform(40, 75),
+                'ambient_temperature_f': rng.uniform(20, 95),
+                'ph_level': rng.uniform(6, 9),
+                'turbidity_ntu': rng.uniform(0.1, 2.0),
+                'dissolved_oxygen_ppm': rng.uniform(6, 12),
+                'conductivity_us_cm': rng.uniform(200, 800),
+                'flow_rate_gpm': rng.uniform(0, 50) if rng.random() > 0.7 else None,
+                'total_flow_gallons': None,
+                'signal_strength': rng.randint(40, 100),
+                'battery_voltage': rng.uniform(3.2, 4.2),
+                'is_valid': True,
+            })
+        return readings
@@ -0,0 +1,49 @@
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tanks.offline import OfflineDetector
+
+
+class Command(BaseCommand):
+    help = 'Raise and resolve sensor_offline alerts as tanks and sensors miss their report deadlines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=int, default=settings.SENSOR_OFFLINE_AFTER,
+                            help='Seconds without a reading before a device is offline')
+        parser.add_argument('--poll', type=float, default=settings.SENSOR_OFFLINE_POLL,
+                            help='Seconds between polls for new readings')
+        parser.add_argument('--reload', type=float, default=settings.SENSOR_OFFLINE_RELOAD,
+                            help='Seconds between full reloads of the tracked devices')
+        parser.add_argument('--once', action='store_true',
+                            help='Fire the deadlines that have already passed and exit')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+        detector = OfflineDetector(options['timeout'])
+        if options['once']:
+            started = time.perf_counter()
+            detector.load()
+            detector.poll()
+            detector.fire_due()
+            stats = detector.stats()
+            self.stdout.write(self.style.SUCCESS(
+                f'{stats["devices"]} devices checked in {time.perf_counter() - started:.2f}s, '
+                f'{stats["fired"]} went offline, {stats["recovered"]} recovered, {stats["offline"]} offline'
+            ))
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        detector.run(stop, options['poll'], options['reload'])
+
+        stats = detector.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Detector stopped: {stats["fired"]} went offline, {stats["recovered"]} recovered'
+        ))
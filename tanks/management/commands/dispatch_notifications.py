@@ -0,0 +1,37 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tanks import notifications
+
+
+class Command(BaseCommand):
+    help = 'Send email and SMS notifications for new alerts, with digests and retries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.SENSOR_NOTIFY_INTERVAL,
+                            help='Seconds between passes')
+        parser.add_argument('--batch-size', type=int, default=settings.SENSOR_NOTIFY_BATCH_SIZE,
+                            help='Alerts and messages handled per pass')
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single pass and exit')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+        if options['once']:
+            claimed, composed = notifications.collect(options['batch_size'])
+            sent, failed = notifications.deliver(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{claimed} alerts, {composed} notifications composed, {sent} sent, {failed} failed'
+            ))
+            return
+
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        notifications.run(stop, options['interval'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Dispatcher stopped'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tanks import maintenance
+
+
+class Command(BaseCommand):
+    help = 'Forecast battery drain and maintenance dates, raising low_battery and maintenance_due alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Fit the last N daily rollups (default SENSOR_BATTERY_WINDOW_DAYS)')
+        parser.add_argument('--show', type=int, default=0, metavar='N',
+                            help='Print the N tanks closest to the battery cutoff')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = maintenance.run(days=options['days'])
+        elapsed = time.perf_counter() - started
+
+        if options['show']:
+            forecasts = result['forecasts'].sort_values('days_left').head(options['show'])
+            for tank_id, row in zip(forecasts.index, forecasts.itertuples(index=False)):
+                self.stdout.write(
+                    f'{tank_id}  {row.voltage:.3f} V  {row.slope * 1000:+.1f} mV/day  '
+                    f'{row.days_left:.1f} days left ({row.points} days fitted)'
+                )
+        raised, resolved = result['low_battery']
+        due, done = result['maintenance_due']
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["tanks"]:,} tanks forecast in {elapsed:.2f}s: '
+            f'low_battery {raised} raised, {resolved} resolved; '
+            f'maintenance_due {due} raised, {done} resolved'
+        ))
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tanks.listener import IngestListener
+
+
+class Command(BaseCommand):
+    help = 'Run a long-lived TCP/UDP listener that batches gateway readings into SensorData'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0', help='Address to bind')
+        parser.add_argument('--tcp-port', type=int, default=9000, help='TCP port (0 disables TCP)')
+        parser.add_argument('--udp-port', type=int, default=9001, help='UDP port (0 disables UDP)')
+        parser.add_argument('--batch-size', type=int, default=settings.SENSOR_INGEST_CHUNK_SIZE,
+                            help='Flush once this many readings are buffered')
+        parser.add_argument('--flush-interval', type=float, default=1.0,
+                            help='Flush at least this often, in seconds')
+        parser.add_argument('--max-pending', type=int, default=20000,
+                            help='Buffered readings before TCP clients are throttled and UDP is dropped')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+        listener = IngestListener(
+            host=options['host'],
+            tcp_port=options['tcp_port'],
+            udp_port=options['udp_port'],
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_interval'],
+            max_pending=options['max_pending'],
+        )
+        asyncio.run(listener.run())
+
+        stats = listener.stats
+        self.stdout.write(self.style.SUCCESS(
+            f'Listener stopped: {stats.received} received, {stats.accepted} accepted, '
+            f'{stats.duplicates} duplicates, {stats.rejected} rejected, {stats.dropped} dropped'
+        ))
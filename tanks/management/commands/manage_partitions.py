@@ -0,0 +1,56 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from tanks import partitions
+from tanks.models import SensorData
+
+
+class Command(BaseCommand):
+    help = 'Pre-create monthly SensorData partitions and detach or drop expired ones (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.SENSOR_PARTITION_MONTHS_AHEAD,
+                            help='Months of future partitions to keep ready')
+        parser.add_argument('--retain-months', type=int, default=settings.SENSOR_DATA_RETENTION_MONTHS,
+                            help='Detach partitions older than this many months (0 keeps everything)')
+        parser.add_argument('--drop', action='store_true', help='Drop expired partitions instead of only detaching them')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported(connection):
+            self.stdout.write(f'Partitioning is only used on PostgreSQL; nothing to do on {connection.vendor}.')
+            return
+        if not partitions.is_partitioned(connection):
+            raise CommandError('tanks_sensordata is not partitioned yet; run "manage.py migrate tanks" first')
+
+        current = partitions.month_start(datetime.now(dt_timezone.utc))
+        existing = partitions.list_partitions(connection)
+
+        # Upcoming months, plus any month whose rows landed in the default partition
+        wanted = {partitions.add_months(current, offset) for offset in range(options['ahead'] + 1)}
+        wanted.update(partitions.default_partition_months(connection))
+        for month in sorted(wanted - set(existing)):
+            name = partitions.partition_name(SensorData._meta.db_table, month)
+            if not options['dry_run']:
+                with transaction.atomic():
+                    name = partitions.create_partition(connection, month)
+                existing[month] = name
+            self.stdout.write(f'Created {name}')
+
+        if options['retain_months'] > 0:
+            cutoff = partitions.add_months(current, -options['retain_months'])
+            action = 'Dropped' if options['drop'] else 'Detached'
+            for month, name in sorted(existing.items()):
+                if month >= cutoff:
+                    break
+                if not options['dry_run']:
+                    with transaction.atomic():
+                        partitions.detach_partition(connection, name, drop=options['drop'])
+                self.stdout.write(f'{action} {name}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(partitions.list_partitions(connection))} monthly partitions attached'
+        ))
@@ -1,17 +1,132 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.constants import OnConflict
 from django.utils import timezone
-from datetime import timedelta, date
+from datetime import date
+from operator import attrgetter
+import io
+import json
 import random
+import uuid
+import numpy as np
+import pandas as pd
+from tanks import ids, recent, rollups, state, validation
 from tanks.models import WaterTank, Sensor, SensorData, Alert
 
 
+# Hand-written tanks that always come first; larger fleets are synthesized
+TANK_DATA = [
+    {
+        'name': 'Manhattan Tower A',
+        'location': '123 Broadway, New York, NY 10001',
+        'borough': 'manhattan',
+        'tank_type': 'rooftop',
+        'capacity_gallons': 50000,
+        'building_name': 'Broadway Tower',
+        'building_owner': 'NYC Properties LLC',
+        'contact_email': 'manager@nycproperties.com',
+        'contact_phone': '+1 (212) 555-0101',
+        'latitude': 40.7589,
+        'longitude': -73.9851,
+    },
+    {
+        'name': 'Brooklyn Heights Tank 1',
+        'location': '456 Hicks Street, Brooklyn, NY 11201',
+        'borough': 'brooklyn',
+        'tank_type': 'rooftop',
+        'capacity_gallons': 35000,
+        'building_name': 'Heights Residential',
+        'building_owner': 'Brooklyn Housing Corp',
+        'contact_email': 'maintenance@brooklynhousing.com',
+        'contact_phone': '+1 (718) 555-0102',
+        'latitude': 40.6962,
+        'longitude': -73.9936,
+    },
+    {
+        'name': 'Queens Industrial Tank',
+        'location': '789 Northern Blvd, Queens, NY 11372',
+        'borough': 'queens',
+        'tank_type': 'ground',
+        'capacity_gallons': 100000,
+        'building_name': 'Industrial Complex B',
+        'building_owner': 'Queens Industrial Partners',
+        'contact_email': 'ops@queensindustrial.com',
+        'contact_phone': '+1 (718) 555-0103',
+        'latitude': 40.7505,
+        'longitude': -73.8776,
+    },
+    {
+        'name': 'Bronx Hospital Tank',
+        'location': '321 Grand Concourse, Bronx, NY 10451',
+        'borough': 'bronx',
+        'tank_type': 'elevated',
+        'capacity_gallons': 75000,
+        'building_name': 'Bronx Medical Center',
+        'building_owner': 'NYC Health System',
+        'contact_email': 'facilities@bronxmedical.org',
+        'contact_phone': '+1 (718) 555-0104',
+        'latitude': 40.8176,
+        'longitude': -73.9276,
+    },
+    {
+        'name': 'Staten Island Residential',
+        'location': '654 Victory Blvd, Staten Island, NY 10301',
+        'borough': 'staten_island',
+        'tank_type': 'basement',
+        'capacity_gallons': 25000,
+        'building_name': 'Victory Apartments',
+        'building_owner': 'SI Residential Management',
+        'contact_email': 'super@victoryapts.com',
+        'contact_phone': '+1 (718) 555-0105',
+        'latitude': 40.6501,
+        'longitude': -74.1134,
+    },
+]
+
+# Rough bounding boxes (lat, lon) for synthesized tanks
+BOROUGH_BOUNDS = {
+    'manhattan': ((40.70, 40.87), (-74.02, -73.91)),
+    'brooklyn': ((40.57, 40.74), (-74.04, -73.86)),
+    'queens': ((40.54, 40.80), (-73.96, -73.70)),
+    'bronx': ((40.79, 40.92), (-73.93, -73.75)),
+    'staten_island': ((40.50, 40.65), (-74.26, -74.05)),
+}
+
+SENSOR_TYPES = [choice for choice, _ in Sensor.SENSOR_TYPE_CHOICES]
+
+# Columns written for every generated reading
+MEASUREMENT_COLUMNS = [
+    'water_level_inches', 'water_level_percentage', 'water_temperature_f',
+    'ambient_temperature_f', 'ph_level', 'turbidity_ntu', 'dissolved_oxygen_ppm',
+    'conductivity_us_cm', 'flow_rate_gpm', 'total_flow_gallons', 'signal_strength',
+    'battery_voltage',
+]
+
+
 class Command(BaseCommand):
-    help = 'Populate database with sample water tank data'
+    help = 'Populate database with sample water tank data (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tanks', type=int, default=5, help='Number of tanks')
+        parser.add_argument('--days', type=int, default=30, help='Days of history to generate')
+        parser.add_argument('--interval', type=int, default=60, help='Minutes between readings')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible datasets')
+        parser.add_argument('--sensors-per-tank', type=int, default=4,
+                            help=f'Sensors per tank (at most {len(SENSOR_TYPES)})')
+        parser.add_argument('--chunk-size', type=int, default=200000,
+                            help='Readings generated and written per chunk')
+        parser.add_argument('--dropout-rate', type=float, default=0.01,
+                            help='Fraction of readings that never arrive')
+        parser.add_argument('--invalid-rate', type=float, default=0.02,
+                            help='Fraction of readings given a level spike')
 
     def handle(self, *args, **options):
         self.stdout.write('Creating sample water tank data...')
-        
+        self.rng = random.Random(options['seed'])
+
         # Get or create admin user
         admin_user, created = User.objects.get_or_create(
             username='admin',
@@ -21,158 +136,307 @@ class Command(BaseCommand):
                 'is_superuser': True,
             }
         )
-        
-        # Sample tank data
-        tank_data = [
-            {
-                'name': 'Manhattan Tower A',
-                'location': '123 Broadway, New York, NY 10001',
-                'borough': 'manhattan',
-                'tank_type': 'rooftop',
-                'capacity_gallons': 50000,
-                'building_name': 'Broadway Tower',
-                'building_owner': 'NYC Properties LLC',
-                'contact_email': 'manager@nycproperties.com',
-                'contact_phone': '+1 (212) 555-0101',
-                'latitude': 40.7589,
-                'longitude': -73.9851,
-            },
-            {
-                'name': 'Brooklyn Heights Tank 1',
-                'location': '456 Hicks Street, Brooklyn, NY 11201',
-                'borough': 'brooklyn',
-                'tank_type': 'rooftop',
-                'capacity_gallons': 35000,
-                'building_name': 'Heights Residential',
-                'building_owner': 'Brooklyn Housing Corp',
-                'contact_email': 'maintenance@brooklynhousing.com',
-                'contact_phone': '+1 (718) 555-0102',
-                'latitude': 40.6962,
-                'longitude': -73.9936,
-            },
-            {
-                'name': 'Queens Industrial Tank',
-                'location': '789 Northern Blvd, Queens, NY 11372',
-                'borough': 'queens',
-                'tank_type': 'ground',
-                'capacity_gallons': 100000,
-                'building_name': 'Industrial Complex B',
-                'building_owner': 'Queens Industrial Partners',
-                'contact_email': 'ops@queensindustrial.com',
-                'contact_phone': '+1 (718) 555-0103',
-                'latitude': 40.7505,
-                'longitude': -73.8776,
-            },
-            {
-                'name': 'Bronx Hospital Tank',
-                'location': '321 Grand Concourse, Bronx, NY 10451',
-                'borough': 'bronx',
-                'tank_type': 'elevated',
-                'capacity_gallons': 75000,
-                'building_name': 'Bronx Medical Center',
-                'building_owner': 'NYC Health System',
-                'contact_email': 'facilities@bronxmedical.org',
-                'contact_phone': '+1 (718) 555-0104',
-                'latitude': 40.8176,
-                'longitude': -73.9276,
-            },
-            {
-                'name': 'Staten Island Residential',
-                'location': '654 Victory Blvd, Staten Island, NY 10301',
-                'borough': 'staten_island',
-                'tank_type': 'basement',
-                'capacity_gallons': 25000,
-                'building_name': 'Victory Apartments',
-                'building_owner': 'SI Residential Management',
-                'contact_email': 'super@victoryapts.com',
-                'contact_phone': '+1 (718) 555-0105',
-                'latitude': 40.6501,
-                'longitude': -74.1134,
-            },
-        ]
-        
-        # Create tanks
-        tanks = []
-        for tank_info in tank_data:
-            tank, created = WaterTank.objects.get_or_create(
-                name=tank_info['name'],
-                defaults={
-                    **tank_info,
-                    'installation_date': date(2020, 1, 1),
-                    'status': random.choice(['active', 'active', 'active', 'maintenance']),
-                    'created_by': admin_user,
-                }
+
+        tanks = self.create_tanks(options['tanks'], admin_user)
+        self.create_sensors(tanks, min(options['sensors_per_tank'], len(SENSOR_TYPES)))
+
+        self.stdout.write('Generating sensor data...')
+        created_readings = self.generate_readings(tanks, options)
+
+        self.create_alerts(tanks)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully populated sample data:\n'
+                f'- {len(tanks)} water tanks\n'
+                f'- {Sensor.objects.count()} sensors\n'
+                f'- {created_readings} new sensor readings ({SensorData.objects.count()} total)\n'
+                f'- {Alert.objects.count()} alerts'
             )
-            tanks.append(tank)
-            if created:
-                self.stdout.write(f'Created tank: {tank.name}')
-        
-        # Create sensors for each tank
-        sensor_types = ['level', 'temperature', 'ph', 'turbidity']
-        for tank in tanks:
+        )
+
+    def tank_definitions(self, count):
+        """Hand-written tanks first, then deterministic synthetic ones"""
+        definitions = [dict(tank) for tank in TANK_DATA[:count]]
+        boroughs = list(BOROUGH_BOUNDS)
+        tank_types = [choice for choice, _ in WaterTank.TANK_TYPE_CHOICES]
+
+        for number in range(len(definitions) + 1, count + 1):
+            borough = self.rng.choice(boroughs)
+            (lat_min, lat_max), (lon_min, lon_max) = BOROUGH_BOUNDS[borough]
+            definitions.append({
+                'name': f'Sample Tank {number:05d}',
+                'location': f'{self.rng.randint(1, 999)} Sample Street, New York, NY',
+                'borough': borough,
+                'tank_type': self.rng.choice(tank_types),
+                'capacity_gallons': self.rng.choice([10000, 20000, 25000, 35000, 50000, 75000, 100000]),
+                'building_name': f'Sample Building {number:05d}',
+                'latitude': round(self.rng.uniform(lat_min, lat_max), 6),
+                'longitude': round(self.rng.uniform(lon_min, lon_max), 6),
+            })
+        return definitions
+
+    def create_tanks(self, count, admin_user):
+        definitions = self.tank_definitions(count)
+        names = [definition['name'] for definition in definitions]
+        existing = {tank.name: tank for tank in WaterTank.objects.filter(name__in=names)}
+
+        missing = []
+        for definition in definitions:
+            status = self.rng.choice(['active', 'active', 'active', 'maintenance'])
+            if definition['name'] not in existing:
+                missing.append(WaterTank(
+                    **definition,
+                    installation_date=date(2020, 1, 1),
+                    status=status,
+                    created_by=admin_user,
+                ))
+        WaterTank.objects.bulk_create(missing, batch_size=1000)
+        if missing:
+            self.stdout.write(f'Created {len(missing)} tanks')
+
+        existing.update((tank.name, tank) for tank in missing)
+        return [existing[name] for name in names]
+
+    def create_sensors(self, tanks, per_tank):
+        sensor_types = SENSOR_TYPES[:per_tank]
+        existing = set(
+            Sensor.objects.filter(tank__in=tanks).values_list('tank_id', 'sensor_type')
+        )
+
+        missing = []
+        for index, tank in enumerate(tanks, start=1):
             for sensor_type in sensor_types:
-                sensor, created = Sensor.objects.get_or_create(
+                status = self.rng.choice(['active', 'active', 'active', 'low_battery'])
+                battery_level = self.rng.randint(20, 100)
+                offset = self.rng.uniform(-0.5, 0.5)
+                if (tank.id, sensor_type) in existing:
+                    continue
+                missing.append(Sensor(
                     tank=tank,
                     sensor_type=sensor_type,
-                    defaults={
-                        'model_number': f'SEN-{sensor_type.upper()}-2024',
-                        'serial_number': f'{tank.name[:3].upper()}-{sensor_type.upper()}-{random.randint(1000, 9999)}',
-                        'installation_date': date(2020, 1, 15),
-                        'status': random.choice(['active', 'active', 'active', 'low_battery']),
-                        'battery_level': random.randint(20, 100),
-                        'calibration_offset': random.uniform(-0.5, 0.5),
-                    }
-                )
-                if created:
-                    self.stdout.write(f'Created sensor: {sensor}')
-        
-        # Generate sensor data for the last 30 days
-        self.stdout.write('Generating sensor data...')
-        start_date = timezone.now() - timedelta(days=30)
-        
-        for tank in tanks:
-            # Generate data points every hour for the last 30 days
-            current_time = start_date
-            base_level = random.uniform(30, 80)  # Base water level percentage
-            base_temp = random.uniform(45, 65)   # Base temperature in Fahrenheit
-            base_ph = random.uniform(6.5, 8.5)   # Base pH level
-            
-            while current_time <= timezone.now():
-                # Add some realistic variation
-                level_variation = random.uniform(-5, 5)
-                temp_variation = random.uniform(-3, 3)
-                ph_variation = random.uniform(-0.3, 0.3)
-                
-                water_level = max(0, min(100, base_level + level_variation))
-                water_temp = base_temp + temp_variation
-                ph_level = max(0, min(14, base_ph + ph_variation))
-                
-                # Simulate some tank usage patterns (lower levels during day)
-                hour = current_time.hour
-                if 6 <= hour <= 22:  # Daytime usage
-                    water_level *= random.uniform(0.85, 0.95)
-                
-                SensorData.objects.create(
-                    tank=tank,
-                    timestamp=current_time,
-                    water_level_percentage=water_level,
-                    water_level_inches=water_level * tank.capacity_gallons / 1000,  # Rough conversion
-                    water_temperature_f=water_temp,
-                    ambient_temperature_f=water_temp + random.uniform(-5, 10),
-                    ph_level=ph_level,
-                    turbidity_ntu=random.uniform(0.1, 2.0),
-                    dissolved_oxygen_ppm=random.uniform(6.0, 12.0),
-                    conductivity_us_cm=random.uniform(200, 800),
-                    flow_rate_gpm=random.uniform(0, 50) if random.random() > 0.7 else 0,
-                    signal_strength=random.randint(70, 100),
-                    battery_voltage=random.uniform(3.2, 4.2),
-                    is_valid=random.random() > 0.05,  # 95% valid data
-                )
-                
-                current_time += timedelta(hours=1)
-        
-        # Create some sample alerts
-        self.stdout.write('Creating sample alerts...')
+                    model_number=f'SEN-{sensor_type.upper()}-2024',
+                    serial_number=f'SMP{index:05d}-{sensor_type.upper()}',
+                    installation_date=date(2020, 1, 15),
+                    status=status,
+                    battery_level=battery_level,
+                    calibration_offset=offset,
+                ))
+        Sensor.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+        if missing:
+            self.stdout.write(f'Created {len(missing)} sensors')
+
+    def time_grid(self, days, interval_minutes):
+        """Interval-aligned UTC timestamps (epoch seconds) ending at now.
+
+        Aligning to the interval means re-runs land on the same grid and only
+        fill in readings newer than what is already stored.
+        """
+        step = interval_minutes * 60
+        end = int(timezone.now().timestamp()) // step * step
+        count = days * 24 * 60 // interval_minutes
+        return end - step * np.arange(count, -1, -1, dtype=np.int64)
+
+    def generate_readings(self, tanks, options):
+        epochs = self.time_grid(options['days'], options['interval'])
+        if not len(epochs) or not tanks:
+            return 0
+
+        times = pd.to_datetime(epochs, unit='s', utc=True)
+        local = times.tz_convert(settings.TIME_ZONE)
+        hours = np.asarray(local.hour + local.minute / 60.0, dtype=np.float64)
+        days_elapsed = (epochs - epochs[0]) / 86400.0
+
+        rng = np.random.default_rng(options['seed'])
+        block = max(1, options['chunk_size'] // len(epochs))
+        created = 0
+
+        for start in range(0, len(tanks), block):
+            block_tanks = tanks[start:start + block]
+            latest = dict(
+                SensorData.objects.filter(tank__in=block_tanks)
+                .values_list('tank_id')
+                .annotate(latest=Max('timestamp'))
+            )
+            sensors = {}
+            for tank_id, sensor_id in (
+                Sensor.objects.filter(tank__in=block_tanks).order_by('sensor_type').values_list('tank_id', 'id')
+            ):
+                sensors.setdefault(tank_id, []).append(str(sensor_id))
+            frame = self.generate_block(
+                block_tanks, sensors, latest, epochs, times, hours, days_elapsed, options, rng
+            )
+            if frame is not None:
+                self.write_frame(frame)
+                # Bulk writes bypass ingest, so refresh what it normally keeps current
+                tank_ids = [tank.id for tank in block_tanks]
+                rollups.rebuild(tank_ids=tank_ids, start=frame['timestamp'].min().to_pydatetime())
+                state.refresh(tank_ids)
+                recent.invalidate(tank_ids)
+                created += len(frame)
+                self.stdout.write(f'  {start + len(block_tanks)}/{len(tanks)} tanks, {created} readings')
+
+        return created
+
+    def generate_block(self, tanks, sensors, latest, epochs, times, hours, days_elapsed, options, rng):
+        """Vectorized series for a block of tanks, as a DataFrame of new rows.
+
+        Each reading is reported by one of its tank's ``sensors`` (ids by
+        tank id) in turn, so every sensor gets a last reading.
+        """
+        shape = (len(tanks), len(epochs))
+        interval_minutes = options['interval']
+
+        # Per-tank parameters
+        capacity = np.array([tank.capacity_gallons for tank in tanks], dtype=np.float64)[:, None]
+        base_level = rng.uniform(45, 85, (len(tanks), 1))
+        usage = rng.uniform(10, 30, (len(tanks), 1))
+        height_in = rng.uniform(96, 180, (len(tanks), 1))
+        base_temp = rng.uniform(45, 65, (len(tanks), 1))
+        base_ph = rng.uniform(6.8, 8.2, (len(tanks), 1))
+        drain = rng.uniform(0.004, 0.03, (len(tanks), 1))
+
+        # Daytime usage draws the level down between roughly 6:00 and 22:00
+        daytime = np.clip(np.sin(np.pi * (hours - 6) / 16), 0, None)[None, :]
+        drift = np.cumsum(rng.normal(0, 0.4, shape), axis=1)
+        drift -= drift.mean(axis=1, keepdims=True)
+        level = np.clip(
+            base_level - usage * daytime + np.clip(drift, -20, 20) + rng.normal(0, 1.0, shape), 1, 100
+        )
+
+        diurnal_temp = np.sin(2 * np.pi * (hours - 9) / 24)[None, :]
+        water_temp = base_temp + 2.5 * diurnal_temp + rng.normal(0, 0.6, shape)
+        ambient_temp = water_temp + 8 * diurnal_temp + rng.normal(2, 3, shape)
+        ph = np.clip(base_ph + np.cumsum(rng.normal(0, 0.01, shape), axis=1) + rng.normal(0, 0.08, shape), 0, 14)
+
+        flow = np.clip(daytime * usage / 100 * capacity / (16 * 60) * 2 + rng.normal(0, 2, shape), 0, None)
+        total_flow = np.cumsum(flow * interval_minutes, axis=1)
+
+        # Batteries drain linearly and get swapped once they reach 3.3V
+        battery = 4.2 - np.mod(drain * days_elapsed[None, :], 0.9) + rng.normal(0, 0.01, shape)
+
+        columns = {
+            'water_level_percentage': level,
+            'water_level_inches': level / 100 * height_in,
+            'water_temperature_f': water_temp,
+            'ambient_temperature_f': ambient_temp,
+            'ph_level': ph,
+            'turbidity_ntu': rng.lognormal(-0.6, 0.5, shape),
+            'dissolved_oxygen_ppm': np.clip(rng.normal(9, 1.2, shape), 0, None),
+            'conductivity_us_cm': rng.normal(500, 80, shape),
+            'flow_rate_gpm': flow,
+            'total_flow_gallons': total_flow,
+            'signal_strength': np.clip(rng.normal(85, 8, shape), 0, 100).round(),
+            'battery_voltage': battery,
+        }
+
+        # Occasional missing fields, and level spikes for the validation checks to catch
+        for values in columns.values():
+            values[rng.random(shape) < options['dropout_rate'] / 2] = np.nan
+        spiked = rng.random(shape) < options['invalid_rate']
+        spikes = rng.choice([-35.0, 35.0], shape)
+        columns['water_level_percentage'] = np.where(
+            spiked, np.clip(columns['water_level_percentage'] + spikes, 0, 100),
+            columns['water_level_percentage'],
+        )
+
+        # Whole readings that never arrive, and anything already stored
+        keep = rng.random(shape) >= options['dropout_rate']
+        for row, tank in enumerate(tanks):
+            if tank.id in latest:
+                keep[row] &= epochs > int(latest[tank.id].timestamp())
+        if not keep.any():
+            return None
+
+        rows, cols = np.nonzero(keep)
+        # Rotate on the interval-aligned grid so re-runs continue the same rotation
+        slot = epochs // (interval_minutes * 60)
+        reporters = [sensors.get(tank.id) or [None] for tank in tanks]
+        frame = pd.DataFrame({
+            'tank_id': np.array([str(tank.id) for tank in tanks], dtype=object)[rows],
+            'sensor_id': [
+                reporters[row][slot[col] % len(reporters[row])] for row, col in zip(rows.tolist(), cols.tolist())
+            ],
+            'timestamp': times[cols],
+        })
+        for name in MEASUREMENT_COLUMNS:
+            frame[name] = columns[name][rows, cols]
+        frame['signal_strength'] = frame['signal_strength'].astype('Int64')
+
+        capacities = {str(tank.id): float(tank.capacity_gallons) for tank in tanks}
+        mask = validation.quality_mask(frame.assign(capacity_gallons=frame['tank_id'].map(capacities)))
+        frame['is_valid'] = (mask & validation.INVALID_MASK) == 0
+        frame['quality_flags'] = [
+            json.dumps(validation.flags_with_mask({}, value)) if value else '{}' for value in mask
+        ]
+        return frame
+
+    def write_frame(self, frame):
+        if connection.vendor == 'postgresql':
+            self.copy_frame(frame)
+        else:
+            self.insert_frame(frame)
+
+    def insert_frame(self, frame):
+        """executemany a chunk directly, skipping per-row model instances"""
+        adapt = connection.ops.adapt_datetimefield_value
+        if connection.features.has_native_uuid_field:
+            db_uuid = str
+        else:
+            db_uuid = attrgetter('hex')
+        tank_keys = {tank_id: db_uuid(uuid.UUID(tank_id)) for tank_id in frame['tank_id'].unique()}
+        sensor_keys = {
+            sensor_id: db_uuid(uuid.UUID(sensor_id)) for sensor_id in frame['sensor_id'].dropna().unique()
+        }
+        stamps = {stamp: adapt(stamp.to_pydatetime()) for stamp in frame['timestamp'].unique()}
+
+        columns = [
+            [db_uuid(reading_id) for reading_id in ids.uuid7s(len(frame))],
+            frame['tank_id'].map(tank_keys).tolist(),
+            [sensor_keys.get(sensor_id) for sensor_id in frame['sensor_id']],
+            frame['timestamp'].map(stamps).tolist(),
+        ]
+        for name in MEASUREMENT_COLUMNS:
+            values = frame[name].astype(object)
+            columns.append(values.where(frame[name].notna(), None).tolist())
+        columns.append(frame['is_valid'].tolist())
+        columns.append(frame['quality_flags'].tolist())
+        columns.append([adapt(timezone.now())] * len(frame))
+
+        names = [
+            'id', 'tank_id', 'sensor_id', 'timestamp', *MEASUREMENT_COLUMNS, 'is_valid', 'quality_flags', 'created_at',
+        ]
+        sql = '{} {} ({}) VALUES ({})'.format(
+            connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            connection.ops.quote_name(SensorData._meta.db_table),
+            ', '.join(connection.ops.quote_name(name) for name in names),
+            ', '.join(['%s'] * len(names)),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, list(zip(*columns)))
+
+    def copy_frame(self, frame):
+        """Stream a chunk into PostgreSQL with COPY, the fastest bulk path"""
+        now = timezone.now()
+        frame = frame.copy()
+        frame.insert(0, 'id', [reading_id.hex for reading_id in ids.uuid7s(len(frame))])
+        frame['created_at'] = now
+
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S%z')
+        buffer.seek(0)
+
+        columns = ', '.join(f'"{name}"' for name in frame.columns)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {SensorData._meta.db_table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+    def create_alerts(self, tanks):
+        """Create the sample alerts once"""
+        if len(tanks) < 3:
+            return
         alert_data = [
             {
                 'tank': tanks[0],
@@ -202,20 +466,14 @@ class Command(BaseCommand):
                 'actual_value': None,
             },
         ]
-        
+
         for alert_info in alert_data:
-            Alert.objects.create(
-                **alert_info,
-                created_at=timezone.now() - timedelta(hours=random.randint(1, 48)),
-                status=random.choice(['active', 'active', 'acknowledged']),
-            )
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Successfully created sample data:\n'
-                f'- {len(tanks)} water tanks\n'
-                f'- {Sensor.objects.count()} sensors\n'
-                f'- {SensorData.objects.count()} sensor readings\n'
-                f'- {Alert.objects.count()} alerts'
+            Alert.objects.get_or_create(
+                tank=alert_info['tank'],
+                alert_type=alert_info['alert_type'],
+                title=alert_info['title'],
+                defaults={
+                    **alert_info,
+                    'status': self.rng.choice(['active', 'active', 'acknowledged']),
+                },
             )
-        ) 
\ No newline at end of file
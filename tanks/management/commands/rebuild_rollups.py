@@ -0,0 +1,43 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from tanks import rollups
+
+
+class Command(BaseCommand):
+    help = 'Backfill or re-aggregate hourly/daily rollups from raw sensor readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tank', action='append', dest='tanks', metavar='UUID',
+                            help='Only rebuild this tank (repeatable); default is every tank')
+        parser.add_argument('--days', type=int, help='Rebuild the last N days')
+        parser.add_argument('--since', help='First local date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last local date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--resolution', choices=rollups.RESOLUTIONS, action='append', dest='resolutions',
+                            help='Only rebuild this resolution (repeatable)')
+
+    def parse_day(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date {value!r}; expected YYYY-MM-DD')
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def handle(self, *args, **options):
+        start = end = None
+        if options['days']:
+            start = timezone.now() - timedelta(days=options['days'])
+        if options['since']:
+            start = self.parse_day(options['since'])
+        if options['until']:
+            end = self.parse_day(options['until'])
+
+        written = rollups.rebuild(
+            tank_ids=options['tanks'],
+            start=start,
+            end=end,
+            resolutions=options['resolutions'] or rollups.RESOLUTIONS,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} rollup buckets'))
@@ -0,0 +1,82 @@
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections
+
+from tanks.ingest import store_readings
+from tanks.spool import SpoolReader
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Drain the on-disk reading spool into SensorData (at-least-once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Records replayed per transaction batch')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the spool is empty')
+        parser.add_argument('--max-backoff', type=float, default=60.0,
+                            help='Longest wait between retries while the database is unavailable')
+        parser.add_argument('--once', action='store_true', help='Exit once the spool is drained')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+        reader = SpoolReader(settings.SENSOR_SPOOL_DIR)
+        if not reader.acquire_replay_lock():
+            raise CommandError('Another replay_spool process is already draining this spool')
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        replayed = dropped = 0
+        backoff = options['interval']
+        position = reader.load_checkpoint()
+
+        while not self.stopping:
+            records, next_position = reader.read_batch(options['batch_size'])
+
+            if records:
+                pending = [(index, values) for index, (_, values) in enumerate(records)]
+                results = [None] * len(pending)
+                close_old_connections()
+                try:
+                    store_readings(pending, results)
+                except DatabaseError:
+                    logger.exception('Database unavailable, retrying %d records in %.1fs', len(records), backoff)
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, options['max_backoff'])
+                    continue
+
+                if any(result.get('retryable') for result in results):
+                    logger.warning('Database unavailable, retrying %d records in %.1fs', len(records), backoff)
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, options['max_backoff'])
+                    continue
+                backoff = options['interval']
+
+                rejected = [result for result in results if result['status'] == 'rejected']
+                if rejected:
+                    # Validation failures cannot succeed on retry (e.g. tank deleted meanwhile)
+                    logger.warning('Dropping %d spooled readings: %s', len(rejected), rejected[0]['errors'])
+                replayed += len(records) - len(rejected)
+                dropped += len(rejected)
+
+            if next_position != position:
+                reader.save_checkpoint(*next_position)
+                reader.compact()
+                position = next_position
+
+            if not records:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} readings, dropped {dropped}'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,98 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tanks import calibration
+from tanks.models import CalibrationRun, Sensor
+
+
+class Command(BaseCommand):
+    help = 'Re-apply sensor calibration offsets to stored readings (resumable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sensor', action='append', dest='sensors', metavar='UUID',
+                            help="Start a run for this sensor's current calibration (repeatable)")
+        parser.add_argument('--run', action='append', dest='runs', metavar='UUID',
+                            help='Resume this run, including a failed one (repeatable)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what the runs would change without writing anything')
+        parser.add_argument('--chunk-size', type=int, default=calibration.CHUNK_SIZE,
+                            help='Readings updated per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between chunks to leave room for ingest')
+
+    def handle(self, *args, **options):
+        if options['sensors']:
+            sensors = list(Sensor.objects.filter(id__in=options['sensors']).select_related('tank'))
+            if len(sensors) != len(set(options['sensors'])):
+                raise CommandError('Unknown sensor id')
+            unsupported = [str(sensor.id) for sensor in sensors if sensor.sensor_type not in calibration.CALIBRATED_FIELDS]
+            if unsupported:
+                raise CommandError(f'No calibrated field for sensor(s): {", ".join(unsupported)}')
+            if options['dry_run']:
+                # Nothing is queued; estimate against the sensors' current calibration
+                runs = [
+                    CalibrationRun(sensor=sensor, offset=sensor.calibration_offset, since=sensor.last_calibration)
+                    for sensor in sensors
+                ]
+            else:
+                runs = [calibration.queue(sensor) for sensor in sensors]
+        else:
+            runs = CalibrationRun.objects.select_related('sensor__tank').order_by('created_at')
+            if options['runs']:
+                runs = runs.filter(id__in=options['runs'])
+            else:
+                runs = runs.filter(status__in=calibration.ACTIVE)
+            runs = list(runs)
+
+        if not runs:
+            self.stdout.write('No calibration runs to process')
+            return
+
+        for run in runs:
+            if options['dry_run']:
+                self.report(run, calibration.estimate(run, options['chunk_size']))
+                continue
+            if run.status == 'failed':
+                run.status, run.error = 'running', ''
+                run.save(update_fields=['status', 'error'])
+            self.apply(run, options)
+
+    def report(self, run, summary):
+        since = run.since.isoformat() if run.since else 'the first reading'
+        self.stdout.write(f'{run.sensor}: offset {run.offset:+g} on {", ".join(summary["fields"])} since {since}')
+        if not summary['rows']:
+            self.stdout.write('  no readings')
+            return
+        self.stdout.write(
+            f'  {summary["rows"]:,} readings from {summary["first"]:%Y-%m-%d %H:%M} '
+            f'to {summary["last"]:%Y-%m-%d %H:%M} in {summary["chunks"]:,} chunks'
+        )
+        if not summary['shifts']:
+            self.stdout.write('  already applied, nothing would change')
+        for shift, rows in sorted(summary['shifts'].items()):
+            self.stdout.write(f'  {rows:,} readings would move by {shift:+g} {summary["field"]}')
+
+    def apply(self, run, options):
+        if run.status not in ('pending', 'running'):
+            self.stdout.write(f'Skipping {run.pk}: {run.get_status_display().lower()}')
+            return
+        self.stdout.write(f'Applying {run.sensor} offset {run.offset:+g} ({run.pk})')
+        started = time.perf_counter()
+        rows_before = run.rows_done
+
+        def progress(run):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'  {run.rows_done:,}/{run.rows_total:,} ({run.progress_percentage:.1f}%), '
+                f'{run.rows_changed:,} changed, {(run.rows_done - rows_before) / elapsed:,.0f} rows/s'
+            )
+
+        run = calibration.process(run, options['chunk_size'], options['pause'], progress)
+        if run.status == 'superseded':
+            self.stdout.write(self.style.WARNING(f'  superseded by a newer calibration of {run.sensor}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'  done: {run.rows_done:,} readings, {run.rows_changed:,} changed '
+                f'in {time.perf_counter() - started:.1f}s'
+            ))
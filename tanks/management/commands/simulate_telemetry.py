@@ -0,0 +1,119 @@
+import asyncio
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tanks.models import SensorData, WaterTank
+from tanks.simulator import SCENARIOS, TelemetrySimulator, build_devices, end_to_end_latencies, percentiles
+
+
+class Command(BaseCommand):
+    help = 'Impersonate tanks and their sensors, streaming live readings at the ingest path for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', default='tcp://127.0.0.1:9000',
+                            help='tcp://host:port, udp://host:port or http://host:port/tanks/api/readings/')
+        parser.add_argument('--token', help='API token for HTTP targets (one of INGEST_API_TOKENS)')
+        parser.add_argument('--format', choices=['json', 'binary'], default='json',
+                            help='Payload encoding for UDP and HTTP targets')
+        parser.add_argument('--tanks', type=int, default=0, help='Tanks to impersonate (0 means all active tanks)')
+        parser.add_argument('--gateways', type=int, default=10,
+                            help='Concurrent gateway connections the devices are spread across')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds between readings per device')
+        parser.add_argument('--jitter', type=float, default=0.1,
+                            help='Random +/- fraction applied to each device interval')
+        parser.add_argument('--duration', type=float, default=60.0, help='Seconds to keep emitting')
+        parser.add_argument('--tick', type=float, default=0.1,
+                            help='Gateway flush period in seconds (HTTP batches are built per tick)')
+        parser.add_argument('--scenario', choices=SCENARIOS, default='steady')
+        parser.add_argument('--burst-every', type=float, default=20.0, help='Seconds between bursts')
+        parser.add_argument('--burst-size', type=int, default=10, help='Extra readings per device in a burst')
+        parser.add_argument('--storm-every', type=float, default=20.0,
+                            help='Seconds between simultaneous reconnects of all gateways')
+        parser.add_argument('--skew-fraction', type=float, default=0.2, help='Fraction of devices with a skewed clock')
+        parser.add_argument('--skew-seconds', type=float, default=600.0, help='Largest clock offset, either way')
+        parser.add_argument('--settle', type=float, default=5.0,
+                            help='Seconds to wait after emitting before measuring what reached the database')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        tanks = WaterTank.objects.filter(status='active').prefetch_related('sensors').order_by('name')
+        if options['tanks']:
+            tanks = tanks[:options['tanks']]
+        rng = random.Random(options['seed'])
+        devices = build_devices(
+            tanks, rng, options['scenario'], options['skew_fraction'], options['skew_seconds']
+        )
+        if not devices:
+            raise CommandError('No active tanks to simulate; run populate_sample_data first')
+
+        simulator = TelemetrySimulator(
+            devices,
+            options['target'],
+            gateways=options['gateways'],
+            interval=options['interval'],
+            jitter=options['jitter'],
+            duration=options['duration'],
+            tick=options['tick'],
+            scenario=options['scenario'],
+            burst_every=options['burst_every'],
+            burst_size=options['burst_size'],
+            storm_every=options['storm_every'],
+            token=options['token'],
+            binary=options['format'] == 'binary',
+            seed=options['seed'],
+        )
+        try:
+            simulator.make_transport()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stderr.write(
+            f'Simulating {len(devices)} devices on {simulator.gateway_count} gateways '
+            f'({options["scenario"]}) against {options["target"]} for {options["duration"]:.0f}s'
+        )
+        run_started = timezone.now()
+        elapsed = asyncio.run(simulator.run())
+        time.sleep(options['settle'])
+
+        # created_at is stamped when the row is written, so it bounds end-to-end latency
+        rows = SensorData.objects.filter(
+            tank_id__in={device.tank_id for device in devices},
+            created_at__gte=run_started,
+        ).values_list('tank_id', 'sensor_id', 'timestamp', 'created_at')
+        stored = list(rows)
+
+        stats = simulator.stats
+        report = {
+            'devices': len(devices),
+            'gateways': simulator.gateway_count,
+            'scenario': options['scenario'],
+            'elapsed_seconds': round(elapsed, 2),
+            'emitted': stats.emitted,
+            'sent': stats.sent,
+            'stored': len(stored),
+            'emitted_per_second': round(stats.emitted / elapsed, 1),
+            'stored_per_second': round(len(stored) / elapsed, 1),
+            'send_errors': stats.send_errors,
+            'failed': stats.failed,
+            'reconnects': stats.reconnects,
+            'accepted': stats.accepted,
+            'duplicates': stats.duplicates,
+            'rejected': stats.rejected,
+            'error_rate': round((stats.failed + stats.rejected) / stats.emitted, 4) if stats.emitted else None,
+            'loss_rate': round(1 - len(stored) / stats.emitted, 4) if stats.emitted else None,
+            'send_latency': percentiles(stats.send_latencies),
+            'end_to_end_latency': percentiles(end_to_end_latencies(stored, devices)),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for key, value in report.items():
+            if isinstance(value, dict):
+                value = ', '.join(f'{name}={number}' for name, number in value.items())
+            self.stdout.write(f'{key:>20}: {value}')
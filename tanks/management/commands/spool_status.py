@@ -0,0 +1,14 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tanks.spool import SpoolReader
+
+
+class Command(BaseCommand):
+    help = 'Show how far the on-disk reading spool is behind the database'
+
+    def handle(self, *args, **options):
+        stats = SpoolReader(settings.SENSOR_SPOOL_DIR, create=False).stats()
+        self.stdout.write(json.dumps(stats, indent=2))
@@ -0,0 +1,45 @@
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from tanks import validation
+
+
+class Command(BaseCommand):
+    help = 'Re-run the data-quality checks over stored readings and update is_valid and quality_flags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tank', action='append', dest='tanks', metavar='UUID',
+                            help='Only validate this tank (repeatable); default is every tank')
+        parser.add_argument('--days', type=int, help='Validate the last N days')
+        parser.add_argument('--since', help='First local date to validate (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last local date to validate (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per batch')
+
+    def parse_day(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date {value!r}; expected YYYY-MM-DD')
+        return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+    def handle(self, *args, **options):
+        start = end = None
+        if options['days']:
+            start = timezone.now() - timedelta(days=options['days'])
+        if options['since']:
+            start = self.parse_day(options['since'])
+        if options['until']:
+            end = self.parse_day(options['until']) + timedelta(days=1)
+
+        started = time.perf_counter()
+        checked, changed = validation.revalidate(
+            tank_ids=options['tanks'], start=start, end=end, batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked:,} readings, updated {changed:,} in {elapsed:.1f}s '
+            f'({checked / elapsed if elapsed else 0:,.0f} rows/s)'
+        ))
@@ -0,0 +1,39 @@
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from tanks import anomaly
+
+
+class Command(BaseCommand):
+    help = 'Compute the anomaly detection baselines from stored readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tank', action='append', dest='tanks', metavar='UUID',
+                            help='Only warm up this tank (repeatable); default is every tank')
+        parser.add_argument('--days', type=int, default=30, help='Learn from the last N days')
+        parser.add_argument('--since', help='First local date to learn from (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last local date to learn from (YYYY-MM-DD)')
+
+    def parse_day(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date {value!r}; expected YYYY-MM-DD')
+        return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+    def handle(self, *args, **options):
+        start = timezone.now() - timedelta(days=options['days'])
+        end = None
+        if options['since']:
+            start = self.parse_day(options['since'])
+        if options['until']:
+            end = self.parse_day(options['until']) + timedelta(days=1)
+
+        started = time.perf_counter()
+        written = anomaly.warm_up(tank_ids=options['tanks'], start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written:,} baselines in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.21 on 2026-10-18 11:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def delete_duplicate_readings(apps, schema_editor):
+    """Keep the first stored copy of each (tank, sensor, timestamp)"""
+    SensorData = apps.get_model('tanks', 'SensorData')
+    groups = (
+        SensorData.objects.values('tank_id', 'sensor_id', 'timestamp')
+        .annotate(copies=Count('id'))
+        .filter(copies__gt=1)
+    )
+    for group in groups.iterator():
+        ids = list(
+            SensorData.objects.filter(
+                tank_id=group['tank_id'],
+                sensor_id=group['sensor_id'],
+                timestamp=group['timestamp'],
+            ).order_by('created_at').values_list('id', flat=True)
+        )
+        SensorData.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_readings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sensordata',
+            constraint=models.UniqueConstraint(condition=models.Q(('sensor__isnull', False)), fields=('tank', 'sensor', 'timestamp'), name='unique_sensor_reading'),
+        ),
+        migrations.AddConstraint(
+            model_name='sensordata',
+            constraint=models.UniqueConstraint(condition=models.Q(('sensor__isnull', True)), fields=('tank', 'timestamp'), name='unique_tank_reading'),
+        ),
+    ]
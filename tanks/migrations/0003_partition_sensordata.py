@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations
+
+from tanks import partitions
+
+
+def partition_sensor_data(apps, schema_editor):
+    connection = schema_editor.connection
+    if partitions.is_supported(connection) and not partitions.is_partitioned(connection):
+        partitions.rebuild_table(connection, partitioned=True, months_ahead=settings.SENSOR_PARTITION_MONTHS_AHEAD)
+
+
+def unpartition_sensor_data(apps, schema_editor):
+    connection = schema_editor.connection
+    if partitions.is_supported(connection) and partitions.is_partitioned(connection):
+        partitions.rebuild_table(connection, partitioned=False)
+
+
+class Migration(migrations.Migration):
+    """Range-partition tanks_sensordata by month on PostgreSQL (no-op elsewhere)"""
+
+    dependencies = [
+        ('tanks', '0002_sensordata_unique_reading'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_sensor_data, unpartition_sensor_data),
+    ]
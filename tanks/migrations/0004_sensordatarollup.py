@@ -0,0 +1,65 @@
+# Generated by Django 4.2.21 on 2026-10-18 11:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0003_partition_sensordata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDataRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('resolution', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=10)),
+                ('bucket_start', models.DateTimeField(help_text='Start of the hour (UTC) or local day')),
+                ('reading_count', models.IntegerField(default=0)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('level_min', models.FloatField(blank=True, null=True)),
+                ('level_max', models.FloatField(blank=True, null=True)),
+                ('level_sum', models.FloatField(default=0)),
+                ('level_count', models.IntegerField(default=0)),
+                ('level_last', models.FloatField(blank=True, null=True)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_count', models.IntegerField(default=0)),
+                ('temperature_last', models.FloatField(blank=True, null=True)),
+                ('ph_min', models.FloatField(blank=True, null=True)),
+                ('ph_max', models.FloatField(blank=True, null=True)),
+                ('ph_sum', models.FloatField(default=0)),
+                ('ph_count', models.IntegerField(default=0)),
+                ('ph_last', models.FloatField(blank=True, null=True)),
+                ('turbidity_min', models.FloatField(blank=True, null=True)),
+                ('turbidity_max', models.FloatField(blank=True, null=True)),
+                ('turbidity_sum', models.FloatField(default=0)),
+                ('turbidity_count', models.IntegerField(default=0)),
+                ('turbidity_last', models.FloatField(blank=True, null=True)),
+                ('signal_min', models.FloatField(blank=True, null=True)),
+                ('signal_max', models.FloatField(blank=True, null=True)),
+                ('signal_sum', models.FloatField(default=0)),
+                ('signal_count', models.IntegerField(default=0)),
+                ('signal_last', models.FloatField(blank=True, null=True)),
+                ('battery_min', models.FloatField(blank=True, null=True)),
+                ('battery_max', models.FloatField(blank=True, null=True)),
+                ('battery_sum', models.FloatField(default=0)),
+                ('battery_count', models.IntegerField(default=0)),
+                ('battery_last', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='tanks.watertank')),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'indexes': [models.Index(fields=['resolution', 'bucket_start'], name='tanks_senso_resolut_140928_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sensordatarollup',
+            constraint=models.UniqueConstraint(fields=('tank', 'resolution', 'bucket_start'), name='unique_rollup_bucket'),
+        ),
+    ]
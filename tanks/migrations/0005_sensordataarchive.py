@@ -0,0 +1,38 @@
+# Generated by Django 4.2.21 on 2026-10-18 11:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0004_sensordatarollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDataArchive',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('month', models.DateField(help_text='First day of the archived UTC month')),
+                ('path', models.CharField(help_text='Location relative to SENSOR_ARCHIVE_DIR', max_length=255)),
+                ('compressed', models.BooleanField(default=False, help_text='Compressed .npz rather than memory-mappable .npy columns')),
+                ('row_count', models.IntegerField(default=0)),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='tanks.watertank')),
+            ],
+            options={
+                'ordering': ['tank', '-month'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sensordataarchive',
+            constraint=models.UniqueConstraint(fields=('tank', 'month'), name='unique_archive_month'),
+        ),
+    ]
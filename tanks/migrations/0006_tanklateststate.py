@@ -0,0 +1,62 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_latest_state(apps, schema_editor):
+    WaterTank = apps.get_model('tanks', 'WaterTank')
+    SensorData = apps.get_model('tanks', 'SensorData')
+    TankLatestState = apps.get_model('tanks', 'TankLatestState')
+    fields = [
+        field.attname for field in TankLatestState._meta.concrete_fields
+        if field.attname not in ('tank_id', 'reading_id', 'updated_at')
+    ]
+
+    states = []
+    for tank_id in WaterTank.objects.values_list('id', flat=True).iterator():
+        reading = SensorData.objects.filter(tank_id=tank_id).order_by('-timestamp').first()
+        if reading:
+            states.append(TankLatestState(
+                tank_id=tank_id,
+                reading_id=reading.id,
+                **{field: getattr(reading, field) for field in fields}
+            ))
+    TankLatestState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0005_sensordataarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TankLatestState',
+            fields=[
+                ('tank', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_state', serialize=False, to='tanks.watertank')),
+                ('reading_id', models.UUIDField()),
+                ('timestamp', models.DateTimeField(db_index=True)),
+                ('water_level_inches', models.FloatField(blank=True, null=True)),
+                ('water_level_percentage', models.FloatField(blank=True, null=True)),
+                ('water_temperature_f', models.FloatField(blank=True, null=True)),
+                ('ambient_temperature_f', models.FloatField(blank=True, null=True)),
+                ('ph_level', models.FloatField(blank=True, null=True)),
+                ('turbidity_ntu', models.FloatField(blank=True, null=True)),
+                ('dissolved_oxygen_ppm', models.FloatField(blank=True, null=True)),
+                ('conductivity_us_cm', models.FloatField(blank=True, null=True)),
+                ('flow_rate_gpm', models.FloatField(blank=True, null=True)),
+                ('total_flow_gallons', models.FloatField(blank=True, null=True)),
+                ('signal_strength', models.IntegerField(blank=True, null=True)),
+                ('battery_voltage', models.FloatField(blank=True, null=True)),
+                ('is_valid', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sensor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tanks.sensor')),
+            ],
+            options={
+                'ordering': ['tank'],
+            },
+        ),
+        migrations.RunPython(backfill_latest_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:03
+
+from django.db import migrations, models
+import tanks.ids
+
+
+class Migration(migrations.Migration):
+    """Generate time-ordered ids for new readings.
+
+    Only the Python-side default changes, so there is nothing to do in the
+    database (SQLite would otherwise copy the whole table). Existing rows
+    keep their UUID4 ids, which stay valid references.
+    """
+
+    dependencies = [
+        ('tanks', '0006_tanklateststate'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='sensordata',
+                    name='id',
+                    field=models.UUIDField(default=tanks.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0007_sensordata_uuid7'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalibrationRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('offset', models.FloatField(help_text='Calibration offset being applied')),
+                ('since', models.DateTimeField(blank=True, help_text='Readings from this time on; empty for all', null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('superseded', 'Superseded')], default='pending', max_length=20)),
+                ('rows_total', models.BigIntegerField(default=0)),
+                ('rows_done', models.BigIntegerField(default=0)),
+                ('rows_changed', models.BigIntegerField(default=0)),
+                ('cursor_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('cursor_id', models.UUIDField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calibration_runs', to='tanks.sensor')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SensorDataCorrection',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('reading_id', models.UUIDField()),
+                ('timestamp', models.DateTimeField()),
+                ('field', models.CharField(max_length=50)),
+                ('original_value', models.FloatField(help_text='Value as received from the gateway')),
+                ('applied_offset', models.FloatField(help_text='Offset the stored value currently includes')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='corrections', to='tanks.calibrationrun')),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='corrections', to='tanks.sensor')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['sensor', 'field', 'timestamp'], name='tanks_senso_sensor__5b395a_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sensordatacorrection',
+            constraint=models.UniqueConstraint(fields=('reading_id', 'field'), name='unique_reading_correction'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:34
+
+from datetime import timedelta
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+# Defaults for every tank; the level and pH lines match the dashboard charts
+DEFAULT_RULES = [
+    # alert_type, low, high, hysteresis, min_duration, cooldown, severity
+    ('low_level', 20.0, None, 5.0, timedelta(minutes=15), timedelta(hours=1), 'high'),
+    ('high_level', None, 80.0, 5.0, timedelta(minutes=15), timedelta(hours=1), 'medium'),
+    ('temperature', 35.0, 77.0, 2.0, timedelta(minutes=30), timedelta(hours=2), 'medium'),
+    ('ph', 6.5, 8.5, 0.2, timedelta(minutes=30), timedelta(hours=2), 'high'),
+    ('turbidity', None, 5.0, 1.0, timedelta(minutes=30), timedelta(hours=2), 'medium'),
+]
+
+
+def create_default_rules(apps, schema_editor):
+    AlertRule = apps.get_model('tanks', 'AlertRule')
+    AlertRule.objects.bulk_create([
+        AlertRule(
+            alert_type=alert_type, low_threshold=low, high_threshold=high, hysteresis=hysteresis,
+            min_duration=min_duration, cooldown=cooldown, severity=severity,
+        )
+        for alert_type, low, high, hysteresis, min_duration, cooldown, severity in DEFAULT_RULES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0008_calibration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('alert_type', models.CharField(choices=[('low_level', 'Low Water Level'), ('high_level', 'High Water Level'), ('temperature', 'Temperature Alert'), ('ph', 'pH Alert'), ('turbidity', 'Turbidity Alert')], max_length=20)),
+                ('tank_type', models.CharField(blank=True, choices=[('rooftop', 'Rooftop Tank'), ('basement', 'Basement Tank'), ('ground', 'Ground Level Tank'), ('elevated', 'Elevated Tank')], max_length=20)),
+                ('low_threshold', models.FloatField(blank=True, help_text='Alert when the value drops below this', null=True)),
+                ('high_threshold', models.FloatField(blank=True, help_text='Alert when the value rises above this', null=True)),
+                ('hysteresis', models.FloatField(default=0.0, help_text='How far back inside the thresholds the value must return to resolve the alert', validators=[django.core.validators.MinValueValidator(0)])),
+                ('min_duration', models.DurationField(default=timedelta(0), help_text='How long the condition must last before alerting')),
+                ('cooldown', models.DurationField(default=timedelta(0), help_text='Quiet period after an alert resolves before it can fire again')),
+                ('severity', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], default='medium', max_length=10)),
+                ('enabled', models.BooleanField(default=True, help_text='A disabled rule also switches off the less specific ones')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tank', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='tanks.watertank')),
+            ],
+            options={
+                'ordering': ['alert_type', 'tank', 'tank_type'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='alertrule',
+            constraint=models.UniqueConstraint(condition=models.Q(('tank__isnull', False)), fields=('tank', 'alert_type'), name='unique_tank_alert_rule'),
+        ),
+        migrations.AddConstraint(
+            model_name='alertrule',
+            constraint=models.UniqueConstraint(condition=models.Q(('tank__isnull', True)), fields=('tank_type', 'alert_type'), name='unique_tank_type_alert_rule'),
+        ),
+        migrations.RunPython(create_default_rules, migrations.RunPython.noop),
+    ]
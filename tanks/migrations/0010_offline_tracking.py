@@ -0,0 +1,37 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:37
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_reading(apps, schema_editor):
+    Sensor = apps.get_model('tanks', 'Sensor')
+    SensorData = apps.get_model('tanks', 'SensorData')
+    newest = SensorData.objects.filter(sensor=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    Sensor.objects.update(last_reading_at=Subquery(newest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0009_alertrule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='last_reading_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='sensor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='tanklateststate',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_last_reading, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_last_seen(apps, schema_editor):
+    Alert = apps.get_model('tanks', 'Alert')
+    Alert.objects.update(last_seen_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0010_offline_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['tank', 'alert_type', 'last_seen_at'], name='tanks_alert_tank_id_a079f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['status', '-created_at'], name='tanks_alert_status_bd6744_idx'),
+        ),
+        migrations.RunPython(backfill_last_seen, migrations.RunPython.noop),
+    ]
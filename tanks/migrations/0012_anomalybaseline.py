@@ -0,0 +1,40 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tanks', '0011_alert_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomalyBaseline',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('metric', models.CharField(choices=[('level_slope', 'Water Level Change'), ('temperature', 'Water Temperature'), ('conductivity', 'Conductivity')], max_length=20)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0.0)),
+                ('variance', models.FloatField(default=0.0)),
+                ('hourly_samples', models.JSONField(default=list)),
+                ('hourly_mean', models.JSONField(default=list)),
+                ('hourly_variance', models.JSONField(default=list)),
+                ('streak', models.PositiveIntegerField(default=0)),
+                ('last_value', models.FloatField(blank=True, null=True)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomaly_baselines', to='tanks.watertank')),
+            ],
+            options={
+                'ordering': ['tank', 'metric'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='anomalybaseline',
+            constraint=models.UniqueConstraint(fields=('tank', 'metric'), name='unique_anomaly_baseline'),
+        ),
+    ]
@@ -1,9 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from datetime import timedelta
 import uuid
 
+from .ids import uuid7
+
 
 class WaterTank(models.Model):
     """Model representing a water tank in NYC"""
@@ -58,21 +62,29 @@ class WaterTank(models.Model):
     def __str__(self):
         return f"{self.name} - {self.location}"
     
+    @property
+    def current_state(self):
+        """The tank's TankLatestState, or None before its first reading"""
+        try:
+            return self.latest_state
+        except ObjectDoesNotExist:
+            return None
+    
     @property
     def latest_sensor_data(self):
-        """Get the most recent sensor reading"""
-        return self.sensor_data.order_by('-timestamp').first()
+        """Get the most recent sensor reading (an unsaved copy from TankLatestState)"""
+        state = self.current_state
+        return state.as_reading() if state else None
     
     @property
     def connection_status(self):
         """Check if tank is connected based on recent data"""
-        latest_data = self.latest_sensor_data
-        if not latest_data:
+        state = self.current_state
+        if not state:
             return 'disconnected'
         
         # Consider connected if data is less than 30 minutes old
-        time_diff = timezone.now() - latest_data.timestamp
-        if time_diff.total_seconds() < 1800:  # 30 minutes
+        if timezone.now() - state.timestamp < TankLatestState.CONNECTED_WINDOW:
             return 'connected'
         else:
             return 'disconnected'
@@ -80,9 +92,9 @@ class WaterTank(models.Model):
     @property
     def current_water_level_percentage(self):
         """Get current water level as percentage"""
-        latest_data = self.latest_sensor_data
-        if latest_data and latest_data.water_level_percentage is not None:
-            return latest_data.water_level_percentage
+        state = self.current_state
+        if state and state.water_level_percentage is not None:
+            return state.water_level_percentage
         return None
 
 
@@ -126,8 +138,12 @@ class Sensor(models.Model):
     last_calibration = models.DateTimeField(null=True, blank=True)
     calibration_offset = models.FloatField(default=0.0)
     
+    # Newest reading carrying this sensor's id, kept current by ingest
+    last_reading_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed so the offline detector can follow changes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['tank', 'sensor_type']
@@ -140,7 +156,8 @@ class Sensor(models.Model):
 class SensorData(models.Model):
     """Model storing sensor readings and measurements"""
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Time-ordered so inserts append to the primary key index
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     tank = models.ForeignKey(WaterTank, on_delete=models.CASCADE, related_name='sensor_data')
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='readings', null=True, blank=True)
     timestamp = models.DateTimeField(default=timezone.now)
@@ -188,6 +205,20 @@ class SensorData(models.Model):
             models.Index(fields=['sensor', '-timestamp']),
             models.Index(fields=['-timestamp']),
         ]
+        # One reading per (tank, sensor, timestamp); NULL sensors need their own
+        # constraint because NULLs never collide in a unique index
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tank', 'sensor', 'timestamp'],
+                condition=models.Q(sensor__isnull=False),
+                name='unique_sensor_reading',
+            ),
+            models.UniqueConstraint(
+                fields=['tank', 'timestamp'],
+                condition=models.Q(sensor__isnull=True),
+                name='unique_tank_reading',
+            ),
+        ]
         
     def __str__(self):
         return f"{self.tank.name} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -200,6 +231,237 @@ class SensorData(models.Model):
         return None
 
 
+class TankLatestState(models.Model):
+    """Copy of each tank's newest reading, kept current by ingest"""
+    
+    # Tanks without a reading this recent count as disconnected
+    CONNECTED_WINDOW = timedelta(minutes=30)
+    
+    tank = models.OneToOneField(WaterTank, on_delete=models.CASCADE, primary_key=True, related_name='latest_state')
+    # Not a ForeignKey: SensorData's primary key is (id, timestamp) once partitioned
+    reading_id = models.UUIDField()
+    sensor = models.ForeignKey(Sensor, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    timestamp = models.DateTimeField(db_index=True)
+    
+    water_level_inches = models.FloatField(null=True, blank=True)
+    water_level_percentage = models.FloatField(null=True, blank=True)
+    water_temperature_f = models.FloatField(null=True, blank=True)
+    ambient_temperature_f = models.FloatField(null=True, blank=True)
+    ph_level = models.FloatField(null=True, blank=True)
+    turbidity_ntu = models.FloatField(null=True, blank=True)
+    dissolved_oxygen_ppm = models.FloatField(null=True, blank=True)
+    conductivity_us_cm = models.FloatField(null=True, blank=True)
+    flow_rate_gpm = models.FloatField(null=True, blank=True)
+    total_flow_gallons = models.FloatField(null=True, blank=True)
+    signal_strength = models.IntegerField(null=True, blank=True)
+    battery_voltage = models.FloatField(null=True, blank=True)
+    is_valid = models.BooleanField(default=True)
+    
+    # Indexed so the offline detector can follow changes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    class Meta:
+        ordering = ['tank']
+        
+    def __str__(self):
+        return f"{self.tank.name} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+    
+    def as_reading(self):
+        """An unsaved SensorData carrying the stored values"""
+        values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in ('tank_id', 'reading_id', 'updated_at')
+        }
+        return SensorData(id=self.reading_id, tank=self.tank, **values)
+
+
+class SensorDataRollup(models.Model):
+    """Per-tank aggregates of sensor readings over hourly and daily buckets"""
+    
+    RESOLUTION_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+    
+    # Rolled-up metric prefix -> SensorData field
+    METRICS = {
+        'level': 'water_level_percentage',
+        'temperature': 'water_temperature_f',
+        'ph': 'ph_level',
+        'turbidity': 'turbidity_ntu',
+        'signal': 'signal_strength',
+        'battery': 'battery_voltage',
+    }
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tank = models.ForeignKey(WaterTank, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField(help_text="Start of the hour (UTC) or local day")
+    reading_count = models.IntegerField(default=0)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    
+    # Water level (%)
+    level_min = models.FloatField(null=True, blank=True)
+    level_max = models.FloatField(null=True, blank=True)
+    level_sum = models.FloatField(default=0)
+    level_count = models.IntegerField(default=0)
+    level_last = models.FloatField(null=True, blank=True)
+    
+    # Water temperature (°F)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    temperature_sum = models.FloatField(default=0)
+    temperature_count = models.IntegerField(default=0)
+    temperature_last = models.FloatField(null=True, blank=True)
+    
+    # pH level
+    ph_min = models.FloatField(null=True, blank=True)
+    ph_max = models.FloatField(null=True, blank=True)
+    ph_sum = models.FloatField(default=0)
+    ph_count = models.IntegerField(default=0)
+    ph_last = models.FloatField(null=True, blank=True)
+    
+    # Turbidity (NTU)
+    turbidity_min = models.FloatField(null=True, blank=True)
+    turbidity_max = models.FloatField(null=True, blank=True)
+    turbidity_sum = models.FloatField(default=0)
+    turbidity_count = models.IntegerField(default=0)
+    turbidity_last = models.FloatField(null=True, blank=True)
+    
+    # Signal strength (%)
+    signal_min = models.FloatField(null=True, blank=True)
+    signal_max = models.FloatField(null=True, blank=True)
+    signal_sum = models.FloatField(default=0)
+    signal_count = models.IntegerField(default=0)
+    signal_last = models.FloatField(null=True, blank=True)
+    
+    # Battery voltage
+    battery_min = models.FloatField(null=True, blank=True)
+    battery_max = models.FloatField(null=True, blank=True)
+    battery_sum = models.FloatField(default=0)
+    battery_count = models.IntegerField(default=0)
+    battery_last = models.FloatField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-bucket_start']
+        indexes = [
+            models.Index(fields=['resolution', 'bucket_start']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['tank', 'resolution', 'bucket_start'], name='unique_rollup_bucket'),
+        ]
+        
+    def __str__(self):
+        return f"{self.tank.name} - {self.resolution} {self.bucket_start.strftime('%Y-%m-%d %H:%M')}"
+    
+    def average(self, metric):
+        """Mean of ``metric`` (a METRICS prefix) over the bucket"""
+        count = getattr(self, f'{metric}_count')
+        if count:
+            return getattr(self, f'{metric}_sum') / count
+        return None
+
+
+class SensorDataArchive(models.Model):
+    """Catalog of raw readings moved to columnar archive files (one per tank and month)"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tank = models.ForeignKey(WaterTank, on_delete=models.CASCADE, related_name='archives')
+    month = models.DateField(help_text="First day of the archived UTC month")
+    path = models.CharField(max_length=255, help_text="Location relative to SENSOR_ARCHIVE_DIR")
+    compressed = models.BooleanField(default=False, help_text="Compressed .npz rather than memory-mappable .npy columns")
+    row_count = models.IntegerField(default=0)
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    size_bytes = models.BigIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['tank', '-month']
+        constraints = [
+            models.UniqueConstraint(fields=['tank', 'month'], name='unique_archive_month'),
+        ]
+        
+    def __str__(self):
+        return f"{self.tank.name} - {self.month.strftime('%Y-%m')}"
+
+
+class CalibrationRun(models.Model):
+    """Re-application of a sensor's calibration offset to its stored readings"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('superseded', 'Superseded'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='calibration_runs')
+    offset = models.FloatField(help_text="Calibration offset being applied")
+    since = models.DateTimeField(null=True, blank=True, help_text="Readings from this time on; empty for all")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Progress; the cursor is the last (timestamp, id) processed so a run can resume
+    rows_total = models.BigIntegerField(default=0)
+    rows_done = models.BigIntegerField(default=0)
+    rows_changed = models.BigIntegerField(default=0)
+    cursor_timestamp = models.DateTimeField(null=True, blank=True)
+    cursor_id = models.UUIDField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        
+    def __str__(self):
+        return f"{self.sensor} - {self.offset:+g} ({self.get_status_display()})"
+    
+    @property
+    def progress_percentage(self):
+        if not self.rows_total:
+            return 100.0 if self.status == 'done' else 0.0
+        return min(100.0, self.rows_done * 100 / self.rows_total)
+
+
+class SensorDataCorrection(models.Model):
+    """Original value of a reading field changed by a calibration offset"""
+    
+    # Filled with INSERT ... ON CONFLICT in bulk, so a database-generated key
+    id = models.BigAutoField(primary_key=True)
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='corrections')
+    # Not a ForeignKey: SensorData's primary key is (id, timestamp) once partitioned
+    reading_id = models.UUIDField()
+    timestamp = models.DateTimeField()
+    field = models.CharField(max_length=50)
+    original_value = models.FloatField(help_text="Value as received from the gateway")
+    applied_offset = models.FloatField(help_text="Offset the stored value currently includes")
+    run = models.ForeignKey(CalibrationRun, on_delete=models.SET_NULL, null=True, blank=True, related_name='corrections')
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['sensor', 'field', 'timestamp']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['reading_id', 'field'], name='unique_reading_correction'),
+        ]
+        
+    def __str__(self):
+        return f"{self.field} {self.original_value:g} {self.applied_offset:+g} @ {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
 class Alert(models.Model):
     """Model for storing alerts and notifications"""
     
@@ -241,14 +503,188 @@ class Alert(models.Model):
     threshold_value = models.FloatField(null=True, blank=True)
     actual_value = models.FloatField(null=True, blank=True)
     
+    # Repeats within SENSOR_ALERT_COALESCE_WINDOW are counted on this row
+    occurrences = models.PositiveIntegerField(default=1)
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     acknowledged_at = models.DateTimeField(null=True, blank=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
     acknowledged_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='acknowledged_alerts')
     resolved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='resolved_alerts')
+    # Set once the notification dispatcher has picked the alert up; cleared when it reopens
+    notified_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tank', 'alert_type', 'last_seen_at']),
+            models.Index(fields=['status', '-created_at']),
+        ]
         
     def __str__(self):
         return f"{self.tank.name} - {self.title}"
+
+
+class AlertRule(models.Model):
+    """Threshold rule evaluated against incoming readings (see tanks.alerting)"""
+    
+    ALERT_TYPE_CHOICES = [
+        ('low_level', 'Low Water Level'),
+        ('high_level', 'High Water Level'),
+        ('temperature', 'Temperature Alert'),
+        ('ph', 'pH Alert'),
+        ('turbidity', 'Turbidity Alert'),
+    ]
+    # Reading field each alert type watches
+    FIELDS = {
+        'low_level': 'water_level_percentage',
+        'high_level': 'water_level_percentage',
+        'temperature': 'water_temperature_f',
+        'ph': 'ph_level',
+        'turbidity': 'turbidity_ntu',
+    }
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    alert_type = models.CharField(max_length=20, choices=ALERT_TYPE_CHOICES)
+    # The most specific rule wins: tank, then tank type, then the default (neither set)
+    tank = models.ForeignKey(WaterTank, on_delete=models.CASCADE, related_name='alert_rules', null=True, blank=True)
+    tank_type = models.CharField(max_length=20, choices=WaterTank.TANK_TYPE_CHOICES, blank=True)
+    
+    low_threshold = models.FloatField(null=True, blank=True, help_text="Alert when the value drops below this")
+    high_threshold = models.FloatField(null=True, blank=True, help_text="Alert when the value rises above this")
+    hysteresis = models.FloatField(
+        default=0.0, validators=[MinValueValidator(0)],
+        help_text="How far back inside the thresholds the value must return to resolve the alert"
+    )
+    min_duration = models.DurationField(default=timedelta(0), help_text="How long the condition must last before alerting")
+    cooldown = models.DurationField(default=timedelta(0), help_text="Quiet period after an alert resolves before it can fire again")
+    severity = models.CharField(max_length=10, choices=Alert.SEVERITY_CHOICES, default='medium')
+    enabled = models.BooleanField(default=True, help_text="A disabled rule also switches off the less specific ones")
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['alert_type', 'tank', 'tank_type']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tank', 'alert_type'],
+                condition=models.Q(tank__isnull=False),
+                name='unique_tank_alert_rule',
+            ),
+            models.UniqueConstraint(
+                fields=['tank_type', 'alert_type'],
+                condition=models.Q(tank__isnull=True),
+                name='unique_tank_type_alert_rule',
+            ),
+        ]
+        
+    def __str__(self):
+        return f"{self.get_alert_type_display()} - {self.scope}"
+    
+    def clean(self):
+        if self.tank_id and self.tank_type:
+            raise ValidationError("Set either a tank or a tank type, not both.")
+        if self.low_threshold is None and self.high_threshold is None:
+            raise ValidationError("Set a low or a high threshold.")
+    
+    @property
+    def scope(self):
+        if self.tank_id:
+            return self.tank.name
+        return self.get_tank_type_display() if self.tank_type else 'All tanks'
+    
+    @property
+    def field(self):
+        return self.FIELDS[self.alert_type]
+    
+    def breached(self, value, active=False):
+        """Whether ``value`` violates the rule; clearing an active alert takes ``hysteresis`` more"""
+        margin = self.hysteresis if active else 0.0
+        return (
+            (self.low_threshold is not None and value < self.low_threshold + margin)
+            or (self.high_threshold is not None and value > self.high_threshold - margin)
+        )
+
+
+class AnomalyBaseline(models.Model):
+    """Streaming statistics of one tank metric for anomaly detection (see tanks.anomaly)"""
+    
+    METRIC_CHOICES = [
+        ('level_slope', 'Water Level Change'),
+        ('temperature', 'Water Temperature'),
+        ('conductivity', 'Conductivity'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tank = models.ForeignKey(WaterTank, on_delete=models.CASCADE, related_name='anomaly_baselines')
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    
+    # Exponentially weighted mean and variance, overall and per local hour of day
+    samples = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0.0)
+    variance = models.FloatField(default=0.0)
+    hourly_samples = models.JSONField(default=list)
+    hourly_mean = models.JSONField(default=list)
+    hourly_variance = models.JSONField(default=list)
+    
+    # Anomalous readings in a row
+    streak = models.PositiveIntegerField(default=0)
+    # Last reading observed; the smoothed level for level_slope
+    last_value = models.FloatField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['tank', 'metric']
+        constraints = [
+            models.UniqueConstraint(fields=['tank', 'metric'], name='unique_anomaly_baseline'),
+        ]
+        
+    def __str__(self):
+        return f"{self.tank.name} - {self.get_metric_display()}"
+
+
+class Notification(models.Model):
+    """Message to a user about one or more alerts, with its delivery state (see tanks.notifications)"""
+    
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='alert_notifications')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    # Email address or phone number at the time the message was composed
+    recipient = models.CharField(max_length=254)
+    alerts = models.ManyToManyField(Alert, related_name='notifications')
+    is_digest = models.BooleanField(default=False)
+    
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        
+    def __str__(self):
+        return f"{self.get_channel_display()} to {self.recipient} - {self.subject}"
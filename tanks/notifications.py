@@ -0,0 +1,261 @@
+"""
+Alert notifications honouring each user's UserProfile preferences.
+
+``manage.py dispatch_notifications`` runs two steps every
+SENSOR_NOTIFY_INTERVAL seconds, apart from ingest:
+
+``collect`` claims a batch of alerts not notified yet, loads the
+subscribed users with one query for the whole batch and composes
+Notification rows: one per alert and channel, or a single digest per
+user and channel when the batch holds more than SENSOR_NOTIFY_DIGEST_AFTER
+alerts for them, so an alert storm becomes one message per user per pass.
+Users get the alerts at or above their ``alert_threshold``; alerts
+already resolved or acknowledged when picked up are not sent.
+
+``deliver`` sends the due notifications over one connection per channel
+and records the outcome. Failed sends are retried with exponential
+backoff, up to SENSOR_NOTIFY_MAX_ATTEMPTS attempts. Claimed rows are
+locked or leased, so several dispatchers can run side by side.
+
+Email goes through EMAIL_BACKEND, SMS through SENSOR_NOTIFY_SMS_BACKEND,
+which by default only logs.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from accounts.models import UserProfile
+
+from .models import Alert, Notification
+
+logger = logging.getLogger(__name__)
+
+# Severities sent for each UserProfile.alert_threshold
+THRESHOLDS = {
+    'all': ('low', 'medium', 'high', 'critical'),
+    'high': ('high', 'critical'),
+    'critical': ('critical',),
+}
+SEVERITY_ORDER = ['critical', 'high', 'medium', 'low']
+# Alerts listed in a digest email before the rest are only counted
+DIGEST_LINES = 50
+# How long a dispatcher may take to send the notifications it claimed
+LEASE = timedelta(minutes=5)
+BACKOFF = timedelta(minutes=1)
+MAX_BACKOFF = timedelta(hours=1)
+
+
+class LogSmsBackend:
+    """SMS stand-in that logs messages instead of sending them"""
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, recipient, body):
+        logger.info('SMS to %s: %s', recipient, body)
+
+
+def subscribers():
+    """``(user_id, channel, recipient, alert_threshold)`` of every user who wants notifications"""
+    profiles = UserProfile.objects.filter(user__is_active=True).filter(
+        Q(email_notifications=True) | Q(sms_notifications=True)
+    ).select_related('user')
+    subscribed = []
+    for profile in profiles:
+        threshold = profile.alert_threshold if profile.alert_threshold in THRESHOLDS else 'high'
+        if profile.email_notifications and profile.user.email:
+            subscribed.append((profile.user_id, 'email', profile.user.email, threshold))
+        if profile.sms_notifications and profile.phone_number:
+            subscribed.append((profile.user_id, 'sms', profile.phone_number, threshold))
+    return subscribed
+
+
+def _headline(alert):
+    return f'[{alert.get_severity_display()}] {alert.tank.name}: {alert.title}'
+
+
+def compose(alerts, channel):
+    """``(subject, body)`` of a message about ``alerts``, a digest when there are several"""
+    if len(alerts) == 1:
+        alert = alerts[0]
+        if channel == 'sms':
+            return _headline(alert), f'{_headline(alert)}. {alert.message}'
+        raised = timezone.localtime(alert.created_at)
+        return _headline(alert), (
+            f'{alert.message}\n\n'
+            f'Tank: {alert.tank.name}\n'
+            f'Type: {alert.get_alert_type_display()}\n'
+            f'Raised: {raised:%Y-%m-%d %H:%M %Z}\n'
+        )
+
+    severities = Counter(alert.severity for alert in alerts)
+    summary = ', '.join(f'{severities[severity]} {severity}' for severity in SEVERITY_ORDER if severities[severity])
+    subject = f'{len(alerts)} new alerts on {len({alert.tank_id for alert in alerts})} tanks'
+    if channel == 'sms':
+        return subject, f'{subject} ({summary}). See the dashboard for details.'
+    ordered = sorted(alerts, key=lambda alert: (SEVERITY_ORDER.index(alert.severity), alert.created_at))
+    lines = [f'{subject} ({summary}):', '']
+    lines.extend(f'- {_headline(alert)} - {alert.message}' for alert in ordered[:DIGEST_LINES])
+    if len(ordered) > DIGEST_LINES:
+        lines.append(f'... and {len(ordered) - DIGEST_LINES} more')
+    return subject, '\n'.join(lines) + '\n'
+
+
+def collect(batch_size=None):
+    """Compose notifications for a batch of new alerts, returning ``(alerts, notifications)`` counts"""
+    batch_size = batch_size or settings.SENSOR_NOTIFY_BATCH_SIZE
+    with transaction.atomic():
+        alerts = list(
+            Alert.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(notified_at__isnull=True).select_related('tank').order_by('created_at')[:batch_size]
+        )
+        if not alerts:
+            return 0, 0
+
+        active = [alert for alert in alerts if alert.status == 'active']
+        selected = {
+            threshold: [alert for alert in active if alert.severity in severities]
+            for threshold, severities in THRESHOLDS.items()
+        }
+        notifications = []
+        links = []
+        for user_id, channel, recipient, threshold in subscribers():
+            chosen = selected[threshold]
+            if len(chosen) > settings.SENSOR_NOTIFY_DIGEST_AFTER:
+                groups = [chosen]
+            else:
+                groups = [[alert] for alert in chosen]
+            for group in groups:
+                subject, body = compose(group, channel)
+                notification = Notification(
+                    user_id=user_id, channel=channel, recipient=recipient,
+                    is_digest=len(group) > 1, subject=subject[:200], body=body,
+                )
+                notifications.append(notification)
+                links.extend(
+                    Notification.alerts.through(notification_id=notification.id, alert_id=alert.id) for alert in group
+                )
+
+        Notification.objects.bulk_create(notifications)
+        Notification.alerts.through.objects.bulk_create(links)
+        Alert.objects.filter(id__in=[alert.id for alert in alerts]).update(notified_at=timezone.now())
+    return len(alerts), len(notifications)
+
+
+def _send_email(notifications):
+    """Send over one connection, returning ``{notification id: error}`` of the failures"""
+    errors = {}
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        return {notification.id: exc for notification in notifications}
+    try:
+        for notification in notifications:
+            message = EmailMessage(
+                notification.subject, notification.body, settings.DEFAULT_FROM_EMAIL, [notification.recipient],
+                connection=connection,
+            )
+            try:
+                if not message.send():
+                    raise RuntimeError('Message not accepted')
+            except Exception as exc:
+                errors[notification.id] = exc
+    finally:
+        connection.close()
+    return errors
+
+
+def _send_sms(notifications):
+    errors = {}
+    backend = import_string(settings.SENSOR_NOTIFY_SMS_BACKEND)()
+    try:
+        backend.open()
+    except Exception as exc:
+        return {notification.id: exc for notification in notifications}
+    try:
+        for notification in notifications:
+            try:
+                backend.send(notification.recipient, notification.body)
+            except Exception as exc:
+                errors[notification.id] = exc
+    finally:
+        backend.close()
+    return errors
+
+
+SENDERS = {'email': _send_email, 'sms': _send_sms}
+
+
+def deliver(batch_size=None):
+    """Send the due notifications, returning ``(sent, failed)`` counts"""
+    batch_size = batch_size or settings.SENSOR_NOTIFY_BATCH_SIZE
+    now = timezone.now()
+    with transaction.atomic():
+        due = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at')[:batch_size]
+        )
+        # Leased until sent, so another dispatcher leaves them alone
+        Notification.objects.filter(id__in=[notification.id for notification in due]).update(
+            next_attempt_at=now + LEASE,
+        )
+    if not due:
+        return 0, 0
+
+    errors = {}
+    for channel, sender in SENDERS.items():
+        batch = [notification for notification in due if notification.channel == channel]
+        if batch:
+            errors.update(sender(batch))
+
+    finished = timezone.now()
+    sent = [notification.id for notification in due if notification.id not in errors]
+    Notification.objects.filter(id__in=sent).update(
+        status='sent', sent_at=finished, attempts=F('attempts') + 1, last_error='',
+    )
+    failed = []
+    for notification in due:
+        if notification.id not in errors:
+            continue
+        notification.attempts += 1
+        notification.last_error = str(errors[notification.id])[:1000]
+        if notification.attempts >= settings.SENSOR_NOTIFY_MAX_ATTEMPTS:
+            notification.status = 'failed'
+        else:
+            notification.next_attempt_at = finished + min(BACKOFF * 2 ** (notification.attempts - 1), MAX_BACKOFF)
+        failed.append(notification)
+    Notification.objects.bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+    if failed:
+        logger.warning('%d notifications failed, first error: %s', len(failed), failed[0].last_error)
+    return len(sent), len(failed)
+
+
+def run(stop, interval, batch_size=None):
+    """Collect and deliver every ``interval`` seconds until ``stop`` (an Event) is set"""
+    batch_size = batch_size or settings.SENSOR_NOTIFY_BATCH_SIZE
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            claimed, composed = collect(batch_size)
+            sent, failed = deliver(batch_size)
+        except Exception:
+            logger.exception('Notification pass failed')
+            claimed = 0
+        else:
+            if claimed or sent or failed:
+                logger.info('%d alerts, %d notifications composed, %d sent, %d failed',
+                            claimed, composed, sent, failed)
+        # A full batch means more are waiting
+        if claimed < batch_size:
+            stop.wait(interval)
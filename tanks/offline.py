@@ -0,0 +1,220 @@
+"""
+Deadline-driven ``sensor_offline`` alerts.
+
+``manage.py detect_offline`` runs an OfflineDetector. Every tracked tank
+and sensor has a deadline: the time of its last reading plus
+SENSOR_OFFLINE_AFTER. Deadlines are kept in a min-heap, and the detector
+sleeps until the earliest one. Each device whose deadline passes gets a
+``sensor_offline`` alert, which is resolved as soon as the device reports
+again.
+
+Ingest already records each tank's newest reading in TankLatestState and
+each sensor's in ``Sensor.last_reading_at``. The detector follows those
+rows through their indexed ``updated_at`` columns every
+SENSOR_OFFLINE_POLL seconds, and once more right before firing, so
+SensorData is never scanned. Each table is read from the greatest
+``updated_at`` seen so far, less SENSOR_OFFLINE_POLL_OVERLAP: a row
+committed late carries the time its transaction wrote it, so the overlap
+must cover the longest ingest transaction (and clock skew between hosts).
+
+A new reading only updates the device's last-seen time. Its heap entry is
+re-scheduled lazily when it comes due, so the heap holds at most one entry
+per device and ingest costs O(1). Startup loads both tables and the open
+alerts in three queries and heapifies them.
+
+Sensors of a tank that is offline as a whole are not alerted separately.
+"""
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .alerting import store
+from .models import Alert, Sensor, TankLatestState
+
+logger = logging.getLogger(__name__)
+
+TANK = 'tank'
+SENSOR = 'sensor'
+OPEN = ('active', 'acknowledged')
+# Sensors in these states are expected to be silent
+SILENT_SENSOR_STATUSES = ('inactive', 'maintenance')
+
+
+def _epoch(value):
+    return value.timestamp()
+
+
+class OfflineDetector:
+    """Heap of per-device report deadlines with the open offline alerts"""
+
+    def __init__(self, timeout, overlap=None):
+        self.timeout = float(timeout)
+        overlap = settings.SENSOR_OFFLINE_POLL_OVERLAP if overlap is None else overlap
+        self.overlap = timedelta(seconds=overlap)
+        self._heap = []
+        self._queued = set()
+        # Keyed by (TANK, tank_id) or (SENSOR, sensor_id)
+        self._last_seen = {}
+        self._open = {}
+        self._tank_of = {}
+        # Greatest updated_at seen per table
+        self._cursors = {}
+        self._resolved = []
+        self.fired = 0
+        self.recovered = 0
+
+    def load(self):
+        """Rebuild every deadline and the open alerts from the database"""
+        started = timezone.now()
+        self._heap, self._queued, self._last_seen, self._tank_of = [], set(), {}, {}
+        tanks = TankLatestState.objects.filter(tank__status='active').values_list('tank_id', 'timestamp')
+        for tank_id, timestamp in tanks.iterator(chunk_size=10000):
+            self._last_seen[(TANK, tank_id)] = _epoch(timestamp)
+        for sensor_id, tank_id, timestamp in self._sensors().iterator(chunk_size=10000):
+            self._last_seen[(SENSOR, sensor_id)] = _epoch(timestamp)
+            self._tank_of[sensor_id] = tank_id
+
+        self._heap = [(seen + self.timeout, *key) for key, seen in self._last_seen.items()]
+        heapq.heapify(self._heap)
+        self._queued = set(self._last_seen)
+
+        self._open = {}
+        alerts = Alert.objects.filter(alert_type='sensor_offline', status__in=OPEN)
+        for alert_id, tank_id, sensor_id in alerts.values_list('id', 'tank_id', 'sensor_id'):
+            self._open[(SENSOR, sensor_id) if sensor_id else (TANK, tank_id)] = alert_id
+        # Devices that reported while no detector was running
+        now = started.timestamp()
+        for key in [key for key in self._open if self._last_seen.get(key, float('-inf')) + self.timeout > now]:
+            self._resolved.append(self._open.pop(key))
+        self._cursors = {TANK: started, SENSOR: started}
+        logger.info('Tracking %d devices, %d offline', len(self._heap), len(self._open))
+
+    def _sensors(self, *extra):
+        return Sensor.objects.filter(
+            last_reading_at__isnull=False, tank__status='active',
+        ).exclude(status__in=SILENT_SENSOR_STATUSES).order_by().values_list(
+            'id', 'tank_id', 'last_reading_at', *extra
+        )
+
+    def seen(self, key, timestamp):
+        """Record a report from a device (``timestamp`` in epoch seconds)"""
+        if timestamp <= self._last_seen.get(key, float('-inf')):
+            return
+        self._last_seen[key] = timestamp
+        alert_id = self._open.pop(key, None)
+        if alert_id is not None:
+            self._resolved.append(alert_id)
+        if key not in self._queued:
+            heapq.heappush(self._heap, (timestamp + self.timeout, *key))
+            self._queued.add(key)
+
+    def poll(self):
+        """Pick up the tanks and sensors that reported since the last poll"""
+        close_old_connections()
+        started = timezone.now()
+        tanks = TankLatestState.objects.filter(
+            updated_at__gte=self._cursors[TANK] - self.overlap, tank__status='active',
+        ).order_by().values_list('tank_id', 'timestamp', 'updated_at')
+        for tank_id, timestamp, updated_at in tanks:
+            self.seen((TANK, tank_id), _epoch(timestamp))
+            self._cursors[TANK] = max(self._cursors[TANK], updated_at)
+        sensors = self._sensors('updated_at').filter(updated_at__gte=self._cursors[SENSOR] - self.overlap)
+        for sensor_id, tank_id, timestamp, updated_at in sensors:
+            self._tank_of[sensor_id] = tank_id
+            self.seen((SENSOR, sensor_id), _epoch(timestamp))
+            self._cursors[SENSOR] = max(self._cursors[SENSOR], updated_at)
+
+        if self._resolved:
+            resolved, self._resolved = self._resolved, []
+            Alert.objects.filter(id__in=resolved, status__in=OPEN).update(status='resolved', resolved_at=started)
+            self.recovered += len(resolved)
+            logger.info('%d devices back online', len(resolved))
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
+
+    def fire_due(self, now=None):
+        """Open alerts for every device whose deadline has passed, returning them"""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, kind, device_id = heapq.heappop(self._heap)
+            key = (kind, device_id)
+            actual = self._last_seen[key] + self.timeout
+            if actual > now:
+                # Reported since this entry was queued
+                heapq.heappush(self._heap, (actual, kind, device_id))
+                continue
+            self._queued.discard(key)
+            if key not in self._open:
+                due.append(key)
+
+        # Tanks first, so their sensors are folded into the tank's alert
+        due.sort(key=lambda key: key[0] != TANK)
+        alerts = []
+        for kind, device_id in due:
+            tank_id = device_id if kind == TANK else self._tank_of[device_id]
+            if kind == SENSOR and (TANK, tank_id) in self._open:
+                # Check again once the tank is back
+                heapq.heappush(self._heap, (now + self.timeout, kind, device_id))
+                self._queued.add((kind, device_id))
+                continue
+            last = datetime.fromtimestamp(self._last_seen[(kind, device_id)], tz=dt_timezone.utc)
+            alert = Alert(
+                tank_id=tank_id,
+                sensor_id=device_id if kind == SENSOR else None,
+                alert_type='sensor_offline',
+                severity='high' if kind == TANK else 'medium',
+                title='Tank Offline' if kind == TANK else 'Sensor Offline',
+                message=f'No readings since {last:%Y-%m-%d %H:%M:%S} UTC.',
+                threshold_value=self.timeout / 60,
+                actual_value=round((now - last.timestamp()) / 60, 1),
+            )
+            self._open[(kind, device_id)] = alert.id
+            alerts.append(alert)
+
+        if alerts:
+            # A device that keeps dropping out is counted on its recent alert
+            folded = store(alerts)
+            for alert in alerts:
+                if alert.id in folded:
+                    key = (SENSOR, alert.sensor_id) if alert.sensor_id else (TANK, alert.tank_id)
+                    self._open[key] = folded[alert.id]
+            self.fired += len(alerts)
+            logger.info('%d devices went offline', len(alerts))
+        return alerts
+
+    def run(self, stop, poll_interval, reload_interval):
+        """Poll, fire and sleep until the next deadline or poll, until ``stop`` (an Event) is set"""
+        self.load()
+        next_poll = time.monotonic() + poll_interval
+        next_reload = time.monotonic() + reload_interval
+        while not stop.is_set():
+            if time.monotonic() >= next_reload:
+                self.load()
+                next_reload = time.monotonic() + reload_interval
+            deadline = self.next_deadline()
+            # Catch up with ingest right before firing so a late report is not mistaken for silence
+            if time.monotonic() >= next_poll or (deadline is not None and deadline <= time.time()):
+                self.poll()
+                next_poll = time.monotonic() + poll_interval
+            self.fire_due()
+
+            wait = min(next_poll, next_reload) - time.monotonic()
+            deadline = self.next_deadline()
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+            stop.wait(max(0.0, wait))
+
+    def stats(self):
+        return {
+            'devices': len(self._last_seen),
+            'offline': len(self._open),
+            'fired': self.fired,
+            'recovered': self.recovered,
+        }
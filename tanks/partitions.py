@@ -0,0 +1,200 @@
+"""
+Monthly range partitioning of SensorData on PostgreSQL.
+
+Migration 0003 turns ``tanks_sensordata`` into a table partitioned by
+``RANGE (timestamp)`` with one partition per UTC month plus a default
+partition for anything outside them. The model is unchanged: the primary
+key becomes ``(id, timestamp)`` in the database because unique indexes on
+a partitioned table must contain the partition key, and both unique
+reading constraints already do. Queries filtered on ``timestamp`` only
+touch the partitions they need, and retention detaches or drops whole
+partitions instead of deleting rows.
+
+``manage.py manage_partitions`` keeps partitions created ahead of time and
+applies retention. Everything here is a no-op on other databases.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from .models import SensorData
+
+PARTITION_PATTERN = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def is_supported(connection):
+    return connection.vendor == 'postgresql'
+
+
+def month_start(value):
+    """First instant of ``value``'s UTC month"""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def default_partition_name(table):
+    return f'{table}_default'
+
+
+def is_partitioned(connection, table=None):
+    table = table or SensorData._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection, table=None):
+    """Return ``{month: partition_name}`` for the attached monthly partitions"""
+    table = table or SensorData._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)',
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_PATTERN.search(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def default_partition_months(connection, table=None):
+    """UTC months that have rows sitting in the default partition"""
+    table = table or SensorData._meta.db_table
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE 'UTC') "
+            f'FROM {qn(default_partition_name(table))}'
+        )
+        return sorted(row[0].replace(tzinfo=dt_timezone.utc) for row in cursor.fetchall())
+
+
+def create_partition(connection, month, table=None):
+    """Create and attach the partition for ``month``.
+
+    Rows of that month already caught by the default partition are moved
+    into the new partition first; otherwise attaching it would fail.
+    """
+    table = table or SensorData._meta.db_table
+    qn = connection.ops.quote_name
+    name = partition_name(table, month)
+    default = default_partition_name(table)
+    bounds = [month, add_months(month, 1)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {qn(default)} '
+            f'WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            f'INSERT INTO {qn(name)} SELECT * FROM moved',
+            bounds,
+        )
+        cursor.execute(
+            f'ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} '
+            f"FOR VALUES FROM ('{bounds[0].isoformat()}') TO ('{bounds[1].isoformat()}')"
+        )
+    return name
+
+
+def detach_partition(connection, name, drop=False, table=None):
+    table = table or SensorData._meta.db_table
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}')
+        if drop:
+            cursor.execute(f'DROP TABLE {qn(name)}')
+
+
+def _table_definition(cursor, table):
+    """Index and foreign key DDL of ``table`` (minus its primary key)"""
+    cursor.execute(
+        'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s '
+        'AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) '
+        "AND contype = 'p')",
+        [table, table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'",
+        [table],
+    )
+    primary_key = cursor.fetchone()[0]
+    return indexes, foreign_keys, primary_key
+
+
+def rebuild_table(connection, partitioned, months_ahead=3, table=None):
+    """Copy ``table`` into a partitioned (or plain) replacement and swap it in.
+
+    Index and constraint names are preserved so later Django migrations
+    keep finding them. This rewrites the whole table under an exclusive
+    lock, so run it in a maintenance window on large installations.
+    """
+    table = table or SensorData._meta.db_table
+    qn = connection.ops.quote_name
+    old = f'{table}_old'
+
+    with connection.cursor() as cursor:
+        indexes, foreign_keys, primary_key = _table_definition(cursor, table)
+        cursor.execute(f'LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old)}')
+        cursor.execute(f'ALTER TABLE {qn(old)} RENAME CONSTRAINT {qn(primary_key)} TO {qn(primary_key + "_old")}')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {qn(name)} RENAME TO {qn(name + "_old")}')
+
+        if partitioned:
+            cursor.execute(
+                f'CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")'
+            )
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(primary_key)} PRIMARY KEY (id, "timestamp")')
+        else:
+            cursor.execute(f'CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS)')
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(primary_key)} PRIMARY KEY (id)')
+        for _, definition in indexes:
+            # pg_indexes captured the definitions before the rename; indexes of a
+            # partitioned table are reported as "ON ONLY"
+            cursor.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(old)} DROP CONSTRAINT {qn(name)}')
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+        if partitioned:
+            cursor.execute(
+                f'CREATE TABLE {qn(default_partition_name(table))} PARTITION OF {qn(table)} DEFAULT'
+            )
+            cursor.execute(f'SELECT min("timestamp") FROM {qn(old)}')
+            oldest = cursor.fetchone()[0]
+
+    if partitioned:
+        current = month_start(datetime.now(dt_timezone.utc))
+        # Cover existing history plus last month, which sample data backfills
+        month = min(month_start(oldest), add_months(current, -1)) if oldest else add_months(current, -1)
+        while month <= add_months(current, months_ahead):
+            create_partition(connection, month, table)
+            month = add_months(month, 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(old)}')
+        cursor.execute(f'DROP TABLE {qn(old)}')
@@ -0,0 +1,449 @@
+"""
+Shared-memory cache of each tank's most recent raw readings.
+
+Raw chart windows (the last day or week of a tank) used to be queried
+again by every gunicorn worker. Instead, all processes on a host map one
+file, SENSOR_RECENT_CACHE_PATH (ideally on tmpfs), that holds a fixed-size
+ring buffer per tank:
+
+    header      layout and shared hit/miss counters
+    directory   per slot: tank id, sequence counter, ring position, coverage
+    timestamps  int64 epoch microseconds          [slots, points]
+    values      float64, NaN for missing          [slots, fields, points]
+
+A slot is *covered* from some instant on: every stored reading since then
+is in its ring. A window starting at or after that instant is sliced out
+of the mapped arrays without touching the database; any other window is
+loaded from the database and becomes the slot's new contents. Once a full
+ring shows a window holds more readings than SENSOR_RECENT_CACHE_POINTS
+(a week at one reading every 5 minutes), that window bypasses the
+cache, so it does not reload the slot under its lock on every request
+and evict the shorter window the slot still covers.
+
+Committed ingest chunks are appended through ``readings_ingested``. As the
+ingest process may run on another host, a covered slot also asks the
+database for readings newer than its newest one at most every
+SENSOR_RECENT_CACHE_TAIL_CHECK seconds, and is reloaded outright after
+SENSOR_RECENT_CACHE_RELOAD seconds. Out-of-order readings and writes that
+bypass ingest just mark the slot uncovered.
+
+Writers serialize on ``fcntl`` locks over a slot's byte in a lock file;
+readers take no lock and discard what they read if the slot's sequence
+counter moved meanwhile (it is odd while a write is in progress).
+"""
+import fcntl
+import logging
+import mmap
+import os
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .archive import epoch_us, to_datetimes
+from .models import SensorData, SensorDataRollup
+from .signals import readings_ingested
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SWTRING1'
+# The fields charts plot; windows asking for anything else go to the database
+CACHE_FIELDS = list(SensorDataRollup.METRICS.values())
+UNCOVERED = np.iinfo(np.int64).max
+EMPTY = np.iinfo(np.int64).min
+# Slots a tank may hash to; the least recently read one is evicted when all are taken
+PROBES = 8
+READ_ATTEMPTS = 3
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('slots', '<u4'),
+    ('points', '<u4'),
+    ('fields_crc', '<u4'),
+    ('hits', '<u8'),
+    ('misses', '<u8'),
+    ('bypassed', '<u8'),
+    ('loads', '<u8'),
+    ('appended', '<u8'),
+    ('invalidated', '<u8'),
+    ('evicted', '<u8'),
+])
+SLOT_DTYPE = np.dtype([
+    ('tank', '<u8', (2,)),
+    ('seq', '<u8'),
+    ('head', '<u4'),
+    ('length', '<u4'),
+    ('covered_from', '<i8'),
+    ('newest', '<i8'),
+    ('loaded_at', '<f8'),
+    ('checked_at', '<f8'),
+    ('used_at', '<f8'),
+])
+
+
+def _align(offset):
+    return (offset + 63) // 64 * 64
+
+
+def _key(tank_id):
+    """A tank id as the two 64-bit halves stored in the directory"""
+    value = uuid.UUID(str(tank_id)).int
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+def _holds(entry, key):
+    return int(entry['tank'][0]) == key[0] and int(entry['tank'][1]) == key[1]
+
+
+class RecentReadingsCache:
+    """Per-tank ring buffers of recent readings in a file shared by all local processes"""
+
+    def __init__(self, path, slots, points, max_age, tail_check, reload_after):
+        self.path = path
+        self.slots = slots
+        self.points = points
+        self.max_age = max_age
+        self.tail_check = tail_check
+        self.reload_after = reload_after
+        self.fields = CACHE_FIELDS
+        self._fields_crc = zlib.crc32(','.join(self.fields).encode())
+
+        self._directory_offset = _align(HEADER_DTYPE.itemsize)
+        self._timestamps_offset = _align(self._directory_offset + SLOT_DTYPE.itemsize * slots)
+        self._values_offset = _align(self._timestamps_offset + 8 * slots * points)
+        self.size = self._values_offset + 8 * slots * len(self.fields) * points
+
+        self._lock_fd = os.open(f'{path}.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        # fcntl locks only exclude other processes
+        self._thread_lock = threading.RLock()
+        with self._locked(-1):
+            self._map = self._open()
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=self._map)
+        self.directory = np.ndarray((slots,), SLOT_DTYPE, buffer=self._map, offset=self._directory_offset)
+        self.timestamps = np.ndarray((slots, points), np.int64, buffer=self._map, offset=self._timestamps_offset)
+        self.values = np.ndarray(
+            (slots, len(self.fields), points), np.float64, buffer=self._map, offset=self._values_offset
+        )
+
+    def _open(self):
+        """Map the cache file, (re)creating it when missing or laid out differently"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size == self.size:
+                mapped = mmap.mmap(fd, self.size)
+                header = np.ndarray((), HEADER_DTYPE, buffer=mapped)
+                if (header['magic'] == MAGIC and header['slots'] == self.slots
+                        and header['points'] == self.points and header['fields_crc'] == self._fields_crc):
+                    return mapped
+                del header
+                mapped.close()
+            # Other processes may still map the old file, so replace rather than truncate it
+            os.close(fd)
+            os.unlink(self.path)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+            os.ftruncate(fd, self.size)
+            mapped = mmap.mmap(fd, self.size)
+            directory = np.ndarray((self.slots,), SLOT_DTYPE, buffer=mapped, offset=self._directory_offset)
+            directory['covered_from'] = UNCOVERED
+            directory['newest'] = EMPTY
+            header = np.ndarray((), HEADER_DTYPE, buffer=mapped)
+            header['slots'], header['points'], header['fields_crc'] = self.slots, self.points, self._fields_crc
+            # Written last: a header with the magic is a fully initialized file
+            header['magic'] = MAGIC
+            del directory, header
+            return mapped
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _locked(self, slot):
+        """Exclusive lock on one slot, or on slot assignment for ``-1``"""
+        with self._thread_lock:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, slot + 1)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, slot + 1)
+
+    @contextmanager
+    def _writing(self, slot):
+        """Lock a slot and keep its sequence counter odd while it changes"""
+        with self._locked(slot):
+            entry = self.directory[slot]
+            entry['seq'] += 1
+            try:
+                yield entry
+            finally:
+                entry['seq'] += 1
+
+    def _probe(self, key):
+        start = (key[0] ^ key[1]) % self.slots
+        return [(start + step) % self.slots for step in range(min(PROBES, self.slots))]
+
+    def _find(self, key):
+        for slot in self._probe(key):
+            if _holds(self.directory[slot], key):
+                return slot
+        return None
+
+    def _claim(self, key):
+        """Slot for ``key``, taking a free one or evicting the least recently read"""
+        with self._locked(-1):
+            slot = self._find(key)
+            if slot is not None:
+                return slot
+            candidates = self._probe(key)
+            free = [slot for slot in candidates if not self.directory[slot]['tank'].any()]
+            slot = free[0] if free else min(candidates, key=lambda slot: self.directory[slot]['used_at'])
+            if not free:
+                self.header['evicted'] += 1
+            with self._writing(slot) as entry:
+                entry['tank'] = key
+                entry['length'] = entry['head'] = 0
+                entry['covered_from'], entry['newest'] = UNCOVERED, EMPTY
+            return slot
+
+    def window(self, tank_id, fields, start, end):
+        """Readings of ``fields`` in ``[start, end)`` as ``(stamps, {field: values})``.
+
+        ``stamps`` are int64 epoch microseconds and the values float64
+        arrays with NaN for missing, as in ``archive.load_range``.
+
+        Returns None when the window cannot be cached (other fields,
+        older than SENSOR_RECENT_CACHE_MAX_AGE, or more readings than the
+        ring holds); the caller queries the database itself then.
+        """
+        if any(field not in self.fields for field in fields) or \
+                start < timezone.now() - self.max_age:
+            self.header['bypassed'] += 1
+            return None
+
+        key = _key(tank_id)
+        start_us, end_us = epoch_us(start), epoch_us(end)
+        slot = self._find(key)
+        if slot is not None:
+            now = time.time()
+            entry = self.directory[slot]
+            if entry['covered_from'] > start_us and self._overflows(slot, entry, start_us):
+                # Loading would keep only the newest readings and evict what the slot covers
+                self.header['bypassed'] += 1
+                return None
+            if entry['covered_from'] <= start_us and now - entry['loaded_at'] < self.reload_after:
+                if now - entry['checked_at'] >= self.tail_check:
+                    self._catch_up(slot, key, tank_id)
+                result = self._read(slot, key, fields, start_us, end_us)
+                if result is not None:
+                    entry['used_at'] = now
+                    self.header['hits'] += 1
+                    return result
+
+        self.header['misses'] += 1
+        return self._load(tank_id, key, fields, start, start_us, end_us)
+
+    def _overflows(self, slot, entry, start_us):
+        """Whether the slot's full ring already holds more readings since ``start_us`` than fit"""
+        length, head = int(entry['length']), int(entry['head'])
+        # A full ring's oldest reading sits at its head
+        return length == self.points and int(self.timestamps[slot, head]) > start_us
+
+    def _read(self, slot, key, fields, start_us, end_us):
+        """Slice a window out of a covered slot, or None if a writer got in the way"""
+        entry = self.directory[slot]
+        indexes = [self.fields.index(field) for field in fields]
+        for _ in range(READ_ATTEMPTS):
+            seq = int(entry['seq'])
+            if seq % 2 or not _holds(entry, key) or entry['covered_from'] > start_us:
+                return None
+            length, head = int(entry['length']), int(entry['head'])
+            segments = [(0, length)] if length < self.points else [(head, self.points), (0, head)]
+
+            stamps, columns = [], [[] for _ in indexes]
+            for low, high in segments:
+                times = self.timestamps[slot, low:high]
+                first = low + int(np.searchsorted(times, start_us))
+                last = low + int(np.searchsorted(times, end_us))
+                stamps.append(np.array(self.timestamps[slot, first:last]))
+                for column, index in zip(columns, indexes):
+                    column.append(np.array(self.values[slot, index, first:last]))
+
+            if int(entry['seq']) == seq:
+                values = {field: np.concatenate(column) for field, column in zip(fields, columns)}
+                return np.concatenate(stamps), values
+        return None
+
+    def _load(self, tank_id, key, fields, start, start_us, end_us):
+        """Fill the tank's slot from the database with everything since ``start``"""
+        slot = self._claim(key)
+        # The query runs under the slot lock so no ingest append can slip in between
+        with self._writing(slot) as entry:
+            if not _holds(entry, key):
+                return None
+            rows = list(
+                SensorData.objects.filter(tank_id=tank_id, timestamp__gte=start)
+                .order_by('timestamp')
+                .values_list('timestamp', *self.fields)
+            )
+            stamps = np.array([epoch_us(row[0]) for row in rows], dtype=np.int64)
+            matrix = np.array(
+                [[np.nan if value is None else value for value in row[1:]] for row in rows],
+                dtype=np.float64,
+            ).reshape(len(rows), len(self.fields))
+
+            kept = min(len(rows), self.points)
+            self.timestamps[slot, :kept] = stamps[len(rows) - kept:]
+            self.values[slot, :, :kept] = matrix[len(rows) - kept:].T
+            entry['length'] = kept
+            entry['head'] = kept % self.points
+            entry['newest'] = stamps[-1] if len(rows) else EMPTY
+            # Readings that did not fit are not covered, including ties with the oldest kept
+            entry['covered_from'] = start_us if kept == len(rows) else stamps[len(rows) - kept - 1] + 1
+            entry['loaded_at'] = entry['checked_at'] = entry['used_at'] = time.time()
+            self.header['loads'] += 1
+
+        window = (stamps >= start_us) & (stamps < end_us)
+        values = {field: matrix[window, self.fields.index(field)] for field in fields}
+        return stamps[window], values
+
+    def _catch_up(self, slot, key, tank_id):
+        """Append readings stored since the slot's newest one (e.g. by another host)"""
+        with self._writing(slot) as entry:
+            if not _holds(entry, key) or entry['covered_from'] == UNCOVERED:
+                return
+            newest = to_datetimes(np.array([entry['newest']]))[0] if entry['newest'] != EMPTY else None
+            rows = SensorData.objects.filter(tank_id=tank_id).order_by('timestamp')
+            if newest is not None:
+                rows = rows.filter(timestamp__gt=newest)
+            self._push(slot, entry, rows.values_list('timestamp', *self.fields))
+            entry['checked_at'] = time.time()
+
+    def _push(self, slot, entry, rows):
+        """Append ``(timestamp, *fields)`` rows in time order to a locked slot"""
+        for timestamp, *values in rows:
+            stamp = epoch_us(timestamp)
+            if stamp <= entry['newest']:
+                # Out of order (or possibly already loaded): reload on next read
+                entry['covered_from'] = UNCOVERED
+                self.header['invalidated'] += 1
+                return
+            head = int(entry['head'])
+            if entry['length'] == self.points:
+                entry['covered_from'] = max(int(entry['covered_from']), int(self.timestamps[slot, head]) + 1)
+            else:
+                entry['length'] += 1
+            self.timestamps[slot, head] = stamp
+            self.values[slot, :, head] = [np.nan if value is None else value for value in values]
+            entry['head'] = (head + 1) % self.points
+            entry['newest'] = stamp
+            self.header['appended'] += 1
+
+    def append(self, readings):
+        """Add newly committed SensorData to the slots of tanks being cached"""
+        by_tank = {}
+        for reading in readings:
+            by_tank.setdefault(reading.tank_id, []).append(reading)
+        for tank_id, tank_readings in by_tank.items():
+            key = _key(tank_id)
+            slot = self._find(key)
+            if slot is None:
+                continue
+            tank_readings.sort(key=lambda reading: reading.timestamp)
+            rows = [
+                (reading.timestamp, *(getattr(reading, field) for field in self.fields))
+                for reading in tank_readings
+            ]
+            with self._writing(slot) as entry:
+                if _holds(entry, key) and entry['covered_from'] != UNCOVERED:
+                    self._push(slot, entry, rows)
+
+    def invalidate(self, tank_ids):
+        """Forget what is cached for these tanks, after writes that bypass ingest"""
+        for tank_id in tank_ids:
+            key = _key(tank_id)
+            slot = self._find(key)
+            if slot is None:
+                continue
+            with self._writing(slot) as entry:
+                if _holds(entry, key):
+                    entry['covered_from'] = UNCOVERED
+                    self.header['invalidated'] += 1
+
+    def stats(self):
+        """Counters shared by every process using the file (approximate under contention)"""
+        counters = {name: int(self.header[name]) for name in HEADER_DTYPE.names if name not in ('magic', 'fields_crc')}
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / lookups, 4) if lookups else None
+        used = self.directory['tank'].any(axis=1)
+        counters['tanks'] = int(np.count_nonzero(used))
+        counters['covered_tanks'] = int(np.count_nonzero(used & (self.directory['covered_from'] != UNCOVERED)))
+        counters['path'] = self.path
+        counters['size_bytes'] = self.size
+        return counters
+
+
+_cache = None
+_unavailable = False
+
+
+def get_cache():
+    """Process-wide handle on the shared cache, None when disabled or unusable"""
+    global _cache, _unavailable
+    if _cache is None and not _unavailable:
+        if not settings.SENSOR_RECENT_CACHE_ENABLED:
+            _unavailable = True
+            return None
+        try:
+            _cache = RecentReadingsCache(
+                settings.SENSOR_RECENT_CACHE_PATH,
+                slots=settings.SENSOR_RECENT_CACHE_TANKS,
+                points=settings.SENSOR_RECENT_CACHE_POINTS,
+                max_age=timedelta(seconds=settings.SENSOR_RECENT_CACHE_MAX_AGE),
+                tail_check=settings.SENSOR_RECENT_CACHE_TAIL_CHECK,
+                reload_after=settings.SENSOR_RECENT_CACHE_RELOAD,
+            )
+        except OSError:
+            logger.exception('Recent readings cache unavailable, reading from the database')
+            _unavailable = True
+    return _cache
+
+
+def window(tank_id, fields, start, end):
+    """Cached raw readings of a tank, or None to query the database"""
+    cache = get_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.window(tank_id, fields, start, end)
+    except OSError:
+        logger.exception('Recent readings cache read failed for tank %s', tank_id)
+        return None
+
+
+def invalidate(tank_ids):
+    """Drop the cached windows of tanks whose readings changed outside ingest"""
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate(tank_ids)
+
+
+def stats():
+    cache = get_cache()
+    return cache.stats() if cache is not None else None
+
+
+@receiver(readings_ingested)
+def append_readings(sender, readings, **kwargs):
+    """Append committed readings to the shared cache; a failure only costs hits"""
+    cache = get_cache()
+    if cache is None:
+        return
+    try:
+        cache.append(readings)
+    except Exception:
+        logger.exception('Failed to append %d readings to the recent readings cache', len(readings))
@@ -0,0 +1,235 @@
+"""
+Hourly and daily rollups of sensor readings.
+
+Each SensorDataRollup row holds, per tank and bucket, the min, max, sum,
+count and last value of the key measurements. Rollups are maintained
+incrementally: every committed ingest chunk is aggregated in memory and
+merged into its buckets with one upsert per resolution, so late readings
+simply update older buckets. Hourly buckets are UTC hours; daily buckets
+are local days (settings.TIME_ZONE) so they match what operators see.
+
+Writes that bypass ingest (bulk loads, reprocessing) call ``rebuild`` for
+the affected range, which is also what ``manage.py rebuild_rollups`` runs.
+Rebuilds read archived months too, so archiving keeps rollups intact.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+import pandas as pd
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max, Min
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import archive
+from .db import greatest, least, upsert
+from .models import SensorData, SensorDataArchive, SensorDataRollup, WaterTank
+from .signals import readings_ingested
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = ('hour', 'day')
+METRICS = SensorDataRollup.METRICS
+# Raw rows loaded per tank at a time while rebuilding
+REBUILD_WINDOW = timedelta(days=31)
+
+
+def bucket_starts(timestamps, resolution):
+    """Floor a tz-aware UTC DatetimeIndex/Series to bucket starts (in UTC)"""
+    timestamps = pd.DatetimeIndex(timestamps)
+    if resolution == 'hour':
+        return timestamps.floor('h')
+    local = timestamps.tz_convert(settings.TIME_ZONE).floor('D', ambiguous=False, nonexistent='shift_forward')
+    return local.tz_convert('UTC')
+
+
+def aggregate(frame, resolution):
+    """Aggregate a frame of raw readings into rollup row dicts.
+
+    ``frame`` has ``tank_id``, ``timestamp`` (tz-aware UTC) and the
+    SensorData columns named in ``METRICS``.
+    """
+    if frame.empty:
+        return []
+    frame = frame.sort_values('timestamp')
+    frame['bucket_start'] = bucket_starts(frame['timestamp'], resolution)
+
+    spec = {'timestamp': ['count', 'max']}
+    for field in METRICS.values():
+        spec[field] = ['min', 'max', 'sum', 'count', 'last']
+    grouped = frame.groupby(['tank_id', 'bucket_start'], sort=False).agg(spec)
+
+    now = timezone.now()
+    rows = []
+    for (tank_id, bucket_start), values in zip(grouped.index, grouped.itertuples(index=False)):
+        values = iter(values)
+        row = {
+            'id': uuid.uuid4(),
+            'tank_id': tank_id,
+            'resolution': resolution,
+            'bucket_start': bucket_start.to_pydatetime(),
+            'reading_count': int(next(values)),
+            'last_timestamp': next(values).to_pydatetime(),
+        }
+        for metric in METRICS:
+            minimum, maximum, total, count, last = (next(values) for _ in range(5))
+            row[f'{metric}_min'] = None if pd.isna(minimum) else float(minimum)
+            row[f'{metric}_max'] = None if pd.isna(maximum) else float(maximum)
+            row[f'{metric}_sum'] = float(total)
+            row[f'{metric}_count'] = int(count)
+            row[f'{metric}_last'] = None if pd.isna(last) else float(last)
+        row['updated_at'] = now
+        rows.append(row)
+    return rows
+
+
+def _merge_updates(connection):
+    """SET expressions that merge an incoming partial bucket into a stored one.
+
+    ``*_last`` is exact while readings arrive in time order; a late batch
+    only fills in values the bucket was missing, and a rebuild makes it exact.
+    """
+    existing = '{table}.%s'
+    newer = 'excluded.last_timestamp >= {table}.last_timestamp'
+    updates = {
+        'reading_count': '{table}.reading_count + excluded.reading_count',
+        'last_timestamp': greatest(existing % 'last_timestamp', 'excluded.last_timestamp', connection),
+        'updated_at': 'excluded.updated_at',
+    }
+    for metric in METRICS:
+        updates[f'{metric}_min'] = least(existing % f'{metric}_min', f'excluded.{metric}_min', connection)
+        updates[f'{metric}_max'] = greatest(existing % f'{metric}_max', f'excluded.{metric}_max', connection)
+        updates[f'{metric}_sum'] = f'{{table}}.{metric}_sum + excluded.{metric}_sum'
+        updates[f'{metric}_count'] = f'{{table}}.{metric}_count + excluded.{metric}_count'
+        updates[f'{metric}_last'] = (
+            f'CASE WHEN {newer} THEN COALESCE(excluded.{metric}_last, {{table}}.{metric}_last) '
+            f'ELSE COALESCE({{table}}.{metric}_last, excluded.{metric}_last) END'
+        )
+    return updates
+
+
+def merge(frame, resolutions=RESOLUTIONS):
+    """Merge the readings in ``frame`` into the stored rollups"""
+    connection = connections[router.db_for_write(SensorDataRollup)]
+    updates = _merge_updates(connection)
+    for resolution in resolutions:
+        upsert(
+            SensorDataRollup,
+            aggregate(frame, resolution),
+            ['tank', 'resolution', 'bucket_start'],
+            updates,
+        )
+
+
+def readings_frame(readings):
+    """DataFrame of the rolled-up columns of SensorData instances"""
+    columns = ['tank_id', 'timestamp', *METRICS.values()]
+    frame = pd.DataFrame(
+        [[getattr(reading, column) for column in columns] for reading in readings],
+        columns=columns,
+    )
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], utc=True)
+    return frame.astype({field: 'float64' for field in METRICS.values()})
+
+
+@receiver(readings_ingested)
+def update_rollups(sender, readings, **kwargs):
+    """Fold a committed ingest chunk into the rollups.
+
+    Runs after the readings are committed, so a failure here cannot lose
+    data; the affected buckets are fixed by ``rebuild_rollups``.
+    """
+    try:
+        with transaction.atomic():
+            merge(readings_frame(readings))
+    except Exception:
+        logger.exception('Failed to update rollups for %d readings', len(readings))
+
+
+def _day_start(value):
+    local = timezone.localtime(value)
+    return timezone.make_aware(local.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None))
+
+
+def _bounds(tanks, start, end):
+    """``{tank_id: (first, last)}`` of the live and archived readings in range"""
+    readings = SensorData.objects.filter(tank__in=tanks)
+    archives = SensorDataArchive.objects.filter(tank__in=tanks)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+        archives = archives.filter(last_timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lt=end)
+        archives = archives.filter(first_timestamp__lt=end)
+
+    bounds = {}
+    ranges = [
+        readings.values('tank_id').annotate(first=Min('timestamp'), last=Max('timestamp')),
+        archives.values('tank_id').annotate(first=Min('first_timestamp'), last=Max('last_timestamp')),
+    ]
+    for queryset in ranges:
+        for row in queryset:
+            first = max(row['first'], start) if start else row['first']
+            last = min(row['last'], end) if end else row['last']
+            if row['tank_id'] in bounds:
+                known_first, known_last = bounds[row['tank_id']]
+                first, last = min(first, known_first), max(last, known_last)
+            bounds[row['tank_id']] = (first, last)
+    return bounds
+
+
+def _window_frame(tank_id, start, end):
+    """Live and archived readings of one tank in ``[start, end)``"""
+    fields = ['tank_id', 'timestamp', *METRICS.values()]
+    rows = SensorData.objects.filter(
+        tank_id=tank_id, timestamp__gte=start, timestamp__lt=end,
+    ).values_list(*fields)
+    frame = pd.DataFrame(list(rows), columns=fields)
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], utc=True)
+
+    stamps, values = archive.load_range(tank_id, start, end, list(METRICS.values()))
+    if len(stamps):
+        archived = pd.DataFrame(values)
+        archived.insert(0, 'timestamp', pd.to_datetime(stamps, unit='us', utc=True))
+        archived.insert(0, 'tank_id', tank_id)
+        frame = pd.concat([frame, archived], ignore_index=True) if len(frame) else archived
+    return frame.astype({field: 'float64' for field in METRICS.values()})
+
+
+def rebuild(tank_ids=None, start=None, end=None, resolutions=RESOLUTIONS):
+    """Recompute rollups from raw (and archived) readings, returning the number of buckets.
+
+    The range is widened to whole local days so no bucket is rebuilt from
+    a partial set of readings. Each tank is rebuilt in its own transaction.
+    """
+    tanks = WaterTank.objects.all()
+    if tank_ids is not None:
+        tanks = tanks.filter(id__in=tank_ids)
+    start = _day_start(start) if start is not None else None
+    end = _day_start(end) + timedelta(days=1) if end is not None else None
+
+    updates = _merge_updates(connections[router.db_for_write(SensorDataRollup)])
+    written = 0
+
+    for tank_id, (first, last) in _bounds(tanks, start, end).items():
+        window_start = _day_start(first)
+        with transaction.atomic():
+            SensorDataRollup.objects.filter(
+                tank_id=tank_id,
+                resolution__in=resolutions,
+                bucket_start__gte=window_start,
+                bucket_start__lte=last,
+            ).delete()
+            while window_start <= last:
+                window_end = _day_start(window_start + REBUILD_WINDOW)
+                frame = _window_frame(tank_id, window_start, window_end)
+                # Merging (rather than inserting) tolerates buckets ingest
+                # recreated concurrently
+                for resolution in resolutions:
+                    rows = aggregate(frame, resolution)
+                    upsert(SensorDataRollup, rows, ['tank', 'resolution', 'bucket_start'], updates)
+                    written += len(rows)
+                window_start = window_end
+    return written
@@ -0,0 +1,197 @@
+"""
+Time series for charts and APIs.
+
+Callers ask for a range and the coarsest point spacing they can use
+(``step``, in seconds). The coarsest rollup whose buckets are no wider
+than ``step`` is read. When even hourly buckets are too coarse the raw
+readings are used instead, unless the hourly buckets count more than
+MINMAX_RATIO raw readings per requested point: the hourly series is
+served then, so the cost stays bounded by the range in hours rather than
+by the number of readings in it.
+
+``tank_columns`` returns the series as aligned NumPy arrays (epoch
+microseconds, NaN for missing values) for APIs that serialize them
+directly; ``tank_series`` converts them to Python lists for Plotly.
+
+Charts cap their traces with ``present(..., max_points=...)`` or, for
+aligned multi-field responses, ``downsample``; both keep the points an
+LTTB pass (``tanks.downsample``) selects.
+"""
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import archive, recent
+from .archive import INTEGER_FIELDS, epoch_us, to_datetimes
+from .downsample import MINMAX_RATIO, lttb
+from .models import SensorData, SensorDataRollup
+
+RESOLUTION_SECONDS = {'day': 86400, 'hour': 3600}
+
+# SensorData field -> rollup metric prefix
+ROLLUP_FIELDS = {field: metric for metric, field in SensorDataRollup.METRICS.items()}
+
+
+def pick_resolution(step):
+    """Coarsest rollup resolution no wider than ``step`` seconds, or None for raw"""
+    if step is None:
+        return None
+    for resolution, seconds in RESOLUTION_SECONDS.items():
+        if seconds <= step:
+            return resolution
+    return None
+
+
+def _stamps(rows):
+    return np.fromiter((epoch_us(row[0]) for row in rows), dtype=np.int64, count=len(rows))
+
+
+def _matrix(rows, width):
+    """``values_list`` rows (minus their first column) as a float64 matrix, NaN for None"""
+    return np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), width)
+
+
+def tank_columns(tank_id, fields, start, end=None, step=None):
+    """Aligned series for one tank as NumPy arrays.
+
+    Returns ``{'resolution': ..., 'timestamps': stamps, field: values}``
+    where ``stamps`` are int64 epoch microseconds and each field is a
+    float64 array with one value (NaN for missing) per timestamp. Only the
+    requested columns are read. Rolled-up series hold bucket averages;
+    fields without a rollup, or a range without any rollup buckets, fall
+    back to raw readings: recent ones from the shared cache in ``recent``,
+    older ones from the database and the archive.
+    """
+    end = end or timezone.now()
+    resolution = pick_resolution(step)
+    # Hourly buckets also tell whether the raw readings would be too many
+    candidate = resolution or ('hour' if step is not None else None)
+    if candidate and all(field in ROLLUP_FIELDS for field in fields):
+        columns = [f'{ROLLUP_FIELDS[field]}_{part}' for field in fields for part in ('sum', 'count')]
+        rows = list(SensorDataRollup.objects.filter(
+            tank_id=tank_id,
+            resolution=candidate,
+            bucket_start__gte=start,
+            bucket_start__lt=end,
+        ).order_by('bucket_start').values_list('bucket_start', 'reading_count', *columns))
+        matrix = _matrix(rows, 1 + len(columns))
+        # No buckets usually means rollups were never built for this range
+        if rows and (resolution or matrix[:, 0].sum() > MINMAX_RATIO * (end - start).total_seconds() / step):
+            resolution = candidate
+            totals, counts = matrix[:, 1::2], matrix[:, 2::2]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                averages = np.where(counts > 0, totals / counts, np.nan)
+            series = {'resolution': resolution, 'timestamps': _stamps(rows)}
+            series.update({field: averages[:, index] for index, field in enumerate(fields)})
+            return series
+
+    # Recent windows are usually resident in the cache shared by all workers
+    cached = recent.window(tank_id, fields, start, end)
+    if cached is not None:
+        stamps, values = cached
+        series = {'resolution': 'raw', 'timestamps': stamps}
+        series.update(values)
+        return series
+
+    rows = list(SensorData.objects.filter(
+        tank_id=tank_id,
+        timestamp__gte=start,
+        timestamp__lt=end,
+    ).order_by('timestamp').values_list('timestamp', *fields))
+
+    # Older months may live in archive files rather than the table
+    archived, values = archive.load_range(tank_id, start, end, fields)
+    matrix = _matrix(rows, len(fields))
+    stamps = np.concatenate([archived, _stamps(rows)])
+    series = {'resolution': 'raw', 'timestamps': stamps}
+    series.update({
+        field: np.concatenate([values[field], matrix[:, index]]) for index, field in enumerate(fields)
+    })
+
+    # Late readings for an archived month can interleave with it
+    if len(archived) and len(rows) and stamps[len(archived)] < stamps[len(archived) - 1]:
+        order = np.argsort(stamps, kind='stable')
+        for key in ['timestamps', *fields]:
+            series[key] = series[key][order]
+    return series
+
+
+def as_lists(series, fields):
+    """``tank_columns`` output as Python lists: aware datetimes, and None for missing values"""
+    lists = {'resolution': series['resolution'], 'timestamps': to_datetimes(series['timestamps'])}
+    for field in fields:
+        cast = int if field in INTEGER_FIELDS else float
+        lists[field] = [None if value != value else cast(value) for value in series[field].tolist()]
+    return lists
+
+
+def tank_series(tank_id, fields, start, end=None, step=None):
+    """``tank_columns`` as Python lists, for building Plotly figures"""
+    return as_lists(tank_columns(tank_id, fields, start, end, step), fields)
+
+
+def _epoch(timestamps):
+    return np.fromiter((timestamp.timestamp() for timestamp in timestamps), dtype=float, count=len(timestamps))
+
+
+def present(series, field, max_points=None):
+    """``(timestamps, values)`` of ``field`` with the missing points dropped, LTTB-thinned to ``max_points``"""
+    pairs = [(ts, value) for ts, value in zip(series['timestamps'], series[field]) if value is not None]
+    if max_points is not None and len(pairs) > max_points:
+        timestamps = [ts for ts, _ in pairs]
+        keep = lttb(_epoch(timestamps), np.array([value for _, value in pairs], dtype=float), max_points)
+        pairs = [pairs[index] for index in keep]
+    return [ts for ts, _ in pairs], [value for _, value in pairs]
+
+
+def downsample(series, fields, max_points):
+    """``tank_columns`` output cut to at most ``max_points`` timestamps, still aligned across ``fields``.
+
+    Each field contributes its LTTB selection from an equal share of the
+    budget; the union of those timestamps is kept for every field.
+    """
+    if len(series['timestamps']) <= max_points:
+        return series
+    x = series['timestamps'].astype(np.float64)
+    share = max(max_points // len(fields), 3)
+    kept = [np.arange(0)]
+    for field in fields:
+        values = series[field]
+        known = np.flatnonzero(~np.isnan(values))
+        kept.append(known[lttb(x[known], values[known], share)])
+    index = np.unique(np.concatenate(kept))
+    thinned = {key: value for key, value in series.items() if key != 'timestamps' and key not in fields}
+    for key in ['timestamps', *fields]:
+        thinned[key] = series[key][index]
+    return thinned
+
+
+def fleet_rollups(field, start, resolution='hour', tanks=None):
+    """Rolled-up buckets of ``field`` across tanks, as ``{tank_name: (timestamps, averages, counts)}``"""
+    metric = ROLLUP_FIELDS[field]
+    rows = SensorDataRollup.objects.filter(
+        resolution=resolution,
+        bucket_start__gte=start,
+        **{f'{metric}_count__gt': 0}
+    )
+    if tanks is not None:
+        rows = rows.filter(tank__in=tanks)
+    rows = rows.order_by('tank__name', 'bucket_start').values_list(
+        'tank__name', 'bucket_start', f'{metric}_sum', f'{metric}_count'
+    )
+
+    series = {}
+    for tank_name, bucket_start, total, count in rows:
+        timestamps, averages, counts = series.setdefault(tank_name, ([], [], []))
+        timestamps.append(bucket_start)
+        averages.append(total / count)
+        counts.append(count)
+    return series
+
+
+def reading_count(tank_id, start):
+    """Readings stored for a tank in the hourly buckets starting at or after ``start``"""
+    total = SensorDataRollup.objects.filter(
+        tank_id=tank_id, resolution='hour', bucket_start__gte=start,
+    ).aggregate(total=Sum('reading_count'))['total']
+    return total or 0
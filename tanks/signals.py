@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+
+# Sent once per committed ingest chunk with ``readings`` (a list of saved
+# SensorData instances). ``bulk_create`` does not fire ``post_save``, so
+# anything that has to react to new readings should listen here instead.
+readings_ingested = Signal()
+
+# Sent after commit by ``alerting.store`` with ``alerts``, the Alert rows it
+# inserted (repeats folded into existing rows are not included).
+alerts_stored = Signal()
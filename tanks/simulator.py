@@ -0,0 +1,366 @@
+"""
+Real-time telemetry simulator for load testing the ingest path.
+
+Impersonates the Sensor sets of existing tanks. Devices are grouped behind
+gateways; each gateway is an asyncio task that wakes every ``tick``,
+collects the readings of devices that are due (per-device interval with
+jitter) and ships them over TCP lines, UDP datagrams or HTTP batches to
+the local ingest surface.
+
+Scenarios:
+
+``steady``           every device reports on its own schedule
+``burst``            every ``burst_every`` seconds each device flushes a backlog
+``reconnect-storm``  every ``storm_every`` seconds all gateways drop and
+                     reconnect at the same instant
+``clock-skew``       a fraction of devices report timestamps shifted by up
+                     to ``skew_seconds`` (some end up in the future)
+"""
+import asyncio
+import heapq
+import http.client
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from . import wire
+
+SCENARIOS = ('steady', 'burst', 'reconnect-storm', 'clock-skew')
+# Readings per UDP datagram, keeping datagrams under a typical 1500 byte MTU
+UDP_JSON_READINGS = 5
+UDP_BINARY_READINGS = 14
+
+# Which SensorData column(s) each sensor type reports, with a plausible (mean, sd)
+SENSOR_METRICS = {
+    'level': {'water_level_percentage': (60, 15)},
+    'temperature': {'water_temperature_f': (55, 5), 'ambient_temperature_f': (65, 10)},
+    'ph': {'ph_level': (7.4, 0.3)},
+    'turbidity': {'turbidity_ntu': (0.8, 0.3)},
+    'dissolved_oxygen': {'dissolved_oxygen_ppm': (9, 1)},
+    'conductivity': {'conductivity_us_cm': (500, 60)},
+    'flow': {'flow_rate_gpm': (20, 8)},
+}
+TANK_METRICS = {'water_level_percentage': (60, 15), 'water_temperature_f': (55, 5), 'ph_level': (7.4, 0.3)}
+
+
+class Device:
+    """One simulated sensor (or a bare tank when it has no sensors)"""
+
+    def __init__(self, tank_id, sensor_id, sensor_type, rng, skew=0.0):
+        self.tank_id = str(tank_id)
+        self.sensor_id = str(sensor_id) if sensor_id else None
+        self.metrics = SENSOR_METRICS.get(sensor_type, TANK_METRICS)
+        self.values = {name: rng.gauss(mean, sd) for name, (mean, sd) in self.metrics.items()}
+        self.skew = skew
+        self.battery = rng.uniform(3.6, 4.2)
+        self.last_ms = 0
+
+    def reading(self, rng, now):
+        for name, (mean, sd) in self.metrics.items():
+            # Mean-reverting random walk keeps values plausible
+            self.values[name] += 0.1 * (mean - self.values[name]) + rng.gauss(0, sd * 0.05)
+        self.battery -= 1e-6
+
+        # Millisecond timestamps, strictly increasing per device so none dedup
+        timestamp_ms = max(int((now + self.skew) * 1000), self.last_ms + 1)
+        self.last_ms = timestamp_ms
+
+        reading = {
+            'tank': self.tank_id,
+            'sensor': self.sensor_id,
+            'timestamp': timestamp_ms / 1000.0,
+            'signal_strength': int(rng.uniform(60, 100)),
+            'battery_voltage': round(self.battery, 3),
+        }
+        for name, value in self.values.items():
+            reading[name] = round(value, 3)
+        if 'water_level_percentage' in reading:
+            reading['water_level_percentage'] = min(max(reading['water_level_percentage'], 0), 100)
+        if 'ph_level' in reading:
+            reading['ph_level'] = min(max(reading['ph_level'], 0), 14)
+        return reading
+
+
+class SimulatorStats:
+
+    def __init__(self):
+        self.emitted = 0
+        self.sent = 0
+        self.send_errors = 0
+        self.failed = 0
+        self.reconnects = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.send_latencies = []
+
+
+def percentiles(values):
+    """p50/p95/p99/max in milliseconds, or None when there are no samples"""
+    if not len(values):
+        return None
+    values = np.asarray(values, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2),
+            'max_ms': round(float(values.max()), 2)}
+
+
+class _Transport:
+    """Base class; one instance per gateway"""
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.stats = simulator.stats
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def reconnect(self):
+        await self.close()
+        self.stats.reconnects += 1
+        try:
+            await self.connect()
+        except OSError:
+            self.stats.send_errors += 1
+
+    def encode(self, readings):
+        return b''.join(json.dumps(reading).encode() + b'\n' for reading in readings)
+
+
+class TcpTransport(_Transport):
+
+    def __init__(self, simulator, host, port):
+        super().__init__(simulator)
+        self.host, self.port = host, port
+        self.writer = None
+
+    async def connect(self):
+        _, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def send(self, readings):
+        started = time.perf_counter()
+        try:
+            if self.writer is None:
+                await self.connect()
+            self.writer.write(self.encode(readings))
+            # drain() blocks when the listener stops reading: that is its backpressure
+            await self.writer.drain()
+        except OSError:
+            self.stats.send_errors += 1
+            self.stats.failed += len(readings)
+            self.writer = None
+            return
+        self.stats.sent += len(readings)
+        self.stats.send_latencies.append(time.perf_counter() - started)
+
+
+class UdpTransport(_Transport):
+
+    def __init__(self, simulator, host, port, binary):
+        super().__init__(simulator)
+        self.address = (host, port)
+        self.binary = binary
+        self.transport = None
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=self.address
+        )
+
+    async def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def send(self, readings):
+        if self.transport is None:
+            await self.connect()
+        per_datagram = UDP_BINARY_READINGS if self.binary else UDP_JSON_READINGS
+        for start in range(0, len(readings), per_datagram):
+            chunk = readings[start:start + per_datagram]
+            self.transport.sendto(wire.encode_readings(chunk) if self.binary else self.encode(chunk))
+        self.stats.sent += len(readings)
+
+
+class HttpTransport(_Transport):
+    """POSTs each gateway flush as one batch from a worker thread"""
+
+    def __init__(self, simulator, url, token, binary):
+        super().__init__(simulator)
+        parts = urlsplit(url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.host, self.port = parts.hostname, parts.port
+        self.path = parts.path or '/'
+        self.binary = binary
+        self.headers = {
+            'Content-Type': wire.CONTENT_TYPE if binary else 'application/x-ndjson',
+        }
+        if token:
+            self.headers['Authorization'] = f'Token {token}'
+        self.connection = None
+
+    async def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _post(self, body):
+        if self.connection is None:
+            self.connection = self.connection_class(self.host, self.port, timeout=30)
+        try:
+            self.connection.request('POST', self.path, body=body, headers=self.headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+
+    async def send(self, readings):
+        body = wire.encode_readings(readings) if self.binary else self.encode(readings)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            status, content = await loop.run_in_executor(self.simulator.executor, self._post, body)
+        except (OSError, http.client.HTTPException):
+            self.stats.send_errors += 1
+            self.stats.failed += len(readings)
+            return
+        self.stats.send_latencies.append(time.perf_counter() - started)
+
+        if status != 200:
+            self.stats.send_errors += 1
+            self.stats.failed += len(readings)
+            return
+        summary = json.loads(content)
+        self.stats.sent += len(readings)
+        self.stats.accepted += summary.get('accepted', 0)
+        self.stats.duplicates += summary.get('duplicates', 0)
+        self.stats.rejected += summary.get('rejected', 0)
+
+
+class TelemetrySimulator:
+
+    def __init__(self, devices, target, gateways=10, interval=10.0, jitter=0.1, duration=60.0,
+                 tick=0.1, scenario='steady', burst_every=20.0, burst_size=10, storm_every=20.0,
+                 token=None, binary=False, seed=0):
+        self.devices = devices
+        self.target = target
+        self.gateway_count = max(1, min(gateways, len(devices)))
+        self.interval = interval
+        self.jitter = jitter
+        self.duration = duration
+        self.tick = tick
+        self.scenario = scenario
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.storm_every = storm_every
+        self.token = token
+        self.binary = binary
+        self.rng = random.Random(seed)
+        self.stats = SimulatorStats()
+        self.executor = ThreadPoolExecutor(max_workers=self.gateway_count)
+
+    def make_transport(self):
+        parts = urlsplit(self.target)
+        if parts.scheme == 'tcp':
+            return TcpTransport(self, parts.hostname, parts.port)
+        if parts.scheme == 'udp':
+            return UdpTransport(self, parts.hostname, parts.port, self.binary)
+        if parts.scheme in ('http', 'https'):
+            return HttpTransport(self, self.target, self.token, self.binary)
+        raise ValueError(f'Unsupported target {self.target!r}; use tcp://, udp:// or http://')
+
+    def next_due(self, now):
+        return now + self.interval * (1 + self.rng.uniform(-self.jitter, self.jitter))
+
+    async def run(self):
+        """Drive all gateways for ``duration`` seconds and return the wall time used"""
+        started = time.time()
+        self.end = started + self.duration
+        gateways = [self.devices[index::self.gateway_count] for index in range(self.gateway_count)]
+        await asyncio.gather(*(self.run_gateway(devices, started) for devices in gateways))
+        self.executor.shutdown(wait=True)
+        return time.time() - started
+
+    async def run_gateway(self, devices, started):
+        transport = self.make_transport()
+        try:
+            await transport.connect()
+        except OSError:
+            self.stats.send_errors += 1
+
+        # Spread first reports over one interval so devices are not in lockstep
+        schedule = [(started + self.rng.uniform(0, self.interval), index) for index in range(len(devices))]
+        heapq.heapify(schedule)
+        next_burst = started + self.burst_every
+        next_storm = started + self.storm_every
+
+        while True:
+            now = time.time()
+            if now >= self.end:
+                break
+            readings = []
+            while schedule and schedule[0][0] <= now:
+                _, index = heapq.heappop(schedule)
+                readings.append(devices[index].reading(self.rng, now))
+                heapq.heappush(schedule, (self.next_due(now), index))
+
+            if self.scenario == 'burst' and now >= next_burst:
+                for device in devices:
+                    readings.extend(device.reading(self.rng, now) for _ in range(self.burst_size))
+                next_burst += self.burst_every
+            if self.scenario == 'reconnect-storm' and now >= next_storm:
+                await transport.reconnect()
+                next_storm += self.storm_every
+
+            if readings:
+                self.stats.emitted += len(readings)
+                await transport.send(readings)
+            await asyncio.sleep(max(0.0, self.tick - (time.time() - now)))
+
+        await transport.close()
+
+
+def build_devices(tanks, rng, scenario='steady', skew_fraction=0.2, skew_seconds=600):
+    """One Device per Sensor of each tank (or per tank when it has none)"""
+    devices = []
+    for tank in tanks:
+        sensors = list(tank.sensors.all()) or [None]
+        for sensor in sensors:
+            skew = 0.0
+            if scenario == 'clock-skew' and rng.random() < skew_fraction:
+                skew = rng.uniform(-skew_seconds, skew_seconds)
+            devices.append(Device(
+                tank.id,
+                sensor.id if sensor else None,
+                sensor.sensor_type if sensor else None,
+                rng,
+                skew,
+            ))
+    return devices
+
+
+def end_to_end_latencies(rows, devices):
+    """``created_at - emitted_at`` in seconds for stored rows, undoing clock skew"""
+    skews = {(device.tank_id, device.sensor_id): device.skew for device in devices}
+    latencies = []
+    for tank_id, sensor_id, timestamp, created_at in rows:
+        skew = skews.get((str(tank_id), str(sensor_id) if sensor_id else None), 0.0)
+        latencies.append((created_at - timestamp).total_seconds() + skew)
+    return latencies
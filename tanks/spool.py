@@ -0,0 +1,295 @@
+"""
+Durable on-disk spool for validated readings.
+
+When SENSOR_SPOOL_ENABLED is set, ingest appends validated readings here
+instead of writing to the database, and ``manage.py replay_spool`` drains
+them into SensorData. Readings therefore survive database restarts and
+long table locks.
+
+Layout of SENSOR_SPOOL_DIR::
+
+    segment-0000000000000001.log   append-only record files, rotated by size
+    checkpoint.json                {"segment": n, "offset": bytes} replayed so far
+    write.lock / replay.lock       flock files
+
+Each record is ``length u32 | crc32 u32 | spooled_at f64`` followed by a
+JSON payload. Every writer process starts a fresh segment, so a record
+torn by a crash can only sit at the tail of a segment; the reader stops at
+a bad tail in the newest segment and skips to the next segment otherwise.
+
+Replay is at-least-once: the checkpoint only advances after the database
+commit, and readings keep the id assigned at spool time.
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+import struct
+import time
+import uuid
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('<IId')
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{16})\.log$')
+UUID_KEYS = ('id', 'tank_id', 'sensor_id')
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _segment_name(number):
+    return f'segment-{number:016d}.log'
+
+
+def list_segments(directory):
+    """Return the spool's segment numbers in order"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(match.group(1)) for match in map(SEGMENT_PATTERN.match, names) if match)
+
+
+def encode_values(values):
+    """Serialize one validated reading (SensorData kwargs) as JSON bytes"""
+    payload = {}
+    for key, value in values.items():
+        if isinstance(value, uuid.UUID):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        payload[key] = value
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def decode_values(data):
+    """Inverse of ``encode_values``"""
+    values = json.loads(data)
+    for key in UUID_KEYS:
+        if values.get(key):
+            values[key] = uuid.UUID(values[key])
+    values['timestamp'] = parse_datetime(values['timestamp'])
+    return values
+
+
+class SpoolWriter:
+    """Append readings to the newest segment, fsyncing in batches.
+
+    Each ``append`` call is written with a single ``write()`` while holding
+    an exclusive flock, so several processes can share one spool.
+    ``fsync_interval`` of 0 fsyncs every call; a positive value fsyncs at
+    most that often (group commit) and bounds how much a power loss can
+    take with it.
+    """
+
+    def __init__(self, directory, segment_bytes, fsync_interval=0.0):
+        self.directory = str(directory)
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._segment = None
+        self._last_fsync = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = open(os.path.join(self.directory, 'write.lock'), 'a')
+
+    def _open_segment(self, number):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        self._segment = number
+        self._file = open(os.path.join(self.directory, _segment_name(number)), 'ab')
+        _fsync_dir(self.directory)
+
+    def _ensure_segment(self):
+        """Pick the segment to append to; must be called with the lock held"""
+        if self._file is None:
+            # Never append after a previous process's possibly torn tail
+            segments = list_segments(self.directory)
+            self._open_segment((segments[-1] if segments else 0) + 1)
+            return
+        next_path = os.path.join(self.directory, _segment_name(self._segment + 1))
+        if os.path.exists(next_path):
+            self._open_segment(list_segments(self.directory)[-1])
+        elif self._file.tell() >= self.segment_bytes:
+            self._open_segment(self._segment + 1)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def append(self, readings):
+        """Durably append validated readings (SensorData kwargs dicts)"""
+        if not readings:
+            return
+        now = time.time()
+        chunks = []
+        for values in readings:
+            payload = encode_values(values)
+            chunks.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload), now))
+            chunks.append(payload)
+        data = b''.join(chunks)
+
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+        try:
+            self._ensure_segment()
+            self._file.write(data)
+            self._file.flush()
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._sync()
+        finally:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+
+_writer = None
+
+
+def get_writer():
+    """Process-wide writer configured from settings"""
+    global _writer
+    if _writer is None:
+        _writer = SpoolWriter(
+            settings.SENSOR_SPOOL_DIR,
+            settings.SENSOR_SPOOL_SEGMENT_BYTES,
+            settings.SENSOR_SPOOL_FSYNC_INTERVAL,
+        )
+    return _writer
+
+
+class SpoolReader:
+    """Read records from the checkpoint onwards and advance it after replay"""
+
+    def __init__(self, directory, create=True):
+        self.directory = str(directory)
+        self.checkpoint_path = os.path.join(self.directory, 'checkpoint.json')
+        # Read-only users (status reports) see a missing directory as an empty spool
+        if create:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                data = json.load(f)
+            return data['segment'], data['offset']
+        except FileNotFoundError:
+            segments = list_segments(self.directory)
+            return (segments[0] if segments else 1), 0
+
+    def save_checkpoint(self, segment, offset):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': segment, 'offset': offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        _fsync_dir(self.directory)
+
+    def acquire_replay_lock(self):
+        """Ensure only one replayer drains the spool; returns False if taken"""
+        self._replay_lock = open(os.path.join(self.directory, 'replay.lock'), 'a')
+        try:
+            fcntl.flock(self._replay_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def read_batch(self, max_records):
+        """Return ``(records, position)`` for up to ``max_records`` pending records.
+
+        ``records`` is a list of ``(spooled_at, values)``; ``position`` is the
+        ``(segment, offset)`` to checkpoint once they are stored.
+        """
+        segment, offset = self.load_checkpoint()
+        segments = list_segments(self.directory)
+        records = []
+
+        for number in segments:
+            if number < segment:
+                continue
+            if number > segment:
+                segment, offset = number, 0
+            sealed = number != segments[-1]
+            offset, complete = self._read_segment(number, offset, max_records - len(records), records)
+            if len(records) >= max_records or (not complete and not sealed):
+                break
+            if not complete:
+                logger.error('Skipping corrupt tail of spool segment %s at offset %s', number, offset)
+
+        return records, (segment, offset)
+
+    def _read_segment(self, number, offset, limit, records):
+        """Append up to ``limit`` records; returns ``(offset, reached_clean_end)``"""
+        with open(os.path.join(self.directory, _segment_name(number)), 'rb') as f:
+            f.seek(offset)
+            while limit > 0:
+                header = f.read(RECORD_HEADER.size)
+                if not header:
+                    return offset, True
+                if len(header) < RECORD_HEADER.size:
+                    return offset, False
+                length, crc, spooled_at = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return offset, False
+                records.append((spooled_at, decode_values(payload)))
+                offset += RECORD_HEADER.size + length
+                limit -= 1
+        return offset, True
+
+    def compact(self):
+        """Delete segments that lie entirely before the checkpoint"""
+        segment, _ = self.load_checkpoint()
+        removed = 0
+        for number in list_segments(self.directory):
+            if number >= segment:
+                break
+            os.remove(os.path.join(self.directory, _segment_name(number)))
+            removed += 1
+        if removed:
+            _fsync_dir(self.directory)
+        return removed
+
+    def stats(self):
+        """Spool depth and lag for operators"""
+        segment, offset = self.load_checkpoint()
+        pending_bytes = 0
+        pending_segments = 0
+        for number in list_segments(self.directory):
+            if number < segment:
+                continue
+            size = os.path.getsize(os.path.join(self.directory, _segment_name(number)))
+            pending_bytes += size - (offset if number == segment else 0)
+            pending_segments += 1
+
+        lag_seconds = 0.0
+        if pending_bytes:
+            oldest, _ = self.read_batch(1)
+            if oldest:
+                lag_seconds = max(0.0, time.time() - oldest[0][0])
+
+        return {
+            'enabled': settings.SENSOR_SPOOL_ENABLED,
+            'pending_bytes': pending_bytes,
+            'pending_segments': pending_segments,
+            'checkpoint_segment': segment,
+            'checkpoint_offset': offset,
+            'lag_seconds': round(lag_seconds, 3),
+        }
@@ -0,0 +1,94 @@
+"""
+Latest reading of every tank.
+
+TankLatestState holds a copy of each tank's newest reading, so status
+badges, list pages and the JSON APIs never search ``tanks_sensordata``.
+Ingest calls ``record`` in the same transaction that inserts a chunk; the
+upsert only replaces a state with a strictly newer reading, so late or
+replayed batches cannot move it backwards. ``record`` also advances
+``Sensor.last_reading_at`` for readings that name their sensor. Writes
+that bypass ingest call ``refresh``, which recomputes the state from the
+stored readings and overwrites it unconditionally, so values changed in
+place (calibration, revalidation) and deleted readings are picked up.
+"""
+from django.db.models import Case, DateTimeField, Exists, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .db import upsert
+from .models import Sensor, SensorData, TankLatestState, WaterTank
+
+# Columns copied from the reading, besides tank and reading id
+STATE_FIELDS = [
+    field.attname for field in TankLatestState._meta.concrete_fields
+    if field.attname not in ('tank_id', 'reading_id', 'updated_at')
+]
+UPDATES = {
+    column: f'excluded.{column}'
+    for column in ['reading_id', *STATE_FIELDS, 'updated_at']
+}
+NEWER = 'excluded.timestamp > {table}.timestamp'
+
+
+def state_rows(readings):
+    """One upsert row per tank from the newest of ``readings`` (objects with SensorData attributes)"""
+    newest = {}
+    for reading in readings:
+        current = newest.get(reading.tank_id)
+        if current is None or reading.timestamp > current.timestamp:
+            newest[reading.tank_id] = reading
+
+    now = timezone.now()
+    rows = []
+    for tank_id, reading in newest.items():
+        row = {'tank_id': tank_id, 'reading_id': reading.id}
+        row.update({field: getattr(reading, field) for field in STATE_FIELDS})
+        row['updated_at'] = now
+        rows.append(row)
+    return rows
+
+
+def record(readings):
+    """Advance the latest state of the tanks and sensors in ``readings`` where they are newer"""
+    upsert(TankLatestState, state_rows(readings), ['tank'], UPDATES, where=NEWER)
+
+    newest = {}
+    for reading in readings:
+        if reading.sensor_id and (reading.sensor_id not in newest or reading.timestamp > newest[reading.sensor_id]):
+            newest[reading.sensor_id] = reading.timestamp
+    if newest:
+        # One statement for the whole chunk; an older chunk never moves a sensor back
+        incoming = Case(
+            *[When(id=sensor_id, then=Value(timestamp)) for sensor_id, timestamp in newest.items()],
+            output_field=DateTimeField(),
+        )
+        Sensor.objects.filter(id__in=newest).update(
+            last_reading_at=Greatest(Coalesce('last_reading_at', incoming), incoming),
+            updated_at=timezone.now(),
+        )
+
+
+def refresh(tank_ids=None):
+    """Recompute the latest state from the stored readings, returning the tanks updated"""
+    tanks = WaterTank.objects.all()
+    if tank_ids is not None:
+        tanks = tanks.filter(id__in=tank_ids)
+    newest = SensorData.objects.filter(tank=OuterRef('pk')).order_by('-timestamp').values('id')[:1]
+    reading_ids = [
+        reading_id for reading_id in
+        tanks.annotate(reading_id=Subquery(newest)).values_list('reading_id', flat=True)
+        if reading_id is not None
+    ]
+    readings = SensorData.objects.filter(id__in=reading_ids).only('id', 'tank_id', *STATE_FIELDS)
+    rows = state_rows(readings)
+    # The stored readings are the source of truth here, even for the same timestamp
+    upsert(TankLatestState, rows, ['tank'], UPDATES)
+    # Tanks whose readings were all deleted have no latest state
+    TankLatestState.objects.filter(tank__in=tanks).exclude(
+        Exists(SensorData.objects.filter(tank=OuterRef('tank')))
+    ).delete()
+
+    sensors = Sensor.objects.filter(tank__in=tanks)
+    newest_reading = SensorData.objects.filter(sensor=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    sensors.update(last_reading_at=Subquery(newest_reading), updated_at=timezone.now())
+    return len(rows)
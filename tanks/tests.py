@@ -1,3 +1,377 @@
-from django.test import TestCase
+import io
+import tempfile
+import uuid
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, transaction
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import alerting, calibration, dedup, downsample, ids, ingest, wire
+from .models import Alert, AlertRule, Sensor, SensorData, TankLatestState, WaterTank
+from .spool import SpoolReader, SpoolWriter
+
+
+def make_tank(**kwargs):
+    fields = {
+        'name': 'Test Tank', 'location': '1 Test St', 'borough': 'brooklyn',
+        'capacity_gallons': 10000, 'installation_date': date(2020, 1, 1),
+    }
+    fields.update(kwargs)
+    return WaterTank.objects.create(**fields)
+
+
+class CalibrationRunTests(TestCase):
+    def setUp(self):
+        self.tank = make_tank()
+        self.sensor = Sensor.objects.create(
+            tank=self.tank, sensor_type='temperature', model_number='T-1',
+            serial_number='T-1-0001', installation_date=date(2020, 1, 1),
+        )
+        now = timezone.now().replace(microsecond=0)
+        rows = [
+            {'tank': str(self.tank.id), 'timestamp': (now - timedelta(minutes=minutes)).isoformat(),
+             'water_temperature_f': 60.0}
+            for minutes in (30, 15, 0)
+        ]
+        results = ingest.summarize(ingest.ingest_readings(rows))
+        self.assertEqual(results['accepted'], 3)
+
+    def test_process_updates_latest_state(self):
+        self.assertEqual(TankLatestState.objects.get(tank=self.tank).water_temperature_f, 60.0)
+        self.sensor.calibration_offset = 2.5
+        self.sensor.save()
+
+        run = calibration.process(calibration.queue(self.sensor))
+
+        self.assertEqual(run.status, 'done')
+        self.assertEqual(run.rows_changed, 3)
+        self.assertEqual(TankLatestState.objects.get(tank=self.tank).water_temperature_f, 62.5)
+
+
+class IngestEndpointTests(TestCase):
+    def setUp(self):
+        self.tank = make_tank()
+        self.url = reverse('tanks:ingest_readings')
+        self.now = timezone.now().replace(microsecond=0)
+        override = self.settings(INGEST_API_TOKENS=['test-token'], SENSOR_SPOOL_ENABLED=False)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def post(self, body, content_type='application/json'):
+        # The test client serializes lists for JSON content types with DjangoJSONEncoder
+        return self.client.post(self.url, body, content_type=content_type, HTTP_AUTHORIZATION='Token test-token')
+
+    def reading(self, minutes=0, **fields):
+        return {'tank': str(self.tank.id), 'timestamp': self.now - timedelta(minutes=minutes),
+                'water_level_percentage': 50.0, **fields}
+
+    def test_requires_token(self):
+        response = self.client.post(self.url, [self.reading()], content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_mixed_batch_reports_each_row(self):
+        rows = [
+            self.reading(minutes=5),
+            self.reading(tank=str(uuid.uuid4())),
+            self.reading(timestamp='yesterday', ph_level='acid'),
+            'not a reading',
+        ]
+        response = self.post(rows)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['accepted'], body['duplicates'], body['rejected']), (1, 0, 3))
+        results = body['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertEqual([result['status'] for result in results], ['accepted', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(SensorData.objects.get(tank=self.tank).pk, uuid.UUID(results[0]['id']))
+
+        # Rejected rows carry field errors as lists of messages
+        self.assertEqual(results[1]['errors'], {'tank': ['Unknown tank.']})
+        self.assertEqual(set(results[2]['errors']), {'timestamp', 'ph_level'})
+        self.assertTrue(all(isinstance(messages, list) for messages in results[2]['errors'].values()))
+        self.assertEqual(results[3]['errors'], {'__all__': ['Reading must be a JSON object']})
+
+    def test_binary_payload_matches_json(self):
+        self.post([self.reading(minutes=10, signal_strength=-70)])
+        payload = wire.encode_readings([self.reading(minutes=5, signal_strength=-70)])
+
+        response = self.post(payload, content_type=wire.CONTENT_TYPE)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['accepted'], 1)
+        stored = list(SensorData.objects.filter(tank=self.tank).order_by('timestamp')
+                      .values_list('water_level_percentage', 'signal_strength'))
+        self.assertEqual(stored, [(50.0, -70), (50.0, -70)])
+
+    def test_malformed_binary_payload_is_rejected(self):
+        payload = wire.encode_readings([self.reading()])
+
+        response = self.post(payload[:-1], content_type=wire.CONTENT_TYPE)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Truncated frame body'})
+        self.assertFalse(SensorData.objects.exists())
+
+
+class DuplicateReadingTests(TestCase):
+    def setUp(self):
+        self.tank = make_tank()
+        self.sensor = Sensor.objects.create(
+            tank=self.tank, sensor_type='level', model_number='L-1',
+            serial_number='L-1-0001', installation_date=date(2020, 1, 1),
+        )
+        self.timestamp = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+        # Start every test with an empty process-wide key cache
+        patcher = mock.patch('tanks.dedup._cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reading(self, sensor=None, **fields):
+        return {'tank': str(self.tank.id), 'sensor': str(sensor.id) if sensor else None,
+                'timestamp': self.timestamp.isoformat(), 'water_level_percentage': 50.0, **fields}
+
+    def statuses(self, rows):
+        return [result['status'] for result in ingest.ingest_readings(rows)]
+
+    def test_duplicates_within_a_batch(self):
+        rows = [self.reading(self.sensor), self.reading(), self.reading(self.sensor), self.reading()]
+
+        self.assertEqual(self.statuses(rows), ['accepted', 'accepted', 'duplicate', 'duplicate'])
+        self.assertEqual(SensorData.objects.filter(tank=self.tank).count(), 2)
+
+    def test_duplicates_across_batches(self):
+        rows = [self.reading(self.sensor), self.reading()]
+        self.assertEqual(self.statuses(rows), ['accepted', 'accepted'])
+        # Caught by the in-process cache ...
+        self.assertEqual(self.statuses(rows), ['duplicate', 'duplicate'])
+        # ... and by the database once the cache has forgotten them
+        dedup._cache = None
+        self.assertEqual(self.statuses(rows), ['duplicate', 'duplicate'])
+        self.assertEqual(SensorData.objects.filter(tank=self.tank).count(), 2)
+
+    def test_racing_duplicates_are_reported_by_the_insert(self):
+        self.statuses([self.reading(self.sensor), self.reading()])
+
+        # Another worker stored the same readings after our duplicate check
+        with mock.patch('tanks.dedup.split_duplicates', side_effect=lambda candidates: (candidates, [])):
+            results = ingest.ingest_readings([self.reading(self.sensor, water_level_percentage=40.0), self.reading()])
+
+        self.assertEqual([result['status'] for result in results], ['duplicate', 'duplicate'])
+        self.assertEqual(SensorData.objects.filter(tank=self.tank).count(), 2)
+        self.assertEqual(TankLatestState.objects.get(tank=self.tank).water_level_percentage, 50.0)
+
+    def test_unique_constraints_cover_readings_without_a_sensor(self):
+        SensorData.objects.create(tank=self.tank, timestamp=self.timestamp)
+        SensorData.objects.create(tank=self.tank, sensor=self.sensor, timestamp=self.timestamp)
+
+        for sensor in (None, self.sensor):
+            with self.subTest(sensor=sensor), self.assertRaises(IntegrityError), transaction.atomic():
+                SensorData.objects.create(tank=self.tank, sensor=sensor, timestamp=self.timestamp)
+
+
+class AlertEngineTests(TestCase):
+    def setUp(self):
+        self.tank = make_tank()
+        AlertRule.objects.create(
+            tank=self.tank, alert_type='low_level', low_threshold=20.0, hysteresis=5.0,
+            min_duration=timedelta(minutes=10), cooldown=timedelta(minutes=30),
+        )
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        # Count every alert as its own row
+        override = self.settings(SENSOR_ALERT_COALESCE_WINDOW=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def reading(self, minutes, level, **fields):
+        return SensorData(tank=self.tank, timestamp=self.start + timedelta(minutes=minutes),
+                          water_level_percentage=level, **fields)
+
+    def run_readings(self, engine, readings):
+        """Evaluate ``(minutes, level)`` pairs one batch each, returning (created, resolved) counts"""
+        counts = []
+        for minutes, level in readings:
+            created, resolved = engine.evaluate([self.reading(minutes, level)])
+            counts.append((len(created), len(resolved)))
+        return counts
+
+    def test_alert_lifecycle(self):
+        engine = alerting.AlertEngine(ttl=3600)
+
+        # The breach must last min_duration before an alert is raised
+        self.assertEqual(self.run_readings(engine, [(0, 15.0), (5, 15.0), (10, 15.0)]), [(0, 0), (0, 0), (1, 0)])
+        alert = Alert.objects.get(tank=self.tank)
+        self.assertEqual((alert.status, alert.alert_type, alert.actual_value), ('active', 'low_level', 15.0))
+
+        # Back above the threshold but within the hysteresis margin keeps it open
+        self.assertEqual(self.run_readings(engine, [(15, 22.0)]), [(0, 0)])
+        # Invalid readings are ignored
+        engine.evaluate([self.reading(17, 50.0, is_valid=False)])
+        self.assertEqual(Alert.objects.get(pk=alert.pk).status, 'active')
+
+        self.assertEqual(self.run_readings(engine, [(20, 30.0)]), [(0, 1)])
+        self.assertEqual(Alert.objects.get(pk=alert.pk).status, 'resolved')
+
+        # A new breach during the cooldown stays quiet, then alerts again
+        self.assertEqual(self.run_readings(engine, [(25, 10.0), (35, 10.0), (50, 10.0)]), [(0, 0), (0, 0), (1, 0)])
+        self.assertEqual(Alert.objects.filter(tank=self.tank, status='active').count(), 1)
+        self.assertEqual(Alert.objects.filter(tank=self.tank).count(), 2)
+
+    def test_workers_adopt_an_alert_opened_elsewhere(self):
+        first, second = alerting.AlertEngine(ttl=3600), alerting.AlertEngine(ttl=3600)
+        # Both workers load their state before either raises the alert
+        first.evaluate([])
+        second.evaluate([])
+
+        created, _ = first.evaluate([self.reading(0, 15.0), self.reading(10, 15.0)])
+        self.assertEqual(len(created), 1)
+        alert = created[0]
+        created, _ = second.evaluate([self.reading(0, 15.0), self.reading(10, 15.0)])
+        self.assertEqual(created, [])
+        self.assertEqual(Alert.objects.filter(tank=self.tank).count(), 1)
+
+        # The adopting worker resolves the other worker's alert
+        _, resolved = second.evaluate([self.reading(20, 30.0)])
+        self.assertEqual(resolved, [alert.id])
+        self.assertEqual(Alert.objects.get(pk=alert.id).status, 'resolved')
+
+
+class DownsampleTests(SimpleTestCase):
+    def series(self, length, spike):
+        x = np.arange(length, dtype=float)
+        y = np.sin(x / 50.0)
+        y[spike] = 10.0
+        return x, y
+
+    def assertKeeps(self, selected, length, spike, n):
+        self.assertLessEqual(len(selected), n)
+        self.assertTrue(np.all(np.diff(selected) > 0))
+        self.assertEqual((selected[0], selected[-1]), (0, length - 1))
+        self.assertIn(spike, selected)
+
+    def test_short_series_are_returned_whole(self):
+        x, y = self.series(10, spike=4)
+        self.assertEqual(downsample.lttb(x, y, 10).tolist(), list(range(10)))
+        self.assertEqual(downsample.minmax(y, 20).tolist(), list(range(10)))
+
+    def test_budget_below_three_keeps_the_ends(self):
+        x, y = self.series(10, spike=4)
+        for n in (0, 1, 2):
+            with self.subTest(n=n):
+                self.assertKeeps(downsample.lttb(x, y, n), 10, spike=4, n=3)
+
+    def test_lttb_keeps_ends_and_spikes(self):
+        x, y = self.series(150, spike=77)
+        with mock.patch('tanks.downsample.minmax', wraps=downsample.minmax) as prepass:
+            selected = downsample.lttb(x, y, 50)
+
+        prepass.assert_not_called()
+        self.assertEqual(len(selected), 50)
+        self.assertKeeps(selected, 150, spike=77, n=50)
+
+    def test_long_series_go_through_minmax_first(self):
+        x, y = self.series(10000, spike=5371)
+        with mock.patch('tanks.downsample._lttb', wraps=downsample._lttb) as lttb_pass:
+            selected = downsample.lttb(x, y, 50)
+
+        candidates = lttb_pass.call_args.args[0]
+        self.assertLessEqual(len(candidates), downsample.MINMAX_RATIO * 50 + 2)
+        self.assertKeeps(selected, 10000, spike=5371, n=50)
+
+    def test_minmax_keeps_each_bucket_extremes(self):
+        y = np.array([3.0, 1.0, 2.0, 5.0, 4.0, 0.0, 6.0, 9.0, 7.0, 8.0])
+        # Two buckets of five: [3, 1, 2, 5, 4] and [0, 6, 9, 7, 8]
+        self.assertEqual(downsample.minmax(y, 4).tolist(), [0, 1, 3, 5, 7, 9])
+
+
+class WireFormatTests(SimpleTestCase):
+    def test_round_trip(self):
+        tank, sensor = uuid.uuid4(), uuid.uuid4()
+        readings = [
+            {'tank': tank, 'sensor': sensor, 'timestamp': 1700000000.125, 'water_level_percentage': 62.5,
+             'signal_strength': -71.6, 'total_flow_gallons': 123456789.123},
+            {'tank': tank, 'sensor': None, 'timestamp': 1700000060.0, 'ph_level': 7.25, 'is_valid': False},
+        ]
+
+        decoded = wire.decode_readings(wire.encode_readings(readings))
+
+        self.assertEqual(len(decoded), 2)
+        first, second = decoded
+        self.assertEqual((first['tank'], first['sensor'], first['timestamp']), (tank, sensor, 1700000000.125))
+        self.assertEqual(first['water_level_percentage'], 62.5)
+        # signal_strength travels as a short, total_flow_gallons as a double
+        self.assertEqual(first['signal_strength'], -72)
+        self.assertEqual(first['total_flow_gallons'], 123456789.123)
+        self.assertIsNone(first['ph_level'])
+        self.assertTrue(first['is_valid'])
+
+        self.assertEqual((second['tank'], second['sensor']), (tank, None))
+        self.assertEqual(second['ph_level'], 7.25)
+        self.assertIsNone(second['water_level_percentage'])
+        self.assertFalse(second['is_valid'])
+
+    def test_malformed_payloads(self):
+        payload = wire.encode_readings([{'tank': uuid.uuid4(), 'timestamp': 1700000000}])
+        unknown_version = payload[:2] + bytes([wire.CURRENT_VERSION + 1]) + payload[3:]
+
+        cases = {
+            'Truncated frame header': payload[:3],
+            'Truncated frame body': payload[:-1],
+            'Bad frame magic': b'XX' + payload[2:],
+            f'Unsupported wire format version {wire.CURRENT_VERSION + 1}': unknown_version,
+        }
+        for message, data in cases.items():
+            with self.subTest(message), self.assertRaisesMessage(wire.WireFormatError, message):
+                wire.decode_readings(data)
+
+
+class ReplaySpoolTests(TestCase):
+    def setUp(self):
+        self.tank = make_tank()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        now = timezone.now().replace(microsecond=0)
+        rows = [
+            {'tank': str(self.tank.id), 'timestamp': (now - timedelta(minutes=minutes)).isoformat(),
+             'water_level_percentage': 50.0}
+            for minutes in (10, 5, 0)
+        ]
+        _, pending = ingest.validate_readings(rows)
+        readings = [values for _, values in pending]
+        for values, reading_id in zip(readings, ids.uuid7s(len(readings))):
+            values['id'] = reading_id
+        writer = SpoolWriter(self.directory, segment_bytes=1 << 20)
+        writer.append(readings)
+        writer.close()
+
+    def test_database_outage_keeps_and_retries_records(self):
+        resolve = ingest._resolve_references
+        calls = []
+
+        def unreachable_once(pending):
+            calls.append(len(pending))
+            if len(calls) == 1:
+                raise OperationalError('unable to open database file')
+            return resolve(pending)
+
+        checkpoints = []
+        reader = SpoolReader(self.directory)
+        with self.settings(SENSOR_SPOOL_DIR=self.directory), \
+                mock.patch('tanks.ingest._resolve_references', side_effect=unreachable_once), \
+                mock.patch('tanks.management.commands.replay_spool.time.sleep',
+                           side_effect=lambda seconds: checkpoints.append(reader.load_checkpoint())) as sleep:
+            call_command('replay_spool', '--once', '--interval', '0.5', stdout=io.StringIO())
+
+        self.assertEqual(calls, [3, 3])
+        sleep.assert_called_once_with(0.5)
+        # Nothing was checkpointed while the database was down
+        self.assertEqual(checkpoints, [(1, 0)])
+        self.assertEqual(SensorData.objects.filter(tank=self.tank).count(), 3)
+        self.assertNotEqual(reader.load_checkpoint(), (1, 0))
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'tanks'
+
+urlpatterns = [
+    path('api/readings/', views.ingest_readings_api, name='ingest_readings'),
+    path('api/ingest-status/', views.ingest_status_api, name='ingest_status'),
+]
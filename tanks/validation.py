@@ -0,0 +1,391 @@
+"""
+Vectorized data-quality checks for sensor readings.
+
+``quality_mask`` runs every check over a whole DataFrame of readings at
+once with NumPy/pandas, so ingest chunks and multi-million-row backfills
+(``manage.py validate_readings``) go through the same code. Each reading
+gets a bitmask of the checks it failed:
+
+    OUT_OF_RANGE      a measurement outside its physical/validator range
+    SPIKE             jumps away from both neighbours and straight back
+    STEP              jumps by more than the spike threshold and stays there
+    STUCK             part of a run of STUCK_RUN identical values
+    OUT_OF_ORDER      older than a reading of its series that arrived earlier
+    LEVEL_MISMATCH    inches and percentage imply a different tank height
+                      than the rest of the series
+    FLOW_MISMATCH     flow rate would empty the tank (capacity_gallons) in
+                      under an hour
+    REPORTED_INVALID  the gateway sent ``is_valid: false``
+
+Ingest runs ``annotate`` on every chunk, checked against each tank's
+latest stored reading; spikes and stuck runs need the readings around
+them, so a backfill confirms those once the neighbours have arrived.
+
+A series is one tank and sensor. The mask is stored compactly as
+``quality_flags["qc"]`` (absent when zero, other keys are left alone), and
+``is_valid`` is false when any bit of INVALID_MASK is set.
+"""
+import json
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db import connections, transaction
+from django.db.models import Max, Min
+
+from . import state
+from .models import SensorData, WaterTank
+
+OUT_OF_RANGE = 1 << 0
+SPIKE = 1 << 1
+STEP = 1 << 2
+STUCK = 1 << 3
+OUT_OF_ORDER = 1 << 4
+LEVEL_MISMATCH = 1 << 5
+FLOW_MISMATCH = 1 << 6
+REPORTED_INVALID = 1 << 7
+
+FLAG_NAMES = {
+    OUT_OF_RANGE: 'out_of_range',
+    SPIKE: 'spike',
+    STEP: 'step',
+    STUCK: 'stuck',
+    OUT_OF_ORDER: 'out_of_order',
+    LEVEL_MISMATCH: 'level_mismatch',
+    FLOW_MISMATCH: 'flow_mismatch',
+    REPORTED_INVALID: 'reported_invalid',
+}
+# Steps and late arrivals are worth knowing about but can be genuine (refills, retransmits)
+INVALID_MASK = OUT_OF_RANGE | SPIKE | STUCK | LEVEL_MISMATCH | FLOW_MISMATCH | REPORTED_INVALID
+QC_KEY = 'qc'
+
+# Plausible physical ranges, on top of the model validators
+RANGES = {
+    'water_level_inches': (0, 600),
+    'water_temperature_f': (32, 110),
+    'ambient_temperature_f': (-30, 130),
+    'turbidity_ntu': (0, 1000),
+    'dissolved_oxygen_ppm': (0, 20),
+    'conductivity_us_cm': (0, 5000),
+    'flow_rate_gpm': (0, None),
+    'total_flow_gallons': (0, None),
+    'signal_strength': (0, 100),
+    'battery_voltage': (2.5, 4.5),
+}
+# Largest believable change between consecutive readings of a series
+JUMP_THRESHOLDS = {
+    'water_level_percentage': 20.0,
+    'water_temperature_f': 10.0,
+    'ph_level': 1.5,
+    'turbidity_ntu': 10.0,
+    'dissolved_oxygen_ppm': 5.0,
+    'conductivity_us_cm': 400.0,
+    'battery_voltage': 0.5,
+}
+# Analog sensors that never repeat a value exactly for long
+STUCK_FIELDS = [
+    'water_level_percentage', 'water_temperature_f', 'ph_level',
+    'turbidity_ntu', 'dissolved_oxygen_ppm', 'conductivity_us_cm',
+]
+STUCK_RUN = 6
+# Relative deviation of the implied tank height from the series median
+HEIGHT_TOLERANCE = 0.05
+# Below this percentage the implied height is dominated by noise
+MIN_LEVEL_FOR_HEIGHT = 5.0
+# Readings revalidated per tank at a time, and the neighbours loaded on either side
+REVALIDATE_WINDOW = timedelta(days=31)
+REVALIDATE_MARGIN = timedelta(days=1)
+
+
+def _validator_range(name):
+    low = high = None
+    for validator in SensorData._meta.get_field(name).validators:
+        if validator.code == 'min_value':
+            low = validator.limit_value
+        elif validator.code == 'max_value':
+            high = validator.limit_value
+    return low, high
+
+
+def field_ranges():
+    """``{field: (low, high)}`` for every checked measurement, None for unbounded"""
+    ranges = {}
+    for name in [*RANGES, *JUMP_THRESHOLDS]:
+        low, high = RANGES.get(name, (None, None))
+        model_low, model_high = _validator_range(name)
+        ranges[name] = (model_low if low is None else low, model_high if high is None else high)
+    return ranges
+
+
+def quality_mask(frame):
+    """Bitmask of failed checks for every row of ``frame``, in its row order.
+
+    ``frame`` has ``tank_id``, ``sensor_id``, ``timestamp`` and any of the
+    measurement columns (NaN for missing). Optional columns: ``arrival``
+    (sortable arrival order, defaults to row order), ``capacity_gallons``
+    and ``is_valid`` (False sets REPORTED_INVALID).
+    """
+    count = len(frame)
+    mask = np.zeros(count, dtype=np.uint16)
+    if not count:
+        return mask
+
+    ranges = field_ranges()
+    series = frame.groupby(['tank_id', 'sensor_id'], sort=False, dropna=False).ngroup().to_numpy()
+    stamps = pd.to_datetime(frame['timestamp'], utc=True).to_numpy(dtype='datetime64[us]').astype(np.int64)
+
+    # Arrival order: a reading older than one already received for its series
+    arrival = frame['arrival'].to_numpy() if 'arrival' in frame else np.arange(count)
+    by_arrival = np.lexsort((stamps, arrival, series))
+    received = pd.Series(stamps[by_arrival]).groupby(series[by_arrival]).cummax()
+    latest_before = received.groupby(series[by_arrival]).shift(1).to_numpy(dtype=np.float64, na_value=np.nan)
+    mask[by_arrival[stamps[by_arrival] < latest_before]] |= OUT_OF_ORDER
+
+    if 'is_valid' in frame:
+        mask[~frame['is_valid'].to_numpy(dtype=bool)] |= REPORTED_INVALID
+
+    # Everything below works on rows sorted by series, then time
+    order = np.lexsort((stamps, series))
+    series, stamps = series[order], stamps[order]
+    same = np.zeros(count, dtype=bool)
+    same[1:] = series[1:] == series[:-1]
+    next_same = np.zeros(count, dtype=bool)
+    next_same[:-1] = same[1:]
+    sorted_mask = np.zeros(count, dtype=np.uint16)
+
+    def column(name):
+        return frame[name].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name, (low, high) in ranges.items():
+            if name not in frame:
+                continue
+            values = column(name)
+            bad = np.zeros(count, dtype=bool)
+            if low is not None:
+                bad |= values < low
+            if high is not None:
+                bad |= values > high
+            sorted_mask[bad] |= OUT_OF_RANGE
+
+        for name, threshold in JUMP_THRESHOLDS.items():
+            if name not in frame:
+                continue
+            values = column(name)
+            before = np.full(count, np.nan)
+            before[1:] = np.where(same[1:], values[1:] - values[:-1], np.nan)
+            after = np.full(count, np.nan)
+            after[:-1] = np.where(next_same[:-1], values[1:] - values[:-1], np.nan)
+            # Neighbours on either side agree with each other but not with this reading
+            bridge = np.full(count, np.nan)
+            bridge[1:-1] = np.where(same[1:-1] & next_same[1:-1], values[2:] - values[:-2], np.nan)
+            spike = (np.abs(before) > threshold) & (np.abs(after) > threshold) & \
+                (np.sign(before) != np.sign(after)) & (np.abs(bridge) < threshold / 2)
+            sorted_mask[spike] |= SPIKE
+            # A jump into a spike is the spike itself; the reading after it is the way back
+            after_spike = np.zeros(count, dtype=bool)
+            after_spike[1:] = spike[:-1] & same[1:]
+            step = (np.abs(before) > threshold) & ~spike & ~after_spike
+            sorted_mask[step] |= STEP
+
+        for name in STUCK_FIELDS:
+            if name not in frame:
+                continue
+            values = column(name)
+            repeat = np.zeros(count, dtype=bool)
+            repeat[1:] = same[1:] & (values[1:] == values[:-1])
+            runs = np.cumsum(~repeat)
+            lengths = np.bincount(runs)[runs]
+            # A full or empty tank legitimately sits at the end of its range
+            low, high = ranges.get(name, (None, None))
+            pinned = np.isin(values, [bound for bound in (low, high) if bound is not None])
+            sorted_mask[(lengths >= STUCK_RUN) & ~np.isnan(values) & ~pinned] |= STUCK
+
+        if 'water_level_inches' in frame and 'water_level_percentage' in frame:
+            percentage = column('water_level_percentage')
+            height = column('water_level_inches') * 100 / np.where(
+                percentage >= MIN_LEVEL_FOR_HEIGHT, percentage, np.nan
+            )
+            median = pd.Series(height).groupby(series).transform('median').to_numpy()
+            sorted_mask[np.abs(height / median - 1) > HEIGHT_TOLERANCE] |= LEVEL_MISMATCH
+
+        if 'flow_rate_gpm' in frame and 'capacity_gallons' in frame:
+            sorted_mask[column('flow_rate_gpm') * 60 > column('capacity_gallons')] |= FLOW_MISMATCH
+
+    mask[order] |= sorted_mask
+    return mask
+
+
+def annotate(readings, capacities, previous=()):
+    """Set ``is_valid`` and ``quality_flags`` on SensorData value dicts in place.
+
+    ``capacities`` maps tank ids to ``capacity_gallons``. ``previous`` are
+    already stored readings (objects with SensorData attributes) that the
+    new ones are checked against without being annotated themselves.
+    """
+    if not readings:
+        return
+    fields = list(field_ranges())
+    columns = ['tank_id', 'sensor_id', 'timestamp', *fields]
+    rows = [[getattr(reading, column) for column in columns] for reading in previous]
+    context = len(rows)
+    rows.extend([values.get(column) for column in columns] for values in readings)
+
+    frame = pd.DataFrame(rows, columns=columns).astype({field: 'float64' for field in fields})
+    frame['arrival'] = np.arange(len(frame))
+    frame['capacity_gallons'] = frame['tank_id'].map(capacities).astype('float64')
+    frame['is_valid'] = [True] * context + [values.get('is_valid', True) for values in readings]
+
+    for values, mask in zip(readings, quality_mask(frame)[context:]):
+        values['quality_flags'] = flags_with_mask(values.get('quality_flags'), mask)
+        values['is_valid'] = not mask & INVALID_MASK
+
+
+def flags_with_mask(flags, mask):
+    """``quality_flags`` with its ``qc`` entry set to ``mask`` (dropped when zero)"""
+    flags = {key: value for key, value in (flags or {}).items() if key != QC_KEY}
+    if mask:
+        flags[QC_KEY] = int(mask)
+    return flags
+
+
+def stored_mask(flags):
+    """The ``qc`` mask of stored ``quality_flags``"""
+    return int((flags or {}).get(QC_KEY, 0))
+
+
+def describe(mask):
+    """Names of the checks set in ``mask``"""
+    return [name for bit, name in FLAG_NAMES.items() if mask & bit]
+
+
+def _decode_flags(flags):
+    if isinstance(flags, str):
+        return {} if flags == '{}' else json.loads(flags)
+    return flags or {}
+
+
+def _decode_column(values):
+    """Decode a column of stored flags, parsing each distinct JSON string once (equal ones share a dict)"""
+    parsed = {}
+    decoded = []
+    for flags in values:
+        if isinstance(flags, str):
+            if flags not in parsed:
+                parsed[flags] = _decode_flags(flags)
+            decoded.append(parsed[flags])
+        else:
+            decoded.append(_decode_flags(flags))
+    return decoded
+
+
+def _stored_frame(tank_id, start, end):
+    """Stored readings of one tank in ``[start, end)`` with their current flags.
+
+    Rows are fetched with a plain cursor and converted column-wise;
+    per-row model field converters would dominate a backfill.
+    """
+    fields = list(field_ranges())
+    columns = ['id', 'tank_id', 'sensor_id', 'timestamp', 'created_at', 'is_valid', 'quality_flags', *fields]
+    queryset = SensorData.objects.filter(
+        tank_id=tank_id, timestamp__gte=start, timestamp__lt=end,
+    ).values_list(*columns)
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    frame = pd.DataFrame(rows, columns=columns)
+
+    frame = frame.astype({field: 'float64' for field in fields})
+    # Raw timestamps go straight back into the WHERE clause of the updates
+    frame['raw_timestamp'] = pd.Series([row[3] for row in rows], dtype=object)
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], utc=True, format='ISO8601')
+    frame['arrival'] = pd.to_datetime(frame['created_at'], utc=True, format='ISO8601').astype('int64')
+    frame['is_valid'] = frame['is_valid'].astype(bool)
+    frame['quality_flags'] = _decode_column(frame['quality_flags'])
+    frame['stored_mask'] = np.array([stored_mask(flags) for flags in frame['quality_flags']], dtype=np.uint16)
+    # Rows written before validation existed carry the gateway's verdict in is_valid alone
+    checked = np.array([QC_KEY in flags for flags in frame['quality_flags']], dtype=bool)
+    reported = (frame['stored_mask'].to_numpy() & REPORTED_INVALID).astype(bool)
+    frame['reported_valid'] = ~(reported | (~checked & ~frame['is_valid'].to_numpy()))
+    return frame
+
+
+def revalidate(tank_ids=None, start=None, end=None, batch_size=1000):
+    """Re-run the checks over stored readings, returning ``(checked, changed)`` counts.
+
+    Each window is loaded with REVALIDATE_MARGIN of neighbours on both
+    sides, so spikes and stuck runs at its edges are judged in context.
+    Only rows whose mask or ``is_valid`` changed are written, ``batch_size``
+    rows per executemany and transaction. Archived months are immutable and
+    keep the flags they were archived with.
+    """
+    tanks = WaterTank.objects.all()
+    if tank_ids is not None:
+        tanks = tanks.filter(id__in=tank_ids)
+
+    checked = changed = 0
+    changed_tanks = []
+    for tank_id, capacity in tanks.values_list('id', 'capacity_gallons'):
+        readings = SensorData.objects.filter(tank_id=tank_id)
+        if start is not None:
+            readings = readings.filter(timestamp__gte=start)
+        if end is not None:
+            readings = readings.filter(timestamp__lt=end)
+        bounds = readings.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+        if bounds['first'] is None:
+            continue
+
+        window_start = bounds['first']
+        while window_start <= bounds['last']:
+            window_end = min(window_start + REVALIDATE_WINDOW, bounds['last'] + timedelta(microseconds=1))
+            frame = _stored_frame(tank_id, window_start - REVALIDATE_MARGIN, window_end + REVALIDATE_MARGIN)
+            frame['capacity_gallons'] = float(capacity)
+            mask = quality_mask(frame.drop(columns='is_valid').rename(columns={'reported_valid': 'is_valid'}))
+            valid = (mask & INVALID_MASK) == 0
+
+            inside = ((frame['timestamp'] >= window_start) & (frame['timestamp'] < window_end)).to_numpy()
+            stale = np.flatnonzero(
+                inside & ((mask != frame['stored_mask'].to_numpy()) | (valid != frame['is_valid'].to_numpy()))
+            )
+            for offset in range(0, len(stale), batch_size):
+                _write_flags(frame, stale[offset:offset + batch_size], valid, mask)
+
+            checked += int(inside.sum())
+            changed += len(stale)
+            if len(stale):
+                changed_tanks.append(tank_id)
+            window_start = window_end
+
+    # The latest state copies is_valid from the newest reading
+    if changed_tanks:
+        state.refresh(changed_tanks)
+    return checked, changed
+
+
+def _write_flags(frame, rows, valid, mask):
+    """Store new ``is_valid`` and ``quality_flags`` for ``rows`` of a stored frame in one executemany"""
+    connection = connections[SensorData.objects.db]
+    qn = connection.ops.quote_name
+    flags_field = SensorData._meta.get_field('quality_flags')
+    # Most rows carry nothing but the mask, so their JSON is prepared once per mask
+    prepared = {}
+    params = []
+    for row_valid, row_flags, row_mask, reading_id, timestamp in zip(
+        valid[rows].tolist(), frame['quality_flags'].to_numpy()[rows], mask[rows].tolist(),
+        frame['id'].to_numpy()[rows].tolist(), frame['raw_timestamp'].to_numpy()[rows],
+    ):
+        if not row_flags or row_flags.keys() == {QC_KEY}:
+            value = prepared.get(row_mask)
+            if value is None:
+                value = prepared[row_mask] = flags_field.get_db_prep_save(flags_with_mask({}, row_mask), connection)
+        else:
+            value = flags_field.get_db_prep_save(flags_with_mask(row_flags, row_mask), connection)
+        params.append((row_valid, value, reading_id, timestamp))
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {qn(SensorData._meta.db_table)} SET {qn("is_valid")} = %s, {qn("quality_flags")} = %s '
+            f'WHERE {qn("id")} = %s AND {qn("timestamp")} = %s',
+            params,
+        )
@@ -1,3 +1,88 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import alerting, calibration, dedup, recent
+from .ingest import PayloadError, ingest_readings, parse_payload, summarize
+from .models import CalibrationRun
+from .spool import SpoolReader
+
+
+def _has_valid_token(request):
+    """Check the ``Authorization: Token <key>`` header against INGEST_API_TOKENS"""
+    scheme, _, key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() not in ('token', 'bearer') or not key:
+        return False
+    return any(hmac.compare_digest(key.strip(), token) for token in settings.INGEST_API_TOKENS if token)
+
+
+def _csrf_failure(request):
+    """Run the CSRF check for session-authenticated callers of a csrf_exempt view"""
+    check = CsrfViewMiddleware(lambda req: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+def authenticate_gateway(request):
+    """Return an error response unless the caller may submit readings"""
+    if _has_valid_token(request):
+        return None
+    if request.user.is_authenticated:
+        if not request.user.has_perm('tanks.add_sensordata'):
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+        return _csrf_failure(request)
+    return JsonResponse({'error': 'Authentication required'}, status=401)
+
+
+@csrf_exempt
+@require_POST
+def ingest_readings_api(request):
+    """Batch endpoint for gateways to submit readings as a JSON array or NDJSON"""
+    error = authenticate_gateway(request)
+    if error is not None:
+        return error
+
+    try:
+        rows = parse_payload(request.body, request.content_type)
+    except PayloadError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    if len(rows) > settings.SENSOR_INGEST_MAX_ROWS:
+        return JsonResponse(
+            {'error': f'At most {settings.SENSOR_INGEST_MAX_ROWS} readings per request'},
+            status=413
+        )
+
+    results = ingest_readings(rows)
+    return JsonResponse(summarize(results))
+
+
+@staff_member_required
+def ingest_status_api(request):
+    """Operational view of the ingest path for staff"""
+    return JsonResponse({
+        'spool': SpoolReader(settings.SENSOR_SPOOL_DIR, create=False).stats(),
+        # Per worker process
+        'dedup': dedup.get_cache().stats(),
+        # Shared by the processes on this host
+        'recent_cache': recent.stats(),
+        # Per worker process
+        'alerts': alerting.get_engine().stats(),
+        'calibration_runs': [
+            {
+                'id': str(run.pk),
+                'sensor': str(run.sensor_id),
+                'status': run.status,
+                'rows_done': run.rows_done,
+                'rows_total': run.rows_total,
+                'rows_changed': run.rows_changed,
+                'progress': round(run.progress_percentage, 1),
+            }
+            for run in CalibrationRun.objects.filter(status__in=calibration.ACTIVE).order_by('created_at')
+        ],
+    })